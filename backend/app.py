@@ -1,16 +1,24 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, copy_current_request_context, g, has_app_context, Response
 from flask_cors import CORS
 import os
 import json
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 import requests
 import urllib3
 from functools import wraps
 from dotenv import load_dotenv
 import logging
 import threading
-from optimization import OptimizedAPIClient, time_execution
+from optimization import OptimizedAPIClient, TimeWindow, time_execution
+from cache_store import CacheStore, SQLiteSharedCache, CacheSnapshot, mz_tag, resource_tag
+from scheduler import RefreshScheduler, LeaderElection
+from metrics import metrics
+from problem_store import ProblemSyncEngine, relative_time_ms, problem_mzs
+import tempfile
+import atexit
+import gzip
+import hashlib
 import traceback
 
 # Configuration du logging
@@ -30,12 +38,73 @@ API_TOKEN = os.environ.get('API_TOKEN')
 CACHE_DURATION = int(os.environ.get('CACHE_DURATION', 300))
 # Durée du cache pour les problèmes (plus courte)
 PROBLEMS_CACHE_DURATION = int(os.environ.get('PROBLEMS_CACHE_DURATION', 60))
+# Durée pendant laquelle une réponse périmée reste servie pendant son rafraîchissement en arrière-plan
+CACHE_STALE_TTL = int(os.environ.get('CACHE_STALE_TTL', 3600))
 MAX_WORKERS = int(os.environ.get('MAX_WORKERS', 20))
 MAX_CONNECTIONS = int(os.environ.get('MAX_CONNECTIONS', 50))
+# Budget mémoire du cache par worker (Mo); au-delà, les entrées les moins récemment utilisées sont évincées
+CACHE_MAX_MB = int(os.environ.get('CACHE_MAX_MB', 512))
+# Budget mémoire (Mo) des réponses déjà sérialisées (JSON encodé, variante gzip et ETag) par worker
+RESPONSE_CACHE_MAX_MB = int(os.environ.get('RESPONSE_CACHE_MAX_MB', 128))
+# Taille minimale (octets) d'une réponse pour en conserver une variante compressée en gzip (0 pour désactiver)
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get('RESPONSE_GZIP_MIN_BYTES', 1024))
+# Fichier du cache partagé entre les workers gunicorn du nœud (vide pour désactiver)
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'dynatrace_dashboard_cache.sqlite'))
+# Instantané sur disque des entrées longues (services, process groups...) pour redémarrer à chaud (vide pour désactiver)
+# Chaque worker écrit son propre fichier, suffixé par son PID
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'dynatrace_dashboard_cache.snapshot'))
+CACHE_SNAPSHOT_INTERVAL = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL', 300))
+# Durée de vie minimale (secondes) d'une entrée pour figurer dans l'instantané
+CACHE_SNAPSHOT_MIN_DURATION = int(os.environ.get('CACHE_SNAPSHOT_MIN_DURATION', 3600))
+# Débit initial autorisé par Dynatrace (requêtes/minute); ensuite appris des en-têtes X-RateLimit-*
+DT_RATE_LIMIT_PER_MINUTE = int(os.environ.get('DT_RATE_LIMIT_PER_MINUTE', 0)) or None
+# Préchargement périodique des dashboards de toutes les MZ configurées
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'True').lower() in ('true', '1', 't')
+SCHEDULER_INTERVAL_MINUTES = int(os.environ.get('SCHEDULER_INTERVAL_MINUTES', 5))
+# Gigue maximale (secondes) ajoutée à chaque rafraîchissement pour éviter qu'ils partent tous ensemble
+SCHEDULER_JITTER_SECONDS = int(os.environ.get('SCHEDULER_JITTER_SECONDS', 30))
+# Fichier de bail partagé par les workers du nœud: un seul worker (le leader) exécute les rafraîchissements
+# et publie les résultats dans le cache partagé (vide pour désactiver l'élection)
+SCHEDULER_LOCK_PATH = os.environ.get('SCHEDULER_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'dynatrace_dashboard_scheduler.lock'))
+SCHEDULER_HEARTBEAT_SECONDS = int(os.environ.get('SCHEDULER_HEARTBEAT_SECONDS', 10))
+# Synchronisation incrémentale des problèmes: fenêtre chargée une fois, puis interrogée depuis le dernier curseur
+PROBLEM_SYNC_ENABLED = os.environ.get('PROBLEM_SYNC_ENABLED', 'True').lower() in ('true', '1', 't')
+PROBLEM_SYNC_WINDOW = os.environ.get('PROBLEM_SYNC_WINDOW', '-60d')
+# Âge maximal (secondes) du magasin de problèmes avant un nouveau passage
+PROBLEM_SYNC_INTERVAL = int(os.environ.get('PROBLEM_SYNC_INTERVAL', 15))
+# Intervalle (secondes) entre deux rechargements complets de la fenêtre
+PROBLEM_SYNC_FULL_INTERVAL = int(os.environ.get('PROBLEM_SYNC_FULL_INTERVAL', 3600))
+# Délai (secondes) sans publication du leader avant qu'un autre worker synchronise lui-même les problèmes
+# (doit couvrir le premier chargement complet de la fenêtre par le leader)
+PROBLEM_SYNC_LEADER_GRACE = int(os.environ.get('PROBLEM_SYNC_LEADER_GRACE', 120))
+# Intervalles par ressource (secondes), SCHEDULER_INTERVAL_MINUTES par défaut
+SCHEDULER_INTERVALS = {
+    'problems': int(os.environ.get('SCHEDULER_PROBLEMS_INTERVAL', min(SCHEDULER_INTERVAL_MINUTES * 60, 120))),
+    'summary': int(os.environ.get('SCHEDULER_SUMMARY_INTERVAL', SCHEDULER_INTERVAL_MINUTES * 60)),
+    'hosts': int(os.environ.get('SCHEDULER_HOSTS_INTERVAL', SCHEDULER_INTERVAL_MINUTES * 60)),
+    'services': int(os.environ.get('SCHEDULER_SERVICES_INTERVAL', SCHEDULER_INTERVAL_MINUTES * 60)),
+    'counts': int(os.environ.get('SCHEDULER_COUNTS_INTERVAL', SCHEDULER_INTERVAL_MINUTES * 60 * 3))
+}
 
 # Créer l'application Flask
 app = Flask(__name__)
-CORS(app)  # Activer CORS pour toutes les routes
+# Activer CORS pour toutes les routes, en exposant les en-têtes de fraîcheur des données au frontend
+CORS(app, expose_headers=['X-Cache-Status', 'X-Data-Age', 'X-Data-Timestamp', 'ETag'])
+
+# Initialiser le cache partagé entre workers, si configuré
+shared_cache = None
+if SHARED_CACHE_PATH:
+    try:
+        shared_cache = SQLiteSharedCache(SHARED_CACHE_PATH, default_duration=CACHE_DURATION)
+        logger.info(f"Cache partagé entre workers: {SHARED_CACHE_PATH}")
+    except Exception as e:
+        logger.error(f"Cache partagé désactivé ({SHARED_CACHE_PATH}): {e}")
+
+# Instantané sur disque, relu à la demande après un redémarrage
+cache_snapshot = None
+if CACHE_SNAPSHOT_PATH:
+    cache_snapshot = CacheSnapshot(CACHE_SNAPSHOT_PATH, min_duration=CACHE_SNAPSHOT_MIN_DURATION,
+                                   interval=CACHE_SNAPSHOT_INTERVAL)
 
 # Initialiser le client API optimisé
 api_client = OptimizedAPIClient(
@@ -44,111 +113,72 @@ api_client = OptimizedAPIClient(
     verify_ssl=os.environ.get('VERIFY_SSL', 'False').lower() in ('true', '1', 't'),
     max_workers=MAX_WORKERS,
     max_connections=MAX_CONNECTIONS,
-    cache_duration=CACHE_DURATION
+    cache_duration=CACHE_DURATION,
+    rate_limit_per_minute=DT_RATE_LIMIT_PER_MINUTE,
+    cache_max_bytes=CACHE_MAX_MB * 1024 * 1024,
+    shared_cache=shared_cache,
+    snapshot=cache_snapshot
 )
 
-# Fonction pour construire les sélecteurs d'entités avec filtrage par MZ
-def build_entity_selector(entity_type, mz_name):
-    """
-    Construit un sélecteur d'entité avec filtrage par type et management zone
-    """
-    return f"type({entity_type}),mzName(\"{mz_name}\")"
+# Variable d'environnement contenant la liste des MZs de chaque type de dashboard
+DASHBOARD_MZ_LISTS = {
+    'vfg': 'VFG_MZ_LIST',
+    'vfe': 'VFE_MZ_LIST',
+    'vfp': 'VFP_MZ_LIST',
+    'vfa': 'VFA_MZ_LIST',
+    'detection': 'DETECTION_CTL_MZ_LIST',
+    'security': 'SECURITY_ENCRYPTION_MZ_LIST',
+    'fce-security': 'FCE_SECURITY_MZ_LIST',
+    'network-filtering': 'NETWORK_FILTERING_MZ_LIST',
+    'identity': 'IDENTITY_MZ_LIST'
+}
 
-# Fonction pour obtenir la liste des MZs Vital for Group
-def get_vital_for_group_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    vfg_mz_string = os.environ.get('VFG_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not vfg_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in vfg_mz_string.split(',')]
+# Fonction pour obtenir la liste des MZs d'un type de dashboard
+def get_dashboard_mzs(dashboard_type):
+    mz_string = os.environ.get(DASHBOARD_MZ_LISTS.get(dashboard_type, 'VFG_MZ_LIST'), '')
+    return [mz.strip() for mz in mz_string.split(',') if mz.strip()]
 
-# Fonction pour obtenir la liste des MZs Vital for Production
-def get_vital_for_production_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    vfp_mz_string = os.environ.get('VFP_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not vfp_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in vfp_mz_string.split(',')]
+# Fonction pour obtenir toutes les MZs configurées, sans doublon, dans l'ordre des listes
+def get_all_dashboard_mzs():
+    all_mzs = []
+    for dashboard_type in DASHBOARD_MZ_LISTS:
+        for mz_name in get_dashboard_mzs(dashboard_type):
+            if mz_name not in all_mzs:
+                all_mzs.append(mz_name)
+    return all_mzs
 
-# Fonction pour obtenir la liste des MZs Vital for Analytics
-def get_vital_for_analytics_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    vfa_mz_string = os.environ.get('VFA_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not vfa_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in vfa_mz_string.split(',')]
+# Magasin de problèmes synchronisé pour toutes les MZ configurées (et celles demandées en plus)
+problem_sync = None
+if PROBLEM_SYNC_ENABLED:
+    # Les workers non leaders reprennent l'état publié par le leader au lieu de synchroniser
+    # pendant les requêtes (leader_election est créée en fin de module)
+    problem_sync = ProblemSyncEngine(api_client, get_all_dashboard_mzs, window=PROBLEM_SYNC_WINDOW,
+                                     poll_interval=PROBLEM_SYNC_INTERVAL, full_sync_interval=PROBLEM_SYNC_FULL_INTERVAL,
+                                     leader_active=lambda: leader_election is not None and leader_election.has_live_leader(),
+                                     leader_grace=PROBLEM_SYNC_LEADER_GRACE)
 
-# Fonction pour obtenir la liste des MZs Detection & CTL
-def get_detection_ctl_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    detection_ctl_mz_string = os.environ.get('DETECTION_CTL_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not detection_ctl_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in detection_ctl_mz_string.split(',')]
-
-# Fonction pour obtenir la liste des MZs Security & Encryption
-def get_security_encryption_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    security_encryption_mz_string = os.environ.get('SECURITY_ENCRYPTION_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not security_encryption_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in security_encryption_mz_string.split(',')]
-
-# Fonction pour obtenir la liste des MZs FCE Security
-def get_fce_security_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    fce_security_mz_string = os.environ.get('FCE_SECURITY_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not fce_security_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in fce_security_mz_string.split(',')]
-
-# Fonction pour obtenir la liste des MZs Network Filtering
-def get_network_filtering_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    network_filtering_mz_string = os.environ.get('NETWORK_FILTERING_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not network_filtering_mz_string:
-        return []
-    
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in network_filtering_mz_string.split(',')]
-
-# Fonction pour obtenir la liste des MZs Identity
-def get_identity_mzs():
-    # Récupérer la liste depuis la variable d'environnement
-    identity_mz_string = os.environ.get('IDENTITY_MZ_LIST', '')
-    
-    # Si la variable n'est pas définie, retourner une liste vide
-    if not identity_mz_string:
-        return []
+def format_store_problems(problems, mz_list, zone=None):
+    """
+    Formate des problèmes du magasin pour un dashboard
+    Chaque problème est attribué à la première MZ de la liste qui le concerne (matching_mz),
+    sans modifier le problème stocké.
     
-    # Diviser la chaîne en liste de MZs
-    return [mz.strip() for mz in identity_mz_string.split(',')]
+    Args:
+        problems (list): Problèmes bruts du magasin
+        mz_list (list): MZ du dashboard, dans l'ordre de priorité d'affichage
+        zone (str, optional): Zone transmise au formatage
+        
+    Returns:
+        list: Problèmes formatés
+    """
+    formatted_problems = []
+    for problem in problems:
+        mzs = problem_mzs(problem)
+        matching_mz = next((mz_name for mz_name in mz_list if mz_name in mzs), None)
+        if matching_mz:
+            problem = dict(problem, matching_mz=matching_mz)
+        formatted_problems.append(api_client._format_problem(problem, zone))
+    return formatted_problems
 
 # Endpoint pour obtenir les Management Zones de Vital for Entreprise
 @app.route('/api/vital-for-entreprise-mzs', methods=['GET'])
@@ -441,6 +471,10 @@ def get_identity_mzs_endpoint():
 
 # Fonction pour récupérer la Management Zone actuelle
 def get_current_mz():
+    # MZ imposée pour la requête en cours (rafraîchissements planifiés)
+    if has_app_context() and g.get('mz_override'):
+        return g.mz_override
+    
     # Récupérer la MZ depuis le fichier
     config_file = 'mz_config.json'
     if os.path.exists(config_file):
@@ -456,8 +490,137 @@ def get_current_mz():
     # Si pas dans le fichier, utiliser la variable d'environnement
     return os.environ.get('MZ_NAME', '')
 
+# Clés de cache en cours de rafraîchissement en arrière-plan (un seul rafraîchissement par clé)
+refreshing_keys = set()
+refreshing_lock = threading.Lock()
+
+def with_freshness(response, status, age=0, timestamp=None):
+    """Ajoute les en-têtes de fraîcheur (statut de cache, âge des données) à une réponse"""
+    response.headers['X-Cache-Status'] = status
+    response.headers['X-Data-Age'] = str(int(age))
+    response.headers['X-Data-Timestamp'] = str(int((timestamp if timestamp is not None else time.time()) * 1000))
+    return response
+
+# Instrumentation des routes: latence par route et statut, requêtes en cours
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.time()
+    metrics.gauge_add('http_requests_in_flight', 1)
+
+@app.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc=None):
+    start_time = g.pop('metrics_start', None)
+    if start_time is None:
+        # Contexte de requête sans dispatch (rafraîchissements planifiés)
+        return
+    metrics.gauge_add('http_requests_in_flight', -1)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.pop('metrics_status', 500)
+    metrics.inc('http_requests_total', route=route, method=request.method, status=status)
+    metrics.observe('http_request_duration_seconds', time.time() - start_time, route=route, method=request.method)
+
+# Réponses déjà sérialisées des routes en cache, indexées par clé de cache et valables tant que
+# l'entrée de données correspondante n'a pas été remplacée (même horodatage)
+response_cache = CacheStore(max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024,
+                            default_duration=CACHE_DURATION + CACHE_STALE_TTL, name='response')
+
+def serialize_response(cache_key, data, timestamp):
+    """
+    Retourne la forme encodée d'une donnée en cache, en ne la sérialisant qu'une fois par version
+
+    Args:
+        cache_key (str): Clé de cache de la donnée
+        data: Donnée à sérialiser
+        timestamp (float): Horodatage de l'entrée de données (identifie sa version)
+
+    Returns:
+        dict: Corps JSON encodé ('body'), variante gzip éventuelle ('gzip') et empreinte ('etag')
+    """
+    item = response_cache.get(cache_key)
+    if item is not None and item['data']['timestamp'] == timestamp:
+        return item['data']
+    
+    body = app.json.dumps(data).encode('utf-8')
+    encoded = {
+        'timestamp': timestamp,
+        'body': body,
+        'gzip': gzip.compress(body, 6) if RESPONSE_GZIP_MIN_BYTES and len(body) >= RESPONSE_GZIP_MIN_BYTES else None,
+        # Empreinte du contenu: identique d'un worker à l'autre et d'un rafraîchissement inchangé au suivant
+        'etag': hashlib.sha1(body).hexdigest()
+    }
+    size = len(body) + len(encoded['gzip'] or b'')
+    response_cache[cache_key] = {'data': encoded, 'timestamp': time.time(), 'size': size}
+    return encoded
+
+def encoded_response(encoded):
+    """
+    Construit la réponse HTTP à partir d'une forme encodée, sans re-sérialiser les données
+    Répond 304 si le client possède déjà cette version (If-None-Match) et sert la variante
+    gzip si le client l'accepte.
+
+    Args:
+        encoded (dict): Forme encodée retournée par serialize_response
+
+    Returns:
+        Response: Réponse Flask
+    """
+    if request.if_none_match.contains(encoded['etag']):
+        response = Response(status=304)
+    elif encoded['gzip'] is not None and request.accept_encodings['gzip']:
+        response = Response(encoded['gzip'], mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(encoded['body'], mimetype='application/json')
+    if encoded['gzip'] is not None:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(encoded['etag'])
+    # Le navigateur revalide à chaque fois: une donnée inchangée ne retransite pas
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def is_error_result(result):
+    """Indique si une route a retourné une erreur ({'error': ...}), qui ne doit jamais être mise en cache"""
+    return isinstance(result, dict) and 'error' in result
+
+def refresh_entry(cache_key, f, args, kwargs, stale_ttl, tags=None):
+    """Recalcule une entrée de cache; une erreur ne remplace jamais une donnée valide"""
+    result = f(*args, **kwargs)
+    if is_error_result(result):
+        logger.warning(f"Rafraîchissement de {cache_key} en erreur, conservation des données en cache: {result['error']}")
+        return False
+    api_client.set_cache(cache_key, result, stale_ttl=stale_ttl, tags=tags, shared=True)
+    return True
+
+def schedule_refresh(cache_key, f, args, kwargs, stale_ttl, tags=None):
+    """Recalcule une entrée périmée dans un thread dédié, au plus une fois à la fois par clé"""
+    with refreshing_lock:
+        if cache_key in refreshing_keys:
+            return
+        refreshing_keys.add(cache_key)
+    
+    @copy_current_request_context
+    def refresh():
+        try:
+            if refresh_entry(cache_key, f, args, kwargs, stale_ttl, tags):
+                logger.info(f"Rafraîchissement en arrière-plan terminé pour {cache_key}")
+        except Exception as e:
+            logger.error(f"Erreur lors du rafraîchissement en arrière-plan de {cache_key}: {e}")
+        finally:
+            with refreshing_lock:
+                refreshing_keys.discard(cache_key)
+    
+    # Thread dédié: la fonction utilise elle-même l'exécuteur partagé du client
+    threading.Thread(target=refresh, name=f"refresh-{cache_key}", daemon=True).start()
+
 # Décorateur pour la mise en cache (version optimisée)
-def cached(cache_key_prefix):
+# Entre le TTL souple (CACHE_DURATION) et le TTL dur (+ stale_ttl), la réponse périmée est servie
+# immédiatement et un seul rafraîchissement est lancé en arrière-plan (stale-while-revalidate)
+def cached(cache_key_prefix, stale_ttl=CACHE_STALE_TTL):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -465,24 +628,47 @@ def cached(cache_key_prefix):
             result = None
             
             try:
-                # Récupérer la clé de cache complète
-                cache_key = f"{cache_key_prefix}:{get_current_mz()}"
+                # Récupérer la clé de cache complète, étiquetée par la MZ pour l'invalidation
+                current_mz = get_current_mz()
+                cache_key = f"{cache_key_prefix}:{current_mz}"
+                tags = [mz_tag(current_mz)]
                 
-                # Vérifier si les données sont en cache
-                cached_data = api_client.get_cached(cache_key)
-                if cached_data is not None:
-                    return jsonify(cached_data)
+                # Vérifier si les données sont en cache (fraîches ou encore servables)
+                entry = api_client.get_cached_entry(cache_key)
+                if entry is not None:
+                    if entry['stale']:
+                        schedule_refresh(cache_key, f, args, kwargs, stale_ttl, tags)
+                    encoded = serialize_response(cache_key, entry['data'], entry['timestamp'])
+                    return with_freshness(encoded_response(encoded), 'stale' if entry['stale'] else 'fresh',
+                                          entry['age'], entry['timestamp'])
                 
                 # Si non, exécuter la fonction et mettre en cache
                 result = f(*args, **kwargs)
-                api_client.set_cache(cache_key, result)
+                # Une erreur est retournée sans être mise en cache: l'appel suivant réessaie
+                if is_error_result(result):
+                    logger.warning(f"Résultat en erreur pour {cache_key}, non mis en cache: {result['error']}")
+                    return with_freshness(jsonify(result), 'miss')
+                api_client.set_cache(cache_key, result, stale_ttl=stale_ttl, tags=tags, shared=True)
+                
+                # Sérialiser une seule fois, pour cette réponse comme pour les suivantes
+                entry = api_client.get_cached_entry(cache_key)
+                if entry is not None:
+                    return with_freshness(encoded_response(serialize_response(cache_key, entry['data'], entry['timestamp'])),
+                                          'miss', 0, entry['timestamp'])
             except Exception as e:
                 logger.error(f"Erreur dans le décorateur cached: {e}")
                 # Récupérer le résultat malgré tout
                 if result is None:
                     result = f(*args, **kwargs)
             
-            return jsonify(result)
+            return with_freshness(jsonify(result), 'miss')
+        
+        def refresh(*args, **kwargs):
+            """Recalcule et met en cache le résultat pour la MZ courante, sans passer par le cache"""
+            current_mz = get_current_mz()
+            return refresh_entry(f"{cache_key_prefix}:{current_mz}", f, args, kwargs, stale_ttl, [mz_tag(current_mz)])
+        
+        decorated_function.refresh = refresh
         return decorated_function
     return decorator
 
@@ -503,12 +689,9 @@ def set_management_zone():
         with open(config_file, 'w') as f:
             json.dump(config, f)
         
-        # Réinitialiser tous les caches de type entités
-        api_client.clear_cache('services:')
-        api_client.clear_cache('hosts:')
-        api_client.clear_cache('process_groups:')
-        api_client.clear_cache('problems:')
-        api_client.clear_cache('summary:')
+        # Réinitialiser tous les caches de type entités (via l'index des étiquettes, sans parcourir le cache)
+        api_client.invalidate_tags(*[resource_tag(resource) for resource in
+                                     ('services', 'hosts', 'process_groups', 'problems', 'summary')])
         
         return jsonify({
             'success': True, 
@@ -533,16 +716,41 @@ def get_problems_72h():
         zone_filter = request.args.get('zone', '')  # Pour filtrer par une zone spécifique
         timeframe = request.args.get('timeframe', 'now-72h')  # Période (72h par défaut)
         debug_mode = request.args.get('debug', 'false').lower() == 'true'
+        # Recalcul demandé (rafraîchissement planifié): ignorer le cache sans le vider
+        refresh_cache = request.args.get('refresh', 'false').lower() == 'true'
 
         # Créer une clé de cache unique pour cette requête qui inclut la période
         specific_cache_key = f"problems-72h:{dashboard_type}:{zone_filter}:{timeframe}"
+        # Étiqueter l'entrée avec les MZs dont elle dépend
+        if zone_filter:
+            problem_tags = [mz_tag(zone_filter)]
+        elif dashboard_type in DASHBOARD_MZ_LISTS:
+            problem_tags = [mz_tag(mz_name) for mz_name in get_dashboard_mzs(dashboard_type)]
+        else:
+            problem_tags = [mz_tag(get_current_mz())]
+
+        # Lecture depuis le magasin de problèmes synchronisé, si la période est couverte
+        if problem_sync is not None and not debug_mode and problem_sync.covers(timeframe):
+            if zone_filter:
+                mz_list = [zone_filter]
+            elif dashboard_type in DASHBOARD_MZ_LISTS:
+                mz_list = get_dashboard_mzs(dashboard_type)
+            else:
+                mz_list = [get_current_mz()]
+            if all(mz_list):
+                problems = problem_sync.problems(mz_list, active_from=relative_time_ms(timeframe),
+                                                 impact=request.args.get('impact'), host=request.args.get('host'))
+                if problems is not None:
+                    logger.info(f"Problèmes {timeframe} servis depuis le magasin pour {len(mz_list)} MZ: {len(problems)} problèmes")
+                    return jsonify(format_store_problems(problems, mz_list, zone_filter))
+                # Magasin pas encore chargé pour ces MZ: récupération directe
+                logger.info(f"Magasin de problèmes en cours de chargement, récupération directe pour {len(mz_list)} MZ")
 
         # En mode debug, toujours vider le cache
         if debug_mode:
-            if specific_cache_key in api_client.cache:
-                api_client.cache.pop(specific_cache_key, None)
+            api_client.delete_cached(specific_cache_key)
         # Sinon, vérifier le cache
-        else:
+        elif not refresh_cache:
             cached_data = api_client.get_cached(specific_cache_key)
             if cached_data is not None:
                 return jsonify(cached_data)
@@ -554,10 +762,10 @@ def get_problems_72h():
             logger.info("TENTATIVE ALTERNATIVE: Utilisation directe de la fonction test_get_problems qui fonctionne")
             
             # Si c'est un type de dashboard spécifique, récupérer les problèmes pour toutes les zones
-            if dashboard_type in ['vfg', 'vfe', 'vfp', 'vfa', 'detection', 'security', 'fce-security', 'network-filtering', 'identity']:
+            if dashboard_type in DASHBOARD_MZ_LISTS:
                 # Si un filtre de zone est fourni, l'utiliser au lieu de toutes les zones
                 if zone_filter:
-                    problems = test_get_problems(management_zone_name=zone_filter, time_from=timeframe, status="OPEN,CLOSED")
+                    problems = test_get_problems(management_zone_name=zone_filter, time_from=timeframe, status="OPEN,CLOSED", api_client=api_client)
                     
                     # Formater chaque problème pour ajouter les informations d'entité impactée
                     formatted_problems = []
@@ -566,53 +774,23 @@ def get_problems_72h():
                         formatted_problems.append(formatted_problem)
                     
                     # Mettre en cache le résultat
-                    api_client.set_cache(specific_cache_key, formatted_problems)
+                    api_client.set_cache(specific_cache_key, formatted_problems, tags=problem_tags, shared=True)
                     return jsonify(formatted_problems)
                 
                 # Récupérer la liste des MZs pour ce dashboard type
-                if dashboard_type == 'vfg':
-                    mz_list_var = 'VFG_MZ_LIST'
-                elif dashboard_type == 'vfe':
-                    mz_list_var = 'VFE_MZ_LIST'
-                elif dashboard_type == 'vfp':
-                    mz_list_var = 'VFP_MZ_LIST'
-                elif dashboard_type == 'vfa':
-                    mz_list_var = 'VFA_MZ_LIST'
-                elif dashboard_type == 'detection':
-                    mz_list_var = 'DETECTION_CTL_MZ_LIST'
-                elif dashboard_type == 'security':
-                    mz_list_var = 'SECURITY_ENCRYPTION_MZ_LIST'
-                elif dashboard_type == 'fce-security':
-                    mz_list_var = 'FCE_SECURITY_MZ_LIST'
-                elif dashboard_type == 'network-filtering':
-                    mz_list_var = 'NETWORK_FILTERING_MZ_LIST'
-                elif dashboard_type == 'identity':
-                    mz_list_var = 'IDENTITY_MZ_LIST'
-                else:
-                    mz_list_var = 'VFG_MZ_LIST'  # Fallback au cas où
-                    
-                mz_string = os.environ.get(mz_list_var, '')
-                
-                if not mz_string:
-                    logger.warning(f"{mz_list_var} est vide ou non définie dans .env")
+                mz_list = get_dashboard_mzs(dashboard_type)
+                if not mz_list:
+                    logger.warning(f"{DASHBOARD_MZ_LISTS[dashboard_type]} est vide ou non définie dans .env")
                     return jsonify([])
-                    
-                mz_list = [mz.strip() for mz in mz_string.split(',')]
                 logger.info(f"Liste des MZs {dashboard_type} pour problèmes 72h: {mz_list}")
                 
                 # Log de vérification pour VFG_MZ_LIST
                 if dashboard_type == 'vfg':
                     logger.info(f"Vérification VFG_MZ_LIST: {os.environ.get('VFG_MZ_LIST')}")
                 
-                # Récupérer tous les problèmes pour chaque MZ et les combiner
-                all_problems = []
-                
-                for mz_name in mz_list:
-                    try:
-                        mz_problems = test_get_problems(management_zone_name=mz_name, time_from=timeframe, status="OPEN,CLOSED")
-                        all_problems.extend(mz_problems)
-                    except Exception as mz_error:
-                        logger.error(f"Erreur lors de la récupération des problèmes 72h pour MZ {mz_name}: {mz_error}")
+                # Récupérer les problèmes de toutes les MZ en requêtes groupées (sélecteur multi-MZ),
+                # chaque problème étant ensuite rattaché à sa MZ via matching_mz
+                all_problems = api_client.fetch_problems(timeframe, mz_names=mz_list, status="OPEN,CLOSED")
                 
                 # Dédupliquer les problèmes
                 unique_problems = []
@@ -687,7 +865,7 @@ def get_problems_72h():
                     formatted_problems.append(formatted_problem)
                 
                 # Mettre en cache le résultat
-                api_client.set_cache(specific_cache_key, formatted_problems)
+                api_client.set_cache(specific_cache_key, formatted_problems, tags=problem_tags, shared=True)
                 return jsonify(formatted_problems)
             
             # En cas de dashboard type non reconnu, essayer la méthode normale
@@ -703,7 +881,7 @@ def get_problems_72h():
         logger.info("Utilisation de l'implémentation standard")
         
         # Si un type de dashboard est spécifié
-        if dashboard_type in ['vfg', 'vfe', 'detection', 'security', 'fce-security', 'network-filtering', 'identity']:
+        if dashboard_type in DASHBOARD_MZ_LISTS:
             # Si un filtre de zone est fourni, l'utiliser au lieu de toutes les zones
             if zone_filter:
                 logger.info(f"Filtrage par zone spécifique: {zone_filter} pour dashboard {dashboard_type}")
@@ -720,7 +898,7 @@ def get_problems_72h():
                         logger.info("Aucun problème trouvé pour cette zone")
                     
                     # Mettre en cache le résultat
-                    api_client.set_cache(specific_cache_key, problems)
+                    api_client.set_cache(specific_cache_key, problems, tags=problem_tags, shared=True)
                     return jsonify(problems)
                 except Exception as zone_error:
                     logger.error(f"Erreur lors de la récupération des problèmes pour zone {zone_filter}: {zone_error}")
@@ -728,52 +906,20 @@ def get_problems_72h():
                     return jsonify([])
             
             # Récupérer la liste des MZs pour ce dashboard type
-            if dashboard_type == 'vfg':
-                mz_list_var = 'VFG_MZ_LIST'
-            elif dashboard_type == 'vfe':
-                mz_list_var = 'VFE_MZ_LIST'
-            elif dashboard_type == 'detection':
-                mz_list_var = 'DETECTION_CTL_MZ_LIST'
-            elif dashboard_type == 'security':
-                mz_list_var = 'SECURITY_ENCRYPTION_MZ_LIST'
-            elif dashboard_type == 'fce-security':
-                mz_list_var = 'FCE_SECURITY_MZ_LIST'
-            elif dashboard_type == 'network-filtering':
-                mz_list_var = 'NETWORK_FILTERING_MZ_LIST'
-            elif dashboard_type == 'identity':
-                mz_list_var = 'IDENTITY_MZ_LIST'
-            else:
-                mz_list_var = 'VFG_MZ_LIST'  # Fallback au cas où
-                
-            mz_string = os.environ.get(mz_list_var, '')
-            
-            logger.info(f"Valeur de {mz_list_var}: '{mz_string}'")
-            
-            if not mz_string:
-                logger.warning(f"{mz_list_var} est vide ou non définie dans .env")
+            mz_list = get_dashboard_mzs(dashboard_type)
+            if not mz_list:
+                logger.warning(f"{DASHBOARD_MZ_LISTS[dashboard_type]} est vide ou non définie dans .env")
                 return jsonify([])
-                
-            mz_list = [mz.strip() for mz in mz_string.split(',')]
             logger.info(f"Liste des MZs {dashboard_type} pour problèmes 72h: {mz_list}")
             
-            # Récupérer les problèmes pour chaque MZ et les combiner
+            # Récupérer les problèmes de toutes les MZ en requêtes groupées (sélecteur multi-MZ)
             all_problems = []
-            
-            for mz_name in mz_list:
-                try:
-                    logger.info(f"Récupération des problèmes 72h pour MZ: {mz_name}")
-                    # Utiliser la nouvelle fonction qui gère la pagination
-                    mz_problems = get_all_problems_with_pagination(mz_name, timeframe, "OPEN,CLOSED")
-                    logger.info(f"MZ {mz_name}: {len(mz_problems)} problèmes trouvés sur 72h")
-                    
-                    # Afficher un exemple de problème s'il y en a
-                    if mz_problems:
-                        logger.info(f"Exemple pour MZ {mz_name}: {json.dumps(mz_problems[0])[:200]}...")
-                    
-                    all_problems.extend(mz_problems)
-                except Exception as mz_error:
-                    logger.error(f"Erreur lors de la récupération des problèmes 72h pour MZ {mz_name}: {mz_error}")
-                    logger.error(traceback.format_exc())
+            try:
+                all_problems = api_client.fetch_problems(timeframe, mz_names=mz_list, status="OPEN,CLOSED")
+                logger.info(f"{len(mz_list)} MZ: {len(all_problems)} problèmes trouvés sur 72h")
+            except Exception as mz_error:
+                logger.error(f"Erreur lors de la récupération des problèmes 72h pour les MZ {mz_list}: {mz_error}")
+                logger.error(traceback.format_exc())
             
             # Dédupliquer les problèmes (un même problème peut affecter plusieurs MZs)
             unique_problems = []
@@ -861,7 +1007,7 @@ def get_problems_72h():
                 formatted_problems.append(formatted_problem)
             
             # Mettre en cache le résultat
-            api_client.set_cache(specific_cache_key, formatted_problems)
+            api_client.set_cache(specific_cache_key, formatted_problems, tags=problem_tags, shared=True)
             
             logger.info(f"Fin du traitement - {len(formatted_problems)} problèmes formatés et retournés")
             return jsonify(formatted_problems)
@@ -891,7 +1037,7 @@ def get_problems_72h():
                 formatted_problems.append(formatted_problem)
             
             # Mettre en cache le résultat
-            api_client.set_cache(specific_cache_key, formatted_problems)
+            api_client.set_cache(specific_cache_key, formatted_problems, tags=problem_tags, shared=True)
             
             logger.info(f"MZ {effective_mz}: {len(formatted_problems)} problèmes récupérés et formatés sur 72h")
             return jsonify(formatted_problems)
@@ -931,11 +1077,11 @@ def get_problems():
         
         # Si le mode debug est activé, vider le cache pour cette requête
         if debug_mode:
-            api_client.cache.pop(specific_cache_key, None)
+            api_client.delete_cached(specific_cache_key)
             logger.info(f"Mode debug activé, cache vidé pour la clé: {specific_cache_key}")
         elif not use_cache:
             # Vider systématiquement le cache pour les problèmes ouverts
-            api_client.cache.pop(specific_cache_key, None)
+            api_client.delete_cached(specific_cache_key)
             logger.info(f"Cache des problèmes désactivé pour les problèmes {status}, récupération en temps réel")
         else:
             # Si nous avons déjà cette requête en cache, retourner les données
@@ -946,6 +1092,33 @@ def get_problems():
         # Déterminer le statut à utiliser (NULL si ALL)
         use_status = None if status == 'ALL' else status
         
+        # Lecture depuis le magasin de problèmes synchronisé, si la période est couverte
+        if problem_sync is not None and not debug_mode and problem_sync.covers(time_from):
+            if zone_filter:
+                mz_list = [zone_filter]
+            elif dashboard_type in DASHBOARD_MZ_LISTS:
+                mz_list = get_dashboard_mzs(dashboard_type)
+            elif not disable_mz_filter:
+                mz_list = [get_current_mz()]
+            else:
+                mz_list = []
+            if mz_list and all(mz_list):
+                # Filtres optionnels servis par les index du magasin
+                filters = {'impact': request.args.get('impact'), 'host': request.args.get('host')}
+                limit = relative_time_ms(time_from)
+                if status == 'ALL':
+                    problems = problem_sync.problems(mz_list, active_from=limit, **filters)
+                else:
+                    problems = problem_sync.problems(mz_list, status=status, start_from=limit, **filters)
+                if problems is not None:
+                    logger.info(f"Problèmes {status} ({time_from}) servis depuis le magasin pour {len(mz_list)} MZ: {len(problems)} problèmes")
+                    return format_store_problems(problems, mz_list)
+                # Magasin pas encore chargé pour ces MZ: récupération directe
+                logger.info(f"Magasin de problèmes en cours de chargement, récupération directe pour {len(mz_list)} MZ")
+            elif dashboard_type in DASHBOARD_MZ_LISTS and not zone_filter:
+                logger.warning(f"{DASHBOARD_MZ_LISTS[dashboard_type]} est vide ou non définie dans .env")
+                return []
+        
         # Log pour debug
         logger.info(f"Requête problèmes: status={status}, time_from={time_from}, dashboard_type={dashboard_type}, debug={debug_mode}")
         
@@ -953,7 +1126,7 @@ def get_problems():
         logger.info(f"Variables d'environnement: DT_ENV_URL={DT_ENV_URL}, API_TOKEN={'présent' if API_TOKEN else 'manquant'}")
         
         # Si un type de dashboard est spécifié
-        if dashboard_type in ['vfg', 'vfe', 'vfp', 'vfa', 'detection', 'security', 'fce-security', 'network-filtering', 'identity']:
+        if dashboard_type in DASHBOARD_MZ_LISTS:
             # Si un filtre de zone est fourni, l'utiliser à la place de la liste complète
             if zone_filter:
                 logger.info(f"Filtrage par zone spécifique: {zone_filter} pour dashboard {dashboard_type}")
@@ -968,7 +1141,7 @@ def get_problems():
                             problem['resolved'] = problem.get('status') != 'OPEN'
                     
                     # Mettre en cache le résultat avec la clé spécifique
-                    api_client.set_cache(specific_cache_key, problems)
+                    api_client.set_cache(specific_cache_key, problems, shared=True)
                     return problems
                     
                 except Exception as zone_error:
@@ -976,34 +1149,10 @@ def get_problems():
                     return []
             
             # Comportement normal pour tous les problèmes du dashboard
-            if dashboard_type == 'vfg':
-                mz_list_var = 'VFG_MZ_LIST'
-            elif dashboard_type == 'vfe':
-                mz_list_var = 'VFE_MZ_LIST'
-            elif dashboard_type == 'vfp':
-                mz_list_var = 'VFP_MZ_LIST'
-            elif dashboard_type == 'vfa':
-                mz_list_var = 'VFA_MZ_LIST'
-            elif dashboard_type == 'detection':
-                mz_list_var = 'DETECTION_CTL_MZ_LIST'
-            elif dashboard_type == 'security':
-                mz_list_var = 'SECURITY_ENCRYPTION_MZ_LIST'
-            elif dashboard_type == 'fce-security':
-                mz_list_var = 'FCE_SECURITY_MZ_LIST'
-            elif dashboard_type == 'network-filtering':
-                mz_list_var = 'NETWORK_FILTERING_MZ_LIST'
-            elif dashboard_type == 'identity':
-                mz_list_var = 'IDENTITY_MZ_LIST'
-            else:
-                mz_list_var = 'VFG_MZ_LIST'  # Fallback au cas où
-                
-            mz_string = os.environ.get(mz_list_var, '')
-            
-            if not mz_string:
-                logger.warning(f"{mz_list_var} est vide ou non définie dans .env")
+            mz_list = get_dashboard_mzs(dashboard_type)
+            if not mz_list:
+                logger.warning(f"{DASHBOARD_MZ_LISTS[dashboard_type]} est vide ou non définie dans .env")
                 return []
-                
-            mz_list = [mz.strip() for mz in mz_string.split(',')]
             logger.info(f"Liste des MZs {dashboard_type}: {mz_list}")
             
             # Récupérer les problèmes pour chaque MZ et les combiner
@@ -1042,7 +1191,7 @@ def get_problems():
                     logger.info(f"Problème {i+1}: {prob['id']} - {prob['title']} - Status: {prob['status']} - Resolved: {prob.get('resolved', False)}")
             
             # Mettre en cache le résultat avec la clé spécifique
-            api_client.set_cache(specific_cache_key, unique_problems)
+            api_client.set_cache(specific_cache_key, unique_problems, shared=True)
             return unique_problems
             
         else:
@@ -1071,7 +1220,7 @@ def get_problems():
                     logger.info(f"Problème {i+1}: {prob['id']} - {prob['title']} - Status: {prob['status']} - Resolved: {prob.get('resolved', False)}")
             
             # Mettre en cache le résultat avec la clé spécifique
-            api_client.set_cache(specific_cache_key, problems)
+            api_client.set_cache(specific_cache_key, problems, shared=True)
             
             logger.info(f"MZ {current_mz}: {len(problems)} problèmes récupérés (timeframe: {time_from}, status: {status})")
             return problems
@@ -1097,9 +1246,9 @@ def get_current_management_zone():
 @time_execution
 def get_summary():
     try:
-        now = datetime.now()
-        from_time = int((now - timedelta(hours=24)).timestamp() * 1000)
-        to_time = int(now.timestamp() * 1000)
+        # Fenêtre des dernières 24h alignée sur un pas de 5 min: les chargements d'un même pas partagent le cache
+        window = TimeWindow.last(hours=24)
+        from_time, to_time = window.from_time, window.to_time
         
         # Récupérer la Management Zone actuelle
         current_mz = get_current_mz()
@@ -1125,56 +1274,9 @@ def get_all_hosts_with_pagination(management_zone_name):
     """
     logger.info(f"Récupération complète des hôtes avec pagination pour la MZ: {management_zone_name}")
     
-    # Utiliser la fonction build_entity_selector
-    entity_selector = build_entity_selector("HOST", management_zone_name)
-    
-    all_hosts = []
-    page_num = 1
-    
-    # Paramètres initiaux pour la première requête
-    current_params = {
-        "entitySelector": entity_selector,
-        "fields": "+properties,+fromRelationships",
-        "pageSize": 1000  # Taille de page maximale pour réduire le nombre d'appels
-    }
-    
-    while True:
-        if 'nextPageKey' in current_params:
-            logger.info(f"Récupération de la page {page_num} des hôtes avec nextPageKey: {current_params['nextPageKey'][:20]}...")
-        else:
-            logger.info(f"Récupération de la page {page_num} des hôtes avec les paramètres initiaux")
-        
-        try:
-            # Utiliser la méthode query_api existante (qui utilise déjà le cache et gère les erreurs)
-            if 'nextPageKey' in current_params:
-                # Pour les pages suivantes, utiliser l'API avec nextPageKey
-                # Dans ce cas, il faut convertir le nextPageKey en paramètres de requête directement
-                hosts_data = api_client.query_api("entities", current_params)
-            else:
-                # Pour la première page, utiliser les paramètres normaux
-                hosts_data = api_client.query_api("entities", current_params)
-            
-            # Extraire les hôtes de cette page
-            hosts_on_page = hosts_data.get('entities', [])
-            all_hosts.extend(hosts_on_page)
-            
-            logger.info(f"Page {page_num}: {len(hosts_on_page)} hôtes récupérés. Total jusqu'à présent: {len(all_hosts)}.")
-            
-            # Vérifier s'il y a une page suivante
-            next_page_key = hosts_data.get("nextPageKey")
-            if next_page_key:
-                # Pour les pages suivantes, seuls nextPageKey et pageSize sont nécessaires
-                current_params = {'nextPageKey': next_page_key}
-                page_num += 1
-                # Petite pause pour ne pas surcharger l'API
-                time.sleep(0.2)
-            else:
-                # Plus de pages à récupérer
-                break
-                
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération des hôtes (page {page_num}): {e}")
-            break
+    # Les pages d'entités (avec OS, état et tags) alimentent aussi le stock de métadonnées du client,
+    # ce qui évite ensuite un appel entities/{id} par hôte
+    all_hosts = api_client.load_entities("HOST", management_zone_name)
     
     logger.info(f"Récupération terminée. Nombre total d'hôtes: {len(all_hosts)}")
     return all_hosts
@@ -1184,9 +1286,9 @@ def get_all_hosts_with_pagination(management_zone_name):
 @time_execution
 def get_hosts():
     try:
-        now = datetime.now()
-        from_time = int((now - timedelta(hours=24)).timestamp() * 1000)
-        to_time = int(now.timestamp() * 1000)
+        # Fenêtre des dernières 24h alignée sur un pas de 5 min: les chargements d'un même pas partagent le cache
+        window = TimeWindow.last(hours=24)
+        from_time, to_time = window.from_time, window.to_time
         
         # Récupérer la Management Zone actuelle
         current_mz = get_current_mz()
@@ -1208,7 +1310,7 @@ def get_hosts():
         logger.info(f"Récupération des métriques pour {len(host_ids)} hôtes en parallèle")
         
         # Récupérer les métriques pour tous les hôtes en parallèle
-        return api_client.get_hosts_metrics_parallel(host_ids, from_time, to_time)
+        return api_client.get_hosts_metrics_parallel(host_ids, from_time, to_time, mz_name=current_mz)
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des hôtes: {e}")
         return {'error': str(e)}
@@ -1235,33 +1337,26 @@ def get_services():
                 return cached_services
         
         # Continuer avec le traitement normal si pas de cache ou refresh demandé
-        now = datetime.now()
-        from_time = int((now - timedelta(minutes=30)).timestamp() * 1000)  # Récupération des 30 dernières minutes
-        to_time = int(now.timestamp() * 1000)
-        
-        # Utiliser la fonction build_entity_selector
-        entity_selector = build_entity_selector("SERVICE", current_mz)
-        
-        # Récupérer les entités services avec une taille de page augmentée
-        logger.info(f"Récupération des services pour {current_mz} avec une taille de page de 1000")
-        services_data = api_client.query_api("entities", {
-            "entitySelector": entity_selector,
-            "fields": "+properties,+fromRelationships",
-            "pageSize": 1000  # Augmenter la taille de la page pour récupérer jusqu'à 1000 services
-        })
+        # Fenêtre des 30 dernières minutes alignée sur la minute (résolution de l'historique)
+        window = TimeWindow.last(minutes=30)
+        from_time, to_time = window.from_time, window.to_time
+        
+        # Récupérer toutes les pages d'entités services (au-delà de 1000) dans le stock de métadonnées
+        logger.info(f"Récupération des services pour {current_mz} avec pagination complète")
+        services = api_client.load_entities("SERVICE", current_mz)
         
         # Extraire les IDs des services
-        service_ids = [service.get('entityId') for service in services_data.get('entities', [])]
+        service_ids = [service.get('entityId') for service in services]
         
         # Si aucun service n'est trouvé, retourner une liste vide
         if not service_ids:
             return []
         
         # Récupérer les métriques pour tous les services en parallèle
-        services_result = api_client.get_service_metrics_parallel(service_ids, from_time, to_time)
+        services_result = api_client.get_service_metrics_parallel(service_ids, from_time, to_time, mz_name=current_mz)
         
         # Stocker le résultat dans un cache persistant avec une durée plus longue (4 heures)
-        api_client.set_persistent_cache(persistent_cache_key, services_result, duration=14400)  # 4 heures en secondes
+        api_client.set_persistent_cache(persistent_cache_key, services_result, duration=14400, tags=[mz_tag(current_mz)], shared=True)  # 4 heures en secondes
         
         return services_result
     except Exception as e:
@@ -1289,49 +1384,30 @@ def get_processes():
                 logger.info(f"Utilisation du cache persistant pour les process groups de {current_mz}")
                 return cached_processes
         
-        # Utiliser la fonction build_entity_selector
-        entity_selector = build_entity_selector("PROCESS_GROUP", current_mz)
-        
-        # Récupérer les groupes de processus sans limite (augmenter pageSize)
-        logger.info(f"Récupération des process groups pour {current_mz} avec une taille de page de 1000")
-        process_groups_data = api_client.query_api("entities", {
-            "entitySelector": entity_selector,
-            "fields": "+properties,+fromRelationships",
-            "pageSize": 1000  # Augmenter la taille de la page pour récupérer jusqu'à 1000 process groups
-        })
+        # Récupérer toutes les pages de groupes de processus (au-delà de 1000) dans le stock de métadonnées
+        logger.info(f"Récupération des process groups pour {current_mz} avec pagination complète")
+        process_groups = api_client.load_entities("PROCESS_GROUP", current_mz)
         
         process_metrics = []
-        
-        # Requêtes en lot pour les technologies
-        process_ids = []
-        for pg in process_groups_data.get('entities', []):
-            process_ids.append(pg.get('entityId'))
-        
-        # Traiter les processus en lot si disponibles
-        if process_ids:
-            # Récupérer les détails de technologie en parallèle
-            tech_queries = [(f"entities/{pg_id}", None) for pg_id in process_ids]
-            tech_results = api_client.batch_query(tech_queries)
+        for pg in process_groups:
+            pg_id = pg.get('entityId')
             
-            for i, pg in enumerate(process_groups_data.get('entities', [])):
-                pg_id = pg.get('entityId')
-                
-                # Récupération avancée de la technologie
-                tech_info = api_client.extract_technology(pg_id)
-                
-                # Récupérer l'URL Dynatrace de l'entité
-                dt_url = f"{DT_ENV_URL}/ui/entity/{pg_id}"
-                
-                process_metrics.append({
-                    'id': pg_id,
-                    'name': pg.get('displayName'),
-                    'technology': tech_info['name'],
-                    'tech_icon': tech_info['icon'],
-                    'dt_url': dt_url
-                })
+            # Technologie déduite des métadonnées déjà chargées, sans appel par entité
+            tech_info = api_client.extract_technology(pg_id, entity_details=pg)
+            
+            # Récupérer l'URL Dynatrace de l'entité
+            dt_url = f"{DT_ENV_URL}/ui/entity/{pg_id}"
+            
+            process_metrics.append({
+                'id': pg_id,
+                'name': pg.get('displayName'),
+                'technology': tech_info['name'],
+                'tech_icon': tech_info['icon'],
+                'dt_url': dt_url
+            })
         
         # Stocker le résultat dans un cache persistant avec une durée plus longue (4 heures)
-        api_client.set_persistent_cache(persistent_cache_key, process_metrics, duration=14400)  # 4 heures en secondes
+        api_client.set_persistent_cache(persistent_cache_key, process_metrics, duration=14400, tags=[mz_tag(current_mz)], shared=True)  # 4 heures en secondes
         
         return process_metrics
     except Exception as e:
@@ -1339,6 +1415,82 @@ def get_processes():
         return {'error': str(e)}
 
 
+# Fonction pour récupérer le nombre d'entités par type dans une MZ (mis en cache sous count:{type}:{mz})
+def get_entity_count(entity_type, mz_name):
+    # Paramètres importants pour les retries
+    max_retries = 3
+    retry_delay = 2  # secondes
+    
+    for attempt in range(max_retries):
+        try:
+            # Construire l'URL API
+            api_url = f"{DT_ENV_URL}/api/v2/entities"
+            headers = {
+                'Authorization': f'Api-Token {API_TOKEN}',
+                'Accept': 'application/json'
+            }
+            
+            # Paramètres pour ne récupérer que le comptage
+            # On définit une taille de page à 1 car on a seulement besoin du comptage total
+            # Mais on s'assure que les résultats ne sont pas limités avec pageSize=0 qui retourne tous les résultats
+            params = {
+                'entitySelector': f'type({entity_type}),mzName("{mz_name}")',
+                'pageSize': 1,
+                'totalCount': 'true'
+            }
+            
+            logger.info(f"Requête API (tentative {attempt+1}/{max_retries}): {api_url} avec sélecteur: {params['entitySelector']}")
+            
+            # Effectuer la requête HTTP avec un timeout plus long
+            # Augmenter le timeout proportionnellement au nombre de tentatives
+            timeout = 30 * (attempt + 1)
+            response = api_client.rate_limited_get(api_url, headers=headers, params=params, verify=False, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            
+            # Retourner le nombre total
+            count = data.get('totalCount', 0)
+            logger.info(f"Comptage pour {entity_type} dans {mz_name}: {count}")
+            
+            # Mise en cache du résultat pour réduire la charge sur l'API
+            # (les comptages évoluent lentement: une valeur périmée reste servable)
+            key = f"count:{entity_type}:{mz_name}"
+            api_client.set_cache(key, count, stale_ttl=CACHE_STALE_TTL, tags=[mz_tag(mz_name)], shared=True)
+            
+            return count
+            
+        except requests.exceptions.Timeout:
+            logger.warning(f"Timeout lors du comptage des {entity_type} pour {mz_name} (tentative {attempt+1}/{max_retries})")
+            if attempt < max_retries - 1:
+                logger.info(f"Attente de {retry_delay} secondes avant la prochaine tentative...")
+                time.sleep(retry_delay)
+            else:
+                # Dernière tentative, vérifier si nous avons une valeur en cache
+                key = f"count:{entity_type}:{mz_name}"
+                cached = api_client.get_cached(key)
+                if cached is not None:
+                    logger.info(f"Utilisation de la valeur en cache pour {entity_type} dans {mz_name}: {cached}")
+                    return cached
+                logger.error(f"Échec de toutes les tentatives pour {entity_type}")
+                return 0
+                
+        except Exception as e:
+            logger.error(f"Erreur lors du comptage des {entity_type} pour {mz_name}: {e}")
+            if attempt < max_retries - 1:
+                logger.info(f"Attente de {retry_delay} secondes avant la prochaine tentative...")
+                time.sleep(retry_delay)
+            else:
+                # Dernière tentative, vérifier si nous avons une valeur en cache
+                key = f"count:{entity_type}:{mz_name}"
+                cached = api_client.get_cached(key)
+                if cached is not None:
+                    logger.info(f"Utilisation de la valeur en cache pour {entity_type} dans {mz_name}: {cached}")
+                    return cached
+                return 0
+    
+    # Nous ne devrions jamais arriver ici, mais au cas où
+    return 0
+
 @app.route('/api/management-zones/counts', methods=['GET'])
 @time_execution
 def get_management_zone_counts():
@@ -1350,93 +1502,28 @@ def get_management_zone_counts():
             
         logger.info(f"Récupération des comptages pour la management zone: {zone_name}")
         
-        # Fonction pour récupérer le nombre d'entités par type
-        def get_entity_count(entity_type, mz_name):
-            # Paramètres importants pour les retries
-            max_retries = 3
-            retry_delay = 2  # secondes
-            
-            for attempt in range(max_retries):
-                try:
-                    # Construire l'URL API
-                    api_url = f"{DT_ENV_URL}/api/v2/entities"
-                    headers = {
-                        'Authorization': f'Api-Token {API_TOKEN}',
-                        'Accept': 'application/json'
-                    }
-                    
-                    # Paramètres pour ne récupérer que le comptage
-                    # On définit une taille de page à 1 car on a seulement besoin du comptage total
-                    # Mais on s'assure que les résultats ne sont pas limités avec pageSize=0 qui retourne tous les résultats
-                    params = {
-                        'entitySelector': f'type({entity_type}),mzName("{mz_name}")',
-                        'pageSize': 1,
-                        'totalCount': 'true'
-                    }
-                    
-                    logger.info(f"Requête API (tentative {attempt+1}/{max_retries}): {api_url} avec sélecteur: {params['entitySelector']}")
-                    
-                    # Effectuer la requête HTTP avec un timeout plus long
-                    # Augmenter le timeout proportionnellement au nombre de tentatives
-                    timeout = 30 * (attempt + 1)
-                    response = requests.get(api_url, headers=headers, params=params, verify=False, timeout=timeout)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    # Retourner le nombre total
-                    count = data.get('totalCount', 0)
-                    logger.info(f"Comptage pour {entity_type} dans {mz_name}: {count}")
-                    
-                    # Mise en cache du résultat pour réduire la charge sur l'API
-                    key = f"count:{entity_type}:{mz_name}"
-                    api_client.set_cache(key, count)
-                    
-                    return count
-                    
-                except requests.exceptions.Timeout:
-                    logger.warning(f"Timeout lors du comptage des {entity_type} pour {mz_name} (tentative {attempt+1}/{max_retries})")
-                    if attempt < max_retries - 1:
-                        logger.info(f"Attente de {retry_delay} secondes avant la prochaine tentative...")
-                        time.sleep(retry_delay)
-                    else:
-                        # Dernière tentative, vérifier si nous avons une valeur en cache
-                        key = f"count:{entity_type}:{mz_name}"
-                        cached = api_client.get_cached(key)
-                        if cached is not None:
-                            logger.info(f"Utilisation de la valeur en cache pour {entity_type} dans {mz_name}: {cached}")
-                            return cached
-                        logger.error(f"Échec de toutes les tentatives pour {entity_type}")
-                        return 0
-                        
-                except Exception as e:
-                    logger.error(f"Erreur lors du comptage des {entity_type} pour {mz_name}: {e}")
-                    if attempt < max_retries - 1:
-                        logger.info(f"Attente de {retry_delay} secondes avant la prochaine tentative...")
-                        time.sleep(retry_delay)
-                    else:
-                        # Dernière tentative, vérifier si nous avons une valeur en cache
-                        key = f"count:{entity_type}:{mz_name}"
-                        cached = api_client.get_cached(key)
-                        if cached is not None:
-                            logger.info(f"Utilisation de la valeur en cache pour {entity_type} dans {mz_name}: {cached}")
-                            return cached
-                        return 0
-            
-            # Nous ne devrions jamais arriver ici, mais au cas où
-            return 0
-        
-        # Récupérer les comptages en parallèle avec threads
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            # Soumettre les tâches
-            host_future = executor.submit(get_entity_count, "HOST", zone_name)
-            service_future = executor.submit(get_entity_count, "SERVICE", zone_name)
-            process_future = executor.submit(get_entity_count, "PROCESS_GROUP", zone_name)
-            
-            # Récupérer les résultats
-            hosts_count = host_future.result()
-            services_count = service_future.result()
-            processes_count = process_future.result()
+        # Comptages déjà en cache (préchargés par le planificateur); seuls les manquants sont interrogés
+        counts = {}
+        for entity_type in ("HOST", "SERVICE", "PROCESS_GROUP"):
+            entry = api_client.get_cached_entry(f"count:{entity_type}:{zone_name}")
+            if entry is not None:
+                counts[entity_type] = entry['data']
+        
+        # Récupérer les comptages manquants en parallèle avec threads
+        missing_types = [entity_type for entity_type in ("HOST", "SERVICE", "PROCESS_GROUP") if entity_type not in counts]
+        if missing_types:
+            import concurrent.futures
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(missing_types)) as executor:
+                # Soumettre les tâches
+                futures = {entity_type: executor.submit(get_entity_count, entity_type, zone_name) for entity_type in missing_types}
+                
+                # Récupérer les résultats
+                for entity_type, future in futures.items():
+                    counts[entity_type] = future.result()
+        
+        hosts_count = counts["HOST"]
+        services_count = counts["SERVICE"]
+        processes_count = counts["PROCESS_GROUP"]
         
         logger.info(f"Comptages pour {zone_name}: hosts={hosts_count}, services={services_count}, processes={processes_count}")
         
@@ -1486,7 +1573,7 @@ def get_management_zones():
             'Authorization': f'Api-Token {API_TOKEN}',
             'Accept': 'application/json'
         }
-        response = requests.get(url, headers=headers, verify=False)
+        response = api_client.rate_limited_get(url, headers=headers, verify=False)
         response.raise_for_status()
         mz_data = response.json()
         
@@ -1539,17 +1626,6 @@ def get_all_problems_with_pagination(management_zone_name=None, time_from="now-7
     Returns:
         list: Liste des problèmes récupérés.
     """
-    # Construction des headers pour l'API Dynatrace
-    headers = {
-        'Authorization': f'Api-Token {API_TOKEN}',
-        'Accept': 'application/json; charset=utf-8'
-    }
-    
-    api_url = DT_ENV_URL.rstrip('/')
-    problems_url = f"{api_url}/api/v2/problems"
-    
-    all_problems = []
-    
     # Échapper les guillemets doubles dans le nom de la MZ pour le sélecteur
     problem_selector = ""
     if management_zone_name:
@@ -1557,8 +1633,8 @@ def get_all_problems_with_pagination(management_zone_name=None, time_from="now-7
         problem_selector = f'managementZones("{escaped_mz_name}")'
         logger.info(f"Requête de problèmes avec sélecteur MZ: '{problem_selector}'")
     
-    # Paramètres initiaux pour la première requête
-    current_params = {
+    # Paramètres de la première requête
+    params = {
         'from': time_from,
         'status': status,
         'pageSize': 500  # Demander le maximum par page pour réduire le nombre d'appels
@@ -1566,82 +1642,32 @@ def get_all_problems_with_pagination(management_zone_name=None, time_from="now-7
     
     # Ajouter le sélecteur de problèmes si défini
     if problem_selector:
-        current_params['problemSelector'] = problem_selector
+        params['problemSelector'] = problem_selector
     
-    page_num = 1
     logger.info(f"Début de la récupération des problèmes pour timeframe: {time_from}, status: {status}" + 
                 (f", MZ: '{management_zone_name}'" if management_zone_name else ""))
     
-    while True:
-        if 'nextPageKey' in current_params:
-            logger.info(f"Récupération de la page {page_num} avec nextPageKey: {current_params['nextPageKey'][:20]}...")
-        else:
-            logger.info(f"Récupération de la page {page_num} avec les paramètres initiaux: {current_params}")
-        
-        try:
-            verify_ssl = os.environ.get('VERIFY_SSL', 'False').lower() in ('true', '1', 't')
-            response = requests.get(
-                problems_url, 
-                headers=headers, 
-                params=current_params, 
-                verify=verify_ssl,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            problems_on_page = data.get('problems', [])
-            
-            # Vérifier la structure des problèmes et exclure les invalides
-            valid_problems = []
-            for prob in problems_on_page:
-                if not isinstance(prob, dict):
-                    logger.warning(f"Problème ignoré: format inattendu (non-dictionnaire): {type(prob)}")
-                    continue
-                    
-                if 'id' not in prob:
-                    logger.warning(f"Problème ignoré: pas d'ID trouvé: {json.dumps(prob)[:200]}...")
-                    continue
-                    
-                valid_problems.append(prob)
-            
-            # Si des problèmes ont été ignorés, enregistrer un avertissement
-            if len(valid_problems) < len(problems_on_page):
-                logger.warning(f"Page {page_num}: {len(problems_on_page) - len(valid_problems)} problèmes invalides ignorés")
-                
-            all_problems.extend(valid_problems)
+    all_problems = []
+    invalid_count = 0
+    
+    # Une page en échec après les nouvelles tentatives lève une exception au lieu de tronquer la liste
+    for prob in api_client.paginate_items("problems", params, "problems"):
+        # Vérifier la structure des problèmes et exclure les invalides
+        if not isinstance(prob, dict):
+            logger.warning(f"Problème ignoré: format inattendu (non-dictionnaire): {type(prob)}")
+            invalid_count += 1
+            continue
             
-            logger.info(f"Page {page_num}: {len(valid_problems)} problèmes valides récupérés. Total jusqu'à présent: {len(all_problems)}.")
+        if 'id' not in prob:
+            logger.warning(f"Problème ignoré: pas d'ID trouvé: {json.dumps(prob)[:200]}...")
+            invalid_count += 1
+            continue
             
-            next_page_key = data.get("nextPageKey")
-            if next_page_key:
-                # Pour les pages suivantes, seuls nextPageKey et pageSize sont nécessaires
-                current_params = {'nextPageKey': next_page_key, 'pageSize': 500}
-                page_num += 1
-                # Petite pause pour ne pas surcharger l'API
-                time.sleep(0.2)
-            else:
-                # Plus de pages à récupérer
-                break
-                
-        except requests.exceptions.HTTPError as http_err:
-            logger.error(f"Erreur HTTP lors de la récupération des problèmes (page {page_num}): {http_err}")
-            logger.error(f"Réponse du serveur: {response.text if response and hasattr(response, 'text') else 'Pas de réponse détaillée'}")
-            break
-        except requests.exceptions.Timeout as timeout_err:
-            logger.error(f"Timeout lors de la requête (page {page_num}): {timeout_err}")
-            break
-        except requests.exceptions.RequestException as req_err:
-            logger.error(f"Erreur de requête générique (page {page_num}): {req_err}")
-            break
-        except json.JSONDecodeError as json_err:
-            logger.error(f"Erreur de décodage JSON (page {page_num}): {json_err}")
-            logger.error(f"Réponse brute reçue: {response.text if response and hasattr(response, 'text') else 'Pas de réponse détaillée'}")
-            break
-        except Exception as e:
-            logger.error(f"Erreur inattendue: {e}")
-            logger.error(traceback.format_exc())
-            break
+        all_problems.append(prob)
+    
+    # Si des problèmes ont été ignorés, enregistrer un avertissement
+    if invalid_count:
+        logger.warning(f"{invalid_count} problèmes invalides ignorés")
     
     logger.info(f"Récupération terminée. Nombre total de problèmes: {len(all_problems)}")
     return all_problems
@@ -1672,7 +1698,10 @@ def get_status():
         'cache_expiry': cache_expiry,
         'server_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'version': '1.1.0',
-        'optimized': True
+        'optimized': True,
+        'scheduler': refresh_scheduler.status() if refresh_scheduler.running else None,
+        'scheduler_leader': leader_election.status() if leader_election is not None else None,
+        'problem_sync': problem_sync.status() if problem_sync is not None else None
     })
 
 @app.route('/api/refresh/<cache_type>', methods=['POST'])
@@ -1680,9 +1709,13 @@ def refresh_cache(cache_type):
     if cache_type not in ['services', 'hosts', 'process_groups', 'problems', 'summary', 'all', 'purge']:
         return jsonify({'error': f'Type de cache {cache_type} non trouvé'}), 404
     
+    # Le magasin de problèmes rechargera toute sa fenêtre au prochain passage
+    if problem_sync is not None and cache_type in ('problems', 'all', 'purge'):
+        problem_sync.reset()
+    
     # Si 'purge', vider complètement le cache, y compris les clés personnalisées
     if cache_type == 'purge':
-        api_client.cache.clear()
+        api_client.clear_cache()
         return jsonify({'success': True, 'message': 'Cache complètement purgé'})
     
     # Si 'all', effacer tous les caches standard
@@ -1690,8 +1723,8 @@ def refresh_cache(cache_type):
         api_client.clear_cache()
         return jsonify({'success': True, 'message': 'Tous les caches ont été effacés'})
     
-    # Sinon, effacer uniquement le cache spécifié
-    api_client.clear_cache(f"{cache_type}:")
+    # Sinon, effacer uniquement le cache spécifié (via l'index des étiquettes)
+    api_client.invalidate_tags(resource_tag(cache_type))
     return jsonify({'success': True, 'message': f'Cache {cache_type} effacé avec succès'})
 
 @app.route('/api/mz-admin', methods=['GET'])
@@ -1725,26 +1758,60 @@ def get_mz_admin():
             'timestamp': datetime.now().strftime('%H:%M:%S')
         }), 500
 
+# Jauges calculées à la lecture des métriques
+metrics.register_gauge('cache_entries', lambda: [({'cache': store.name}, store.stats()['entries'])
+                                                 for store in (api_client.cache, response_cache)],
+                       "Entrées présentes dans les caches mémoire du worker")
+metrics.register_gauge('cache_bytes', lambda: [({'cache': store.name}, store.stats()['bytes'])
+                                               for store in (api_client.cache, response_cache)],
+                       "Taille estimée des caches mémoire du worker (octets)")
+metrics.register_gauge('dynatrace_singleflight_in_flight', lambda: len(api_client._inflight),
+                       "Requêtes Dynatrace en vol partagées par plusieurs appelants (single-flight)")
+metrics.register_gauge('dynatrace_concurrency_limit', lambda: api_client.limiter.limit,
+                       "Limite de concurrence adaptative courante vers Dynatrace")
+metrics.register_gauge('dynatrace_concurrency_in_use', lambda: api_client.limiter.in_flight,
+                       "Places de concurrence occupées vers Dynatrace")
+metrics.register_gauge('cache_background_refreshes', lambda: len(refreshing_keys),
+                       "Rafraîchissements stale-while-revalidate en cours")
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Métriques du worker au format texte Prometheus"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/performance', methods=['GET'])
 def get_performance():
     """Endpoint pour obtenir des statistiques de performance"""
-    # Collecter les statistiques de cache
+    # Collecter les statistiques de cache (taille suivie à l'insertion, sans resérialiser les données)
+    memory_stats = api_client.cache.stats()
     cache_stats = {
-        'size': len(api_client.cache),
-        'hit_rate': 0,  # Cela nécessiterait un suivi plus détaillé des hits/misses
+        'size': memory_stats['entries'],
+        'memory_bytes': memory_stats['bytes'],
+        'memory_limit_bytes': memory_stats['max_bytes'],
+        'memory_usage_ratio': memory_stats['usage_ratio'],
+        'evictions': memory_stats['evictions'],
+        'expired_removed': memory_stats['expired_removed'],
+        'hit_rate': 0,
         'items': []
     }
     
+    # Taux de succès du cache depuis le démarrage du worker (les entrées périmées servies comptent comme succès)
+    hits = metrics.counter_value('cache_requests_total', result='hit') + metrics.counter_value('cache_requests_total', result='stale')
+    lookups = hits + metrics.counter_value('cache_requests_total', result='miss')
+    if lookups:
+        cache_stats['hit_rate'] = round(hits / lookups, 4)
+    
     # Ajouter des informations sur les éléments du cache
+    now = time.time()
     for key, item in api_client.cache.items():
-        age = time.time() - item['timestamp']
-        expiry = CACHE_DURATION - age
+        age = now - item['timestamp']
+        expiry = item.get('duration', CACHE_DURATION) - age
         if expiry > 0:
             cache_stats['items'].append({
                 'key': key,
                 'age': round(age, 2),
                 'expiry': round(expiry, 2),
-                'size': len(str(item['data']))
+                'size': item['size']
             })
     
     # Trier les éléments par âge
@@ -1756,10 +1823,60 @@ def get_performance():
     return jsonify({
         'cache': cache_stats,
         'server_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'uptime': 0,  # Nécessiterait de stocker l'heure de démarrage
+        'uptime': round(metrics.uptime(), 2),
+        'request_count': api_client.request_count,
         'api_client_version': '1.0',
-        'optimized': True
+        'optimized': True,
+        'metrics': metrics.snapshot()
     })
 
+# Rafraîchissements planifiés: chaque route est exécutée dans un contexte de requête dédié,
+# avec la MZ cible imposée, et son résultat remplace l'entrée de cache correspondante
+def refresh_mz_view(view, path, mz_name):
+    with app.test_request_context(path):
+        g.mz_override = mz_name
+        view.refresh()
+
+def refresh_problems(dashboard_type):
+    with app.test_request_context('/api/problems-72h', query_string={'type': dashboard_type, 'timeframe': '-72h', 'refresh': 'true'}):
+        get_problems_72h()
+
+def refresh_counts(mz_name):
+    for entity_type in ("HOST", "SERVICE", "PROCESS_GROUP"):
+        get_entity_count(entity_type, mz_name)
+
+def get_scheduled_dashboard_types():
+    return [dashboard_type for dashboard_type in DASHBOARD_MZ_LISTS if get_dashboard_mzs(dashboard_type)]
+
+refresh_scheduler = RefreshScheduler(jitter=SCHEDULER_JITTER_SECONDS)
+if problem_sync is not None:
+    # Les vues de problèmes lisent le magasin: seul le magasin est rafraîchi, sans gigue
+    refresh_scheduler.add_resource('problem-sync', lambda _: problem_sync.sync(), lambda: ['all'], PROBLEM_SYNC_INTERVAL, jitter=0)
+else:
+    refresh_scheduler.add_resource('problems', refresh_problems, get_scheduled_dashboard_types, SCHEDULER_INTERVALS['problems'])
+refresh_scheduler.add_resource('summary', lambda mz: refresh_mz_view(get_summary, '/api/summary', mz),
+                               get_all_dashboard_mzs, SCHEDULER_INTERVALS['summary'])
+refresh_scheduler.add_resource('hosts', lambda mz: refresh_mz_view(get_hosts, '/api/hosts', mz),
+                               get_all_dashboard_mzs, SCHEDULER_INTERVALS['hosts'])
+# refresh=true: recalculer aussi le cache persistant des services au lieu de le relire
+refresh_scheduler.add_resource('services', lambda mz: refresh_mz_view(get_services, '/api/services?refresh=true', mz),
+                               get_all_dashboard_mzs, SCHEDULER_INTERVALS['services'])
+refresh_scheduler.add_resource('counts', refresh_counts, get_all_dashboard_mzs, SCHEDULER_INTERVALS['counts'])
+
+leader_election = None
+if SCHEDULER_ENABLED:
+    atexit.register(refresh_scheduler.shutdown)
+    if SCHEDULER_LOCK_PATH:
+        if shared_cache is None:
+            logger.warning("Cache partagé désactivé: seuls les utilisateurs du worker leader profiteront des rafraîchissements planifiés")
+        # Planificateur en pause jusqu'à l'élection de ce worker
+        refresh_scheduler.start(paused=True)
+        leader_election = LeaderElection(SCHEDULER_LOCK_PATH, heartbeat=SCHEDULER_HEARTBEAT_SECONDS,
+                                         on_elected=refresh_scheduler.resume, on_demoted=refresh_scheduler.pause)
+        leader_election.start()
+        atexit.register(leader_election.stop)
+    else:
+        refresh_scheduler.start()
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,771 @@
+"""
+Stockage du cache de l'API Dynatrace
+Cache borné en mémoire: budget en octets, éviction LRU, taille suivie par entrée
+et purge périodique des entrées expirées en arrière-plan.
+Second niveau optionnel partagé par les workers gunicorn d'un même nœud (fichier SQLite).
+Instantanés optionnels sur disque des entrées à longue durée de vie, pour un redémarrage à chaud.
+Les entrées portent des étiquettes (MZ, type de ressource, entité) indexées pour une invalidation
+proportionnelle au nombre d'entrées concernées.
+"""
+
+import os
+import re
+import glob
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+
+from metrics import metrics, key_prefix
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+
+# Identifiants d'entités et Management Zones reconnus dans les clés de cache
+ENTITY_ID_PATTERN = re.compile(r'\b[A-Z][A-Z_]*-[0-9A-F]{16}\b')
+MZ_SELECTOR_PATTERN = re.compile(r'(?:mzName|managementZones)\("((?:[^"\\]|\\.)*)"\)')
+
+
+def mz_tag(mz_name):
+    """Étiquette d'une Management Zone"""
+    return f"mz:{mz_name}"
+
+
+def resource_tag(resource):
+    """Étiquette d'un type de ressource (préfixe de clé, ex: 'services')"""
+    return f"resource:{resource}"
+
+
+def entity_tag(entity_id):
+    """Étiquette d'une entité Dynatrace"""
+    return f"entity:{entity_id}"
+
+
+def alias_tag(cache_key):
+    """Étiquette d'alias: nom donné par un appelant à une entrée stockée sous une clé canonique"""
+    return f"alias:{cache_key}"
+
+
+def cache_tags(key, tags=None):
+    """
+    Étiquettes d'une entrée de cache: type de ressource (préfixe de la clé, sans 'persistent_'),
+    MZ et entités cités dans les sélecteurs de la clé, plus les étiquettes explicites
+
+    Args:
+        key (str): Clé de cache
+        tags (iterable): Étiquettes supplémentaires (ex: MZ courante d'une route)
+
+    Returns:
+        tuple: Étiquettes sans doublon
+    """
+    resource = key.split(':', 1)[0]
+    if resource.startswith('persistent_'):
+        resource = resource[len('persistent_'):]
+    result = {resource_tag(resource)}
+    result.update(mz_tag(mz_name) for mz_name in MZ_SELECTOR_PATTERN.findall(key))
+    result.update(entity_tag(entity_id) for entity_id in ENTITY_ID_PATTERN.findall(key))
+    if tags:
+        result.update(tags)
+    return tuple(sorted(result))
+
+
+def estimate_size(obj):
+    """
+    Estime l'empreinte mémoire d'un objet JSON (dict, list, str, nombres) en octets
+    Parcourt les conteneurs une seule fois; appelée à l'insertion uniquement.
+
+    Args:
+        obj: Objet à mesurer
+
+    Returns:
+        int: Taille estimée en octets
+    """
+    size = 0
+    stack = [obj]
+    seen = set()
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set)):
+            stack.extend(current)
+    return size
+
+
+class CacheStore:
+    """
+    Cache mémoire borné par un budget en octets avec éviction du moins récemment utilisé
+    Chaque entrée est un dictionnaire {'data', 'timestamp', 'size'} avec une 'duration'
+    optionnelle qui remplace la durée par défaut, et une 'soft_duration' optionnelle au-delà
+    de laquelle l'entrée est périmée mais encore servable (stale-while-revalidate).
+    Les 'tags' optionnels d'une entrée alimentent un index secondaire étiquette -> clés.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, default_duration=300, sweep_interval=60, name='api'):
+        """
+        Args:
+            max_bytes (int): Budget mémoire du cache en octets
+            default_duration (int): Durée de vie par défaut des entrées en secondes
+            sweep_interval (int): Intervalle de purge des entrées expirées en secondes (0 pour désactiver)
+            name (str): Nom du cache dans les métriques
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.default_duration = default_duration
+        self.sweep_interval = sweep_interval
+        self.lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+        self.evictions = 0
+        self.expired_removed = 0
+        self._sweeper = None
+        self._stop_event = threading.Event()
+        if sweep_interval:
+            self.start_sweeper()
+
+    def is_expired(self, item, now=None):
+        """Indique si une entrée a dépassé sa durée de vie"""
+        now = time.time() if now is None else now
+        return now - item['timestamp'] >= item.get('duration', self.default_duration)
+
+    def get(self, key, default=None):
+        """Retourne l'entrée brute (même expirée) et la marque comme récemment utilisée"""
+        with self.lock:
+            item = self._entries.get(key)
+            if item is None:
+                return default
+            self._entries.move_to_end(key)
+            return item
+
+    def set(self, key, data, duration=None, timestamp=None, soft_duration=None, tags=None):
+        """
+        Insère ou remplace une entrée puis évince les moins récemment utilisées si le budget est dépassé
+
+        Args:
+            key (str): Clé de cache
+            data: Données à mettre en cache
+            duration (int): Durée de vie propre à l'entrée (None: durée par défaut)
+            timestamp (float): Instant de création (défaut: maintenant)
+            soft_duration (int): Âge au-delà duquel l'entrée est périmée mais encore servable
+            tags (iterable): Étiquettes de l'entrée (MZ, type de ressource, entité)
+        """
+        item = {
+            'data': data,
+            'timestamp': time.time() if timestamp is None else timestamp
+        }
+        if duration is not None:
+            item['duration'] = duration
+        if soft_duration is not None:
+            item['soft_duration'] = soft_duration
+        if tags:
+            item['tags'] = tuple(tags)
+        self[key] = item
+
+    def __setitem__(self, key, item):
+        if 'size' not in item:
+            item['size'] = estimate_size(item['data']) + sys.getsizeof(key)
+        with self.lock:
+            self._remove(key)
+            self._entries[key] = item
+            self._bytes += item['size']
+            for tag in item.get('tags', ()):
+                self._tags.setdefault(tag, set()).add(key)
+            self._evict()
+
+    def _remove(self, key):
+        """Retire une entrée et ses étiquettes de l'index (verrou tenu)"""
+        item = self._entries.pop(key, None)
+        if item is None:
+            return None
+        self._bytes -= item['size']
+        for tag in item.get('tags', ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return item
+
+    def __getitem__(self, key):
+        item = self.get(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def __delitem__(self, key):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self._entries)
+
+    def pop(self, key, default=None):
+        """Supprime une entrée et la retourne"""
+        with self.lock:
+            item = self._remove(key)
+            return default if item is None else item
+
+    def keys(self):
+        """Instantané des clés, du moins au plus récemment utilisé"""
+        with self.lock:
+            return list(self._entries.keys())
+
+    def items(self):
+        """Instantané des couples (clé, entrée) pris sous le verrou"""
+        with self.lock:
+            return list(self._entries.items())
+
+    def clear(self):
+        """Vide complètement le cache"""
+        with self.lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def delete_matching(self, predicate):
+        """
+        Supprime les entrées dont la clé vérifie un prédicat
+
+        Returns:
+            int: Nombre d'entrées supprimées
+        """
+        with self.lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def delete_tagged(self, tags):
+        """
+        Supprime les entrées portant au moins une des étiquettes, via l'index (sans parcourir le cache)
+
+        Args:
+            tags (iterable): Étiquettes à invalider
+
+        Returns:
+            int: Nombre d'entrées supprimées
+        """
+        with self.lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def _evict(self):
+        """Évince les entrées les moins récemment utilisées jusqu'à respecter le budget (verrou tenu)"""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            item = self._remove(key)
+            self.evictions += 1
+            metrics.inc('cache_evictions_total', cache=self.name, prefix=key_prefix(key), reason='lru')
+            logger.debug(f"Éviction LRU de {key} ({item['size']} octets)")
+
+    def sweep(self):
+        """
+        Supprime les entrées expirées
+
+        Returns:
+            int: Nombre d'entrées supprimées
+        """
+        now = time.time()
+        with self.lock:
+            expired = [key for key, item in self._entries.items() if self.is_expired(item, now)]
+            for key in expired:
+                self._remove(key)
+                metrics.inc('cache_evictions_total', cache=self.name, prefix=key_prefix(key), reason='expired')
+            self.expired_removed += len(expired)
+        if expired:
+            logger.debug(f"Purge du cache: {len(expired)} entrées expirées supprimées")
+        return len(expired)
+
+    def start_sweeper(self):
+        """Démarre le thread de purge périodique des entrées expirées"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(self.sweep_interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Erreur lors de la purge du cache: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        """Arrête le thread de purge"""
+        self._stop_event.set()
+
+    def stats(self):
+        """Statistiques mémoire du cache"""
+        with self.lock:
+            return {
+                'entries': len(self._entries),
+                'tags': len(self._tags),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'usage_ratio': round(self._bytes / self.max_bytes, 4) if self.max_bytes else 0,
+                'evictions': self.evictions,
+                'expired_removed': self.expired_removed
+            }
+
+
+class SQLiteSharedCache:
+    """
+    Second niveau de cache partagé entre les processus d'un même nœud, stocké dans un fichier SQLite
+    Les données sont sérialisées en JSON compressé. Les étiquettes des entrées sont indexées dans
+    une table dédiée. Les invalidations (motif, clé ou étiquette) sont journalisées dans une
+    table que chaque worker relit pour purger son propre cache mémoire.
+    Toute erreur SQLite est journalisée et traitée comme un échec de cache (jamais propagée).
+    """
+
+    # Durée de conservation du journal d'invalidations et intervalle de purge des lignes expirées
+    INVALIDATION_RETENTION = 3600
+    CLEANUP_INTERVAL = 300
+
+    def __init__(self, path, default_duration=300):
+        """
+        Args:
+            path (str): Chemin du fichier SQLite partagé
+            default_duration (int): Durée de vie par défaut des entrées en secondes
+        """
+        self.path = path
+        self.default_duration = default_duration
+        self._local = threading.local()
+        self._last_cleanup = 0
+        self._init_schema()
+        self.last_invalidation = self._current_invalidation()
+
+    def _connection(self):
+        """Connexion SQLite propre au thread courant"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _init_schema(self):
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, data BLOB NOT NULL, timestamp REAL NOT NULL, duration REAL, soft_duration REAL, tags TEXT)"
+        )
+        # Fichiers créés avant l'ajout du TTL souple et des étiquettes
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(entries)")]
+        if 'soft_duration' not in columns:
+            connection.execute("ALTER TABLE entries ADD COLUMN soft_duration REAL")
+        if 'tags' not in columns:
+            connection.execute("ALTER TABLE entries ADD COLUMN tags TEXT")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entry_tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS entry_tags_key ON entry_tags (key)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS invalidations ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, pattern TEXT, exact INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(invalidations)")]
+        if 'tag' not in columns:
+            connection.execute("ALTER TABLE invalidations ADD COLUMN tag INTEGER NOT NULL DEFAULT 0")
+
+    def _current_invalidation(self):
+        try:
+            row = self._connection().execute("SELECT MAX(seq) FROM invalidations").fetchone()
+            return row[0] or 0
+        except sqlite3.Error as e:
+            logger.warning(f"Cache partagé indisponible ({self.path}): {e}")
+            return 0
+
+    @staticmethod
+    def _encode(data):
+        return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), 1)
+
+    @staticmethod
+    def _decode(blob):
+        return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+    def get(self, key):
+        """
+        Retourne l'entrée partagée si elle existe et n'est pas expirée
+
+        Returns:
+            dict: {'data', 'timestamp', 'duration'?, 'soft_duration'?, 'tags'?} ou None
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT data, timestamp, duration, soft_duration, tags FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            blob, timestamp, duration, soft_duration, tags = row
+            if time.time() - timestamp >= (duration if duration is not None else self.default_duration):
+                return None
+            item = {'data': self._decode(blob), 'timestamp': timestamp}
+            if duration is not None:
+                item['duration'] = duration
+            if soft_duration is not None:
+                item['soft_duration'] = soft_duration
+            if tags:
+                item['tags'] = tuple(tags.split('\n'))
+            return item
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            logger.warning(f"Erreur de lecture du cache partagé pour {key}: {e}")
+            return None
+
+    def set_many(self, items):
+        """
+        Enregistre plusieurs entrées en une transaction
+
+        Args:
+            items (list): Tuples (clé, données, timestamp, durée ou None[, durée souple ou None[, étiquettes]])
+        """
+        try:
+            rows = []
+            tag_rows = []
+            for item in items:
+                tags = item[5] if len(item) > 5 and item[5] else ()
+                rows.append((item[0], self._encode(item[1]), item[2], item[3], item[4] if len(item) > 4 else None,
+                             '\n'.join(tags) or None))
+                tag_rows.extend((tag, item[0]) for tag in tags)
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany(
+                    "INSERT OR REPLACE INTO entries (key, data, timestamp, duration, soft_duration, tags) VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                connection.executemany("DELETE FROM entry_tags WHERE key = ?", [(row[0],) for row in rows])
+                connection.executemany("INSERT OR IGNORE INTO entry_tags (tag, key) VALUES (?, ?)", tag_rows)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Erreur d'écriture dans le cache partagé ({len(items)} entrées): {e}")
+
+    def set(self, key, data, timestamp, duration=None, soft_duration=None, tags=None):
+        """Enregistre une entrée"""
+        self.set_many([(key, data, timestamp, duration, soft_duration, tags)])
+
+    def invalidate(self, pattern=None, exact=False):
+        """
+        Supprime des entrées partagées et publie l'invalidation aux autres workers
+
+        Args:
+            pattern (str): Clé exacte ou motif contenu dans les clés (None pour tout effacer)
+            exact (bool): Interpréter pattern comme une clé exacte
+        """
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                if pattern is None:
+                    connection.execute("DELETE FROM entries")
+                elif exact:
+                    connection.execute("DELETE FROM entries WHERE key = ?", (pattern,))
+                else:
+                    connection.execute("DELETE FROM entries WHERE instr(key, ?) > 0", (pattern,))
+                cursor = connection.execute(
+                    "INSERT INTO invalidations (pattern, exact, created) VALUES (?, ?, ?)",
+                    (pattern, 1 if exact else 0, time.time())
+                )
+            # Une invalidation émise par ce worker est déjà appliquée localement
+            if cursor.lastrowid == self.last_invalidation + 1:
+                self.last_invalidation = cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.warning(f"Erreur d'invalidation du cache partagé (motif {pattern}): {e}")
+
+    def invalidate_tags(self, tags):
+        """
+        Supprime les entrées partagées portant une des étiquettes (via l'index) et publie
+        l'invalidation aux autres workers
+
+        Args:
+            tags (iterable): Étiquettes à invalider
+        """
+        tags = list(tags)
+        try:
+            connection = self._connection()
+            now = time.time()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                for tag in tags:
+                    connection.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag = ?)", (tag,)
+                    )
+                    connection.execute("DELETE FROM entry_tags WHERE tag = ?", (tag,))
+                first = None
+                for tag in tags:
+                    cursor = connection.execute(
+                        "INSERT INTO invalidations (pattern, exact, created, tag) VALUES (?, 0, ?, 1)", (tag, now)
+                    )
+                    first = first or cursor.lastrowid
+            # Des invalidations émises par ce worker sont déjà appliquées localement
+            if first == self.last_invalidation + 1:
+                self.last_invalidation = cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.warning(f"Erreur d'invalidation du cache partagé (étiquettes {tags}): {e}")
+
+    def poll_invalidations(self):
+        """
+        Retourne les invalidations publiées depuis le dernier appel
+
+        Returns:
+            list: Tuples (motif ou None, exact, étiquette)
+        """
+        try:
+            connection = self._connection()
+            rows = connection.execute(
+                "SELECT seq, pattern, exact, tag FROM invalidations WHERE seq > ? ORDER BY seq",
+                (self.last_invalidation,)
+            ).fetchall()
+            if rows:
+                self.last_invalidation = rows[-1][0]
+            self._cleanup(connection)
+            return [(pattern, bool(exact), bool(tag)) for _, pattern, exact, tag in rows]
+        except sqlite3.Error as e:
+            logger.warning(f"Erreur de lecture des invalidations du cache partagé: {e}")
+            return []
+
+    def _cleanup(self, connection):
+        """Supprime périodiquement les entrées expirées et les anciennes invalidations"""
+        now = time.time()
+        if now - self._last_cleanup < self.CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        with connection:
+            connection.execute(
+                "DELETE FROM entries WHERE timestamp + COALESCE(duration, ?) < ?",
+                (self.default_duration, now)
+            )
+            connection.execute("DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)")
+            connection.execute(
+                "DELETE FROM invalidations WHERE created < ?", (now - self.INVALIDATION_RETENTION,)
+            )
+
+
+class CacheSnapshot:
+    """
+    Instantané sur disque des entrées de cache à longue durée de vie (redémarrage à chaud)
+    Chaque worker réécrit périodiquement et de façon atomique son propre fichier (JSON compressé,
+    chemin suffixé par son PID): un worker n'écrase jamais les entrées détenues par les autres.
+    Au démarrage, les fichiers ne sont relus qu'à la première absence d'une clé en cache et fusionnés
+    (la version la plus récente d'une clé l'emporte), puis chaque entrée est reprise à la demande
+    avec son horodatage d'origine: les durées de vie restent respectées.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, min_duration=3600, interval=300):
+        """
+        Args:
+            path (str): Chemin du fichier d'instantané
+            min_duration (int): Durée de vie minimale (secondes) d'une entrée pour être sauvegardée
+            interval (int): Intervalle entre deux sauvegardes en secondes
+        """
+        self.path = path
+        self.min_duration = min_duration
+        self.interval = interval
+        self.lock = threading.Lock()
+        # Entrées de l'instantané pas encore reprises dans le cache (None: fichiers pas encore lus)
+        self._pending = None
+        # Fichiers fusionnés au chargement, avec leur date de modification
+        self._loaded_files = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _is_expired(item, now):
+        return now - item['timestamp'] >= item['duration']
+
+    @property
+    def own_path(self):
+        """Fichier d'instantané de ce worker (PID lu à chaque appel, les workers gunicorn étant forkés)"""
+        return f"{self.path}.{os.getpid()}"
+
+    def _snapshot_files(self):
+        """Fichiers d'instantané de tous les workers, ainsi que l'ancien fichier commun s'il existe"""
+        files = [self.path] if os.path.exists(self.path) else []
+        prefix = f"{self.path}."
+        files.extend(path for path in glob.glob(f"{glob.escape(self.path)}.*") if path[len(prefix):].isdigit())
+        return files
+
+    def _load(self):
+        """Lit et fusionne les fichiers d'instantané une seule fois (verrou tenu)"""
+        if self._pending is not None:
+            return
+        self._pending = {}
+        now = time.time()
+        for path in self._snapshot_files():
+            try:
+                mtime = os.path.getmtime(path)
+                with open(path, 'rb') as f:
+                    snapshot = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+                if snapshot.get('version') != self.FORMAT_VERSION:
+                    logger.warning(f"Instantané de cache ignoré (version {snapshot.get('version')}): {path}")
+                    continue
+                self._loaded_files[path] = mtime
+                for key, item in snapshot.get('entries', {}).items():
+                    current = self._pending.get(key)
+                    if not self._is_expired(item, now) and (current is None or item['timestamp'] > current['timestamp']):
+                        self._pending[key] = item
+            except (OSError, ValueError, zlib.error) as e:
+                logger.error(f"Instantané de cache illisible ({path}): {e}")
+        if self._loaded_files:
+            logger.info(f"Instantané de cache chargé: {len(self._pending)} entrées valides dans {len(self._loaded_files)} fichier(s)")
+
+    @staticmethod
+    def _process_alive(pid):
+        if os.name == 'nt':
+            # os.kill terminerait le processus sous Windows: le considérer vivant
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _remove_orphans(self):
+        """
+        Supprime les fichiers d'instantané des workers arrêtés, une fois leurs entrées fusionnées
+        dans celui de ce worker (seulement s'ils n'ont pas été réécrits depuis leur chargement)
+        """
+        own_path = self.own_path
+        for path, mtime in list(self._loaded_files.items()):
+            if path == own_path:
+                continue
+            suffix = path[len(self.path) + 1:]
+            if suffix.isdigit() and self._process_alive(int(suffix)):
+                continue
+            try:
+                if os.path.getmtime(path) == mtime:
+                    os.remove(path)
+                    logger.info(f"Instantané de cache d'un worker arrêté supprimé: {path}")
+            except OSError:
+                pass
+            del self._loaded_files[path]
+
+    def take(self, key):
+        """
+        Reprend une entrée de l'instantané si elle existe et n'est pas expirée
+
+        Returns:
+            dict: {'data', 'timestamp', 'duration', 'soft_duration'?, 'tags'?} ou None
+        """
+        with self.lock:
+            self._load()
+            item = self._pending.pop(key, None)
+        if item is None or self._is_expired(item, time.time()):
+            return None
+        return item
+
+    def delete_matching(self, predicate):
+        """Oublie les entrées non encore reprises dont la clé vérifie un prédicat"""
+        with self.lock:
+            self._load()
+            for key in [key for key in self._pending if predicate(key)]:
+                del self._pending[key]
+
+    def delete_tagged(self, tags):
+        """Oublie les entrées non encore reprises portant une des étiquettes"""
+        tags = set(tags)
+        with self.lock:
+            self._load()
+            for key in [key for key, item in self._pending.items() if tags.intersection(item.get('tags', ()))]:
+                del self._pending[key]
+
+    def clear(self):
+        """Oublie toutes les entrées non encore reprises"""
+        with self.lock:
+            self._pending = {}
+
+    def save(self, store):
+        """
+        Écrit atomiquement les entrées à longue durée de vie du cache (et celles des instantanés
+        précédents pas encore reprises) dans le fichier d'instantané de ce worker
+
+        Args:
+            store (CacheStore): Cache mémoire à sauvegarder
+
+        Returns:
+            int: Nombre d'entrées sauvegardées
+        """
+        now = time.time()
+        with self.lock:
+            self._load()
+            entries = {key: item for key, item in self._pending.items() if not self._is_expired(item, now)}
+        for key, item in store.items():
+            duration = item.get('duration', store.default_duration)
+            if duration < self.min_duration or store.is_expired(item, now):
+                continue
+            entry = {'data': item['data'], 'timestamp': item['timestamp'], 'duration': duration}
+            if 'soft_duration' in item:
+                entry['soft_duration'] = item['soft_duration']
+            if 'tags' in item:
+                entry['tags'] = list(item['tags'])
+            entries[key] = entry
+
+        blob = zlib.compress(json.dumps({'version': self.FORMAT_VERSION, 'saved': now, 'entries': entries},
+                                        separators=(',', ':')).encode('utf-8'), 1)
+        # Fichier temporaire dans le même répertoire puis renommage: jamais d'instantané tronqué
+        own_path = self.own_path
+        temp_path = f"{own_path}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, own_path)
+        except OSError as e:
+            logger.error(f"Impossible d'écrire l'instantané de cache ({own_path}): {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return 0
+        with self.lock:
+            self._remove_orphans()
+        logger.debug(f"Instantané de cache écrit: {len(entries)} entrées, {len(blob)} octets")
+        return len(entries)
+
+    def start(self, store):
+        """Démarre le thread de sauvegarde périodique du cache"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop_event.wait(self.interval):
+                try:
+                    self.save(store)
+                except Exception as e:
+                    logger.error(f"Erreur lors de la sauvegarde de l'instantané de cache: {e}")
+
+        self._thread = threading.Thread(target=run, name="cache-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self, store=None):
+        """Arrête la sauvegarde périodique, avec une dernière sauvegarde si un cache est fourni"""
+        self._stop_event.set()
+        if store is not None:
+            try:
+                self.save(store)
+            except Exception as e:
+                logger.error(f"Erreur lors de la sauvegarde finale de l'instantané de cache: {e}")
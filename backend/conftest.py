@@ -0,0 +1,7 @@
+"""
+Configuration pytest du backend
+test_problems_api.py est un script manuel qui interroge l'environnement Dynatrace réel: il n'est
+pas collecté par pytest (l'exécuter avec python test_problems_api.py).
+"""
+
+collect_ignore = ["test_problems_api.py"]
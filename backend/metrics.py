@@ -0,0 +1,307 @@
+"""
+Instrumentation du backend
+Registre de métriques en mémoire (compteurs, histogrammes de latence, jauges) alimenté par les
+routes Flask, le cache et les appels sortants vers Dynatrace. Exposé en JSON par /api/performance
+et au format texte Prometheus par /api/metrics.
+Les métriques sont propres à chaque processus: avec plusieurs workers gunicorn, chaque worker
+expose les siennes (identifiées par le label 'worker').
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Bornes (secondes) des histogrammes de latence
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Segment de chemin nommé (ex: 'entities', 'query', 'problems-72h'); les autres sont des identifiants
+NAMED_SEGMENT_PATTERN = re.compile(r'^[a-z][a-zA-Z0-9_\-]*$')
+
+
+def endpoint_type(path):
+    """
+    Type de point de terminaison d'une URL ou d'un chemin Dynatrace, identifiants remplacés par {id}
+    pour borner le nombre de séries (ex: 'entities/HOST-0123...' -> 'entities/{id}')
+
+    Args:
+        path (str): URL complète, chemin ou point de terminaison
+
+    Returns:
+        str: Type de point de terminaison (ex: 'metrics/query')
+    """
+    path = urlparse(path).path if '://' in path else path.split('?', 1)[0]
+    path = path.strip('/')
+    for prefix in ('api/v2/', 'api/v1/', 'api/config/v1/'):
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    segments = [segment if NAMED_SEGMENT_PATTERN.match(segment) else '{id}'
+                for segment in path.split('/') if segment]
+    return '/'.join(segments) or 'root'
+
+
+def key_prefix(cache_key):
+    """
+    Préfixe d'une clé de cache pour les métriques (type de ressource ou point de terminaison)
+
+    Args:
+        cache_key (str): Clé de cache (ex: 'hosts:MZ', 'entities:entitySelector=...')
+
+    Returns:
+        str: Préfixe (ex: 'hosts', 'entities')
+    """
+    return endpoint_type(cache_key.split(':', 1)[0])
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (compteurs par borne, somme et nombre d'observations)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimation d'un quantile par la borne supérieure du seau qui le contient"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def cumulative(self):
+        """Couples (borne, nombre cumulé d'observations), borne +Inf incluse"""
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        result.append((float('inf'), self.count))
+        return result
+
+
+class MetricsRegistry:
+    """
+    Registre thread-safe de compteurs, histogrammes et jauges étiquetés
+    Les jauges sont soit mises à jour directement (gauge_add, in_flight), soit calculées à la lecture
+    par une fonction enregistrée (taille du cache, requêtes en vol...).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._collectors = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        """Associe une description à une métrique (ligne HELP du format Prometheus)"""
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        """Incrémente un compteur"""
+        key = (name, _label_key(labels))
+        with self.lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Ajoute une observation (en secondes pour les latences) à un histogramme"""
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge_add(self, name, value, **labels):
+        """Ajoute une valeur (éventuellement négative) à une jauge"""
+        key = (name, _label_key(labels))
+        with self.lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def register_gauge(self, name, collect, help_text=None):
+        """
+        Enregistre une jauge calculée à la lecture
+
+        Args:
+            name (str): Nom de la jauge
+            collect (callable): Retourne une valeur, ou une liste de couples (labels, valeur)
+            help_text (str, optional): Description de la jauge
+        """
+        self._collectors[name] = collect
+        if help_text:
+            self.describe(name, help_text)
+
+    @contextmanager
+    def in_flight(self, name, **labels):
+        """Maintient une jauge d'opérations en cours pendant l'exécution du bloc"""
+        self.gauge_add(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.gauge_add(name, -1, **labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Mesure la durée du bloc dans un histogramme"""
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start_time, **labels)
+
+    def counter_value(self, name, **labels):
+        """Somme des séries d'un compteur dont les labels contiennent ceux donnés"""
+        wanted = set(_label_key(labels))
+        with self.lock:
+            return sum(value for (counter, label_key), value in self._counters.items()
+                       if counter == name and wanted.issubset(label_key))
+
+    @property
+    def worker(self):
+        """Identifiant du worker (PID lu à chaque appel, les workers gunicorn étant forkés)"""
+        return str(os.getpid())
+
+    def uptime(self):
+        return time.time() - self.started_at
+
+    def _collect_gauges(self):
+        """Jauges directes et calculées, sous la forme {(nom, labels): valeur}"""
+        with self.lock:
+            gauges = dict(self._gauges)
+        for name, collect in list(self._collectors.items()):
+            try:
+                value = collect()
+            except Exception as e:
+                logger.error(f"Erreur lors du calcul de la jauge {name}: {e}")
+                continue
+            if isinstance(value, (list, tuple)):
+                for labels, sample in value:
+                    gauges[(name, _label_key(labels))] = sample
+            else:
+                gauges[(name, ())] = value
+        return gauges
+
+    def snapshot(self):
+        """
+        Retourne l'ensemble des métriques en structure JSON
+
+        Returns:
+            dict: Compteurs, histogrammes (nombre, somme, moyenne, p50/p95/p99) et jauges par nom
+        """
+        with self.lock:
+            counters = dict(self._counters)
+            histograms = {key: (histogram.count, histogram.sum, histogram.quantile(0.5),
+                                histogram.quantile(0.95), histogram.quantile(0.99))
+                          for key, histogram in self._histograms.items()}
+        gauges = self._collect_gauges()
+
+        result = {'worker': self.worker, 'uptime': round(self.uptime(), 2),
+                  'counters': {}, 'histograms': {}, 'gauges': {}}
+        for (name, label_key), value in sorted(counters.items()):
+            result['counters'].setdefault(name, []).append({'labels': dict(label_key), 'value': value})
+        for (name, label_key), (count, total, p50, p95, p99) in sorted(histograms.items()):
+            result['histograms'].setdefault(name, []).append({
+                'labels': dict(label_key),
+                'count': count,
+                'sum': round(total, 6),
+                'avg': round(total / count, 6) if count else None,
+                'p50': p50, 'p95': p95, 'p99': p99
+            })
+        for (name, label_key), value in sorted(gauges.items()):
+            result['gauges'].setdefault(name, []).append({'labels': dict(label_key), 'value': value})
+        return result
+
+    def render_prometheus(self):
+        """
+        Retourne l'ensemble des métriques au format texte d'exposition Prometheus
+
+        Returns:
+            str: Exposition Prometheus (version 0.0.4)
+        """
+        with self.lock:
+            counters = dict(self._counters)
+            histograms = {key: (histogram.cumulative(), histogram.sum, histogram.count)
+                          for key, histogram in self._histograms.items()}
+        gauges = self._collect_gauges()
+        gauges[('process_uptime_seconds', ())] = self.uptime()
+
+        worker = (('worker', self.worker),)
+        lines = []
+
+        def header(name, kind, emitted):
+            if (name, kind) in emitted:
+                return
+            emitted.add((name, kind))
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        emitted = set()
+        for (name, label_key), value in sorted(counters.items()):
+            header(name, 'counter', emitted)
+            lines.append(f"{name}{_format_labels(label_key + worker)} {_format_value(value)}")
+        for (name, label_key), (buckets, total, count) in sorted(histograms.items()):
+            header(name, 'histogram', emitted)
+            for bound, cumulative in buckets:
+                le = (('le', '+Inf' if bound == float('inf') else repr(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(label_key + worker + le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_key + worker)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(label_key + worker)} {count}")
+        for (name, label_key), value in sorted(gauges.items()):
+            header(name, 'gauge', emitted)
+            lines.append(f"{name}{_format_labels(label_key + worker)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(label_key):
+    if not label_key:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in label_key)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(label_key, escaped)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+# Registre partagé par tout le processus
+metrics = MetricsRegistry()
+metrics.describe('http_requests_total', "Requêtes reçues par route et statut HTTP")
+metrics.describe('http_request_duration_seconds', "Latence des routes Flask")
+metrics.describe('http_requests_in_flight', "Requêtes Flask en cours de traitement")
+metrics.describe('function_duration_seconds', "Durée des fonctions décorées par time_execution")
+metrics.describe('cache_requests_total', "Consultations du cache par préfixe de clé et résultat (hit, stale, miss)")
+metrics.describe('cache_evictions_total', "Entrées retirées du cache mémoire par préfixe de clé et motif (lru, expired)")
+metrics.describe('dynatrace_requests_total', "Appels sortants vers Dynatrace par type de point de terminaison et statut")
+metrics.describe('dynatrace_request_duration_seconds', "Latence des appels sortants vers Dynatrace")
+metrics.describe('dynatrace_requests_in_flight', "Appels sortants vers Dynatrace en cours")
+metrics.describe('process_uptime_seconds', "Durée depuis le démarrage du worker")
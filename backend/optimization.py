@@ -4,17 +4,25 @@ Ce module fournit des fonctions pour améliorer les performances des requêtes A
 en utilisant des techniques comme les requêtes parallèles et la mise en cache intelligente.
 """
 import asyncio
+import atexit
+import collections
 import time
 import concurrent.futures
 import threading
+import email.utils
 import requests
 import urllib3
+from urllib.parse import quote
 from functools import wraps
 from datetime import datetime, timedelta
 import logging
 import os
 import re
 
+from cache_store import CacheStore, cache_tags, mz_tag, alias_tag
+from metrics import metrics, endpoint_type, key_prefix
+from problem_store import relative_time_ms
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -22,10 +30,460 @@ logger = logging.getLogger(__name__)
 # Désactiver les avertissements SSL si nécessaire
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+class AdaptiveConcurrencyLimiter:
+    """
+    Limiteur de concurrence adaptatif de type AIMD (additive increase / multiplicative decrease)
+    
+    La limite augmente d'environ une unité par fenêtre de requêtes tant que la latence (p95) reste
+    stable, et diminue de façon multiplicative dès que Dynatrace répond 429/5xx, qu'une erreur
+    réseau survient ou que le p95 dépasse nettement la latence de référence.
+    """
+    
+    def __init__(self, initial_limit=10, min_limit=2, max_limit=100, window_size=50,
+                 latency_tolerance=2.0, min_latency_delta=0.25, backoff_ratio=0.7):
+        """
+        Args:
+            initial_limit (int): Nombre de requêtes simultanées autorisées au démarrage
+            min_limit (int): Limite plancher
+            max_limit (int): Limite plafond
+            window_size (int): Nombre de latences conservées pour le calcul du p95
+            latency_tolerance (float): Ratio p95 / p95 de référence au-delà duquel on réduit la limite
+            min_latency_delta (float): Écart absolu minimal (secondes) entre p95 et référence pour réduire
+            backoff_ratio (float): Facteur multiplicatif appliqué à la limite lors d'une réduction
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.window_size = window_size
+        self.latency_tolerance = latency_tolerance
+        self.min_latency_delta = min_latency_delta
+        self.backoff_ratio = backoff_ratio
+        
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._latencies = collections.deque(maxlen=window_size)
+        self._baseline_p95 = None
+        self._samples_since_decrease = window_size
+    
+    @property
+    def limit(self):
+        """Limite de concurrence courante (entière)"""
+        return max(self.min_limit, int(self._limit))
+    
+    @property
+    def in_flight(self):
+        """Nombre de requêtes actuellement en vol"""
+        return self._in_flight
+    
+    def acquire(self):
+        """Attend une place libre (appel bloquant, pour les threads)"""
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+    
+    def release(self):
+        """Libère une place"""
+        with self._condition:
+            self._in_flight -= 1
+            self._wake_waiters()
+    
+    def _wake_waiters(self):
+        """Réveille les threads en attente d'une place (à appeler avec le verrou)"""
+        self._condition.notify_all()
+    
+    def record(self, latency, status=None, error=False):
+        """
+        Enregistre le résultat d'une requête et ajuste la limite
+        
+        Args:
+            latency (float): Durée de la requête en secondes
+            status (int): Code HTTP de la réponse (None si aucune réponse)
+            error (bool): True pour une erreur réseau ou un timeout
+        """
+        with self._condition:
+            self._samples_since_decrease += 1
+            
+            if error or status == 429 or (status is not None and status >= 500):
+                self._decrease(f"statut {status}" if status else "erreur réseau")
+                return
+            
+            self._latencies.append(latency)
+            if len(self._latencies) < min(10, self.window_size):
+                return
+            
+            p95 = self._percentile(95)
+            if self._baseline_p95 is None or p95 < self._baseline_p95:
+                self._baseline_p95 = p95
+            elif (p95 > self._baseline_p95 * self.latency_tolerance
+                  and p95 - self._baseline_p95 > self.min_latency_delta):
+                self._decrease(f"p95 {p95:.2f}s > référence {self._baseline_p95:.2f}s")
+                return
+            else:
+                # Laisser la référence suivre lentement une dérive durable de la latence
+                self._baseline_p95 = self._baseline_p95 * 0.99 + p95 * 0.01
+            
+            # Augmentation additive: environ +1 par "limite" réponses saines
+            previous_limit = self.limit
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            if self.limit > previous_limit:
+                self._wake_waiters()
+    
+    def _decrease(self, reason):
+        """Réduction multiplicative, au plus une fois par demi-fenêtre pour ne pas réagir à la même rafale"""
+        if self._samples_since_decrease < max(1, self.window_size // 2):
+            return
+        previous_limit = self.limit
+        self._limit = max(float(self.min_limit), self._limit * self.backoff_ratio)
+        self._latencies.clear()
+        self._samples_since_decrease = 0
+        logger.warning(f"Concurrence réduite de {previous_limit} à {self.limit} ({reason})")
+    
+    def _percentile(self, percentile):
+        values = sorted(self._latencies)
+        index = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+        return values[index]
+    
+    def stats(self):
+        """Retourne l'état courant du limiteur"""
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'baseline_p95': round(self._baseline_p95, 3) if self._baseline_p95 is not None else None,
+                'p95': round(self._percentile(95), 3) if self._latencies else None
+            }
+
+
+class RateLimitBucket:
+    """
+    Seau à jetons côté client calé sur les en-têtes de limitation de débit de Dynatrace
+    
+    Chaque requête sortante réserve un jeton via reserve(), qui retourne le délai à respecter
+    avant l'envoi. Le débit et le budget restant sont appris des en-têtes X-RateLimit-Limit
+    (requêtes par minute), X-RateLimit-Remaining et X-RateLimit-Reset; un 429 suspend tous les
+    envois jusqu'à l'échéance indiquée par Retry-After (ou X-RateLimit-Reset).
+    """
+    
+    def __init__(self, requests_per_minute=None):
+        """
+        Args:
+            requests_per_minute (int): Débit initial (None: illimité jusqu'à réception des en-têtes)
+        """
+        self._lock = threading.Lock()
+        self._rate = None
+        self._capacity = None
+        self._tokens = 0.0
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        if requests_per_minute:
+            self._set_limit(float(requests_per_minute))
+            self._tokens = self._capacity
+    
+    def _set_limit(self, requests_per_minute):
+        self._rate = requests_per_minute / 60.0
+        self._capacity = max(1.0, requests_per_minute)
+    
+    def _refill(self, now):
+        """Ajoute les jetons accumulés depuis le dernier remplissage (pas pendant une suspension)"""
+        start = max(self._last_refill, self._blocked_until)
+        if self._rate is not None and now > start:
+            self._tokens = min(self._capacity, self._tokens + (now - start) * self._rate)
+        self._last_refill = now
+    
+    def reserve(self):
+        """
+        Réserve un jeton pour une requête
+        
+        Returns:
+            float: Délai en secondes à attendre avant d'envoyer la requête
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(0.0, self._blocked_until - now)
+            if self._rate is None:
+                return delay
+            # Les jetons peuvent devenir négatifs: la dette correspond à la file d'attente
+            self._tokens -= 1
+            if self._tokens < 0:
+                delay += -self._tokens / self._rate
+            return delay
+    
+    def wait(self):
+        """Attend (de façon bloquante) le droit d'envoyer une requête"""
+        delay = self.reserve()
+        if delay > 0:
+            logger.info(f"Limitation de débit Dynatrace: attente de {delay:.2f}s avant la requête")
+            time.sleep(delay)
+    
+    @staticmethod
+    def _parse_reset(value):
+        """Convertit X-RateLimit-Reset (µs, ms ou s depuis epoch, ou délai en s) en délai en secondes"""
+        reset = float(value)
+        if reset > 1e14:
+            reset /= 1e6
+        elif reset > 1e11:
+            reset /= 1e3
+        elif reset < 1e9:
+            return max(0.0, reset)
+        return max(0.0, reset - time.time())
+    
+    @staticmethod
+    def _parse_retry_after(value):
+        """Convertit Retry-After (secondes ou date HTTP) en délai en secondes"""
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_date = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_date.timestamp() - time.time())
+    
+    def update_from_headers(self, headers, status=None):
+        """
+        Met à jour le seau à partir des en-têtes d'une réponse Dynatrace
+        
+        Args:
+            headers: En-têtes de la réponse
+            status (int): Code HTTP de la réponse
+        """
+        try:
+            limit = headers.get('X-RateLimit-Limit')
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset = headers.get('X-RateLimit-Reset')
+            retry_after = headers.get('Retry-After')
+            
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                
+                if limit:
+                    requests_per_minute = float(limit)
+                    if self._rate is None:
+                        self._set_limit(requests_per_minute)
+                        self._tokens = self._capacity
+                    elif abs(requests_per_minute / 60.0 - self._rate) > 1e-9:
+                        self._set_limit(requests_per_minute)
+                        self._tokens = min(self._tokens, self._capacity)
+                
+                if remaining is not None and self._rate is not None:
+                    self._tokens = min(self._tokens, float(remaining))
+                
+                pause = None
+                if status == 429:
+                    if retry_after:
+                        pause = self._parse_retry_after(retry_after)
+                    elif reset:
+                        pause = self._parse_reset(reset)
+                    else:
+                        pause = 1.0
+                elif remaining is not None and float(remaining) <= 0 and reset:
+                    pause = self._parse_reset(reset)
+                
+                if pause is not None:
+                    self._blocked_until = max(self._blocked_until, now + pause)
+                    self._tokens = min(self._tokens, 0.0)
+                    logger.warning(f"Limite de débit Dynatrace atteinte: envois suspendus pendant {pause:.1f}s")
+        except (TypeError, ValueError) as e:
+            logger.debug(f"En-têtes de limitation de débit illisibles: {e}")
+    
+    def stats(self):
+        """Retourne l'état courant du seau"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'requests_per_minute': round(self._rate * 60) if self._rate is not None else None,
+                'tokens': round(self._tokens, 1) if self._rate is not None else None,
+                'blocked_for': round(max(0.0, self._blocked_until - time.monotonic()), 1)
+            }
+
+
+# Paramètres dont l'ordre des éléments séparés par des virgules est indifférent pour Dynatrace
+UNORDERED_LIST_PARAMS = ('fields',)
+# Sélecteurs dont les espaces autour des virgules (hors chaînes entre guillemets) sont sans effet
+SELECTOR_PARAMS = ('entitySelector', 'metricSelector', 'problemSelector')
+# Bornes temporelles relatives: "now-72h" et "-72h" désignent la même fenêtre
+TIME_PARAMS = ('from', 'to')
+# Longueur maximale (encodée dans l'URL) d'un sélecteur de problèmes multi-MZ; le reste de l'URL
+# (hôte, chemin, autres paramètres) reste ainsi loin des limites usuelles des proxys (~8 Ko)
+MAX_SELECTOR_URL_LENGTH = 4000
+
+
+def _normalize_selector(selector):
+    """Supprime les espaces autour des virgules hors chaînes entre guillemets"""
+    result = []
+    in_quotes = False
+    escaped = False
+    for char in selector:
+        if in_quotes:
+            result.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_quotes = False
+            continue
+        if char == '"':
+            in_quotes = True
+        elif char == ' ' and result and result[-1] == ',':
+            continue
+        elif char == ',':
+            while result and result[-1] == ' ':
+                result.pop()
+        result.append(char)
+    return ''.join(result)
+
+
+def canonical_query_key(endpoint, params=None):
+    """
+    Clé de cache canonique d'une requête Dynatrace: point de terminaison et paramètres triés,
+    valeurs normalisées. Deux appels posant la même question à l'API obtiennent la même clé,
+    quel que soit l'ordre d'insertion des paramètres ou l'appelant.
+    
+    Args:
+        endpoint (str): Point de terminaison de l'API (ex: "metrics/query")
+        params (dict): Paramètres de requête
+        
+    Returns:
+        str: Clé "endpoint:nom=valeur&nom=valeur" (le préfixe reste le point de terminaison)
+    """
+    endpoint = endpoint.strip('/')
+    if endpoint.startswith('api/v2/'):
+        endpoint = endpoint[len('api/v2/'):]
+    
+    normalized = []
+    for name, value in (params or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (list, tuple, set)):
+            value = ','.join(str(item).strip() for item in value)
+        else:
+            value = str(value).strip()
+        
+        if name in SELECTOR_PARAMS:
+            value = _normalize_selector(value)
+        elif name in UNORDERED_LIST_PARAMS:
+            value = ','.join(sorted(item.strip() for item in value.split(',') if item.strip()))
+        elif name in TIME_PARAMS and value.startswith('now-'):
+            value = value[len('now'):]
+        elif name == 'totalCount':
+            value = value.lower()
+        normalized.append((name, value))
+    
+    return f"{endpoint}:{'&'.join(f'{name}={value}' for name, value in sorted(normalized))}"
+
+
+def mz_problem_selector(mz_names):
+    """
+    Sélecteur de problèmes managementZones("a","b",...) pour une ou plusieurs MZ
+    
+    Args:
+        mz_names (iterable): Noms des Management Zones
+        
+    Returns:
+        str: Sélecteur, guillemets doubles échappés
+    """
+    quoted = []
+    for mz_name in mz_names:
+        escaped_mz_name = mz_name.replace('"', '\\"')
+        quoted.append(f'"{escaped_mz_name}"')
+    return f"managementZones({','.join(quoted)})"
+
+
+def plan_mz_selectors(mz_names, max_length=MAX_SELECTOR_URL_LENGTH):
+    """
+    Regroupe des MZ en aussi peu de sélecteurs managementZones(...) que la longueur d'URL le permet
+    L'ordre des MZ est conservé; une MZ dont le nom dépasse à lui seul la limite forme son propre lot.
+    
+    Args:
+        mz_names (iterable): Noms des Management Zones
+        max_length (int): Longueur maximale d'un sélecteur une fois encodé dans l'URL
+        
+    Returns:
+        list: Sélecteurs de problèmes
+    """
+    selectors = []
+    batch = []
+    for mz_name in dict.fromkeys(mz_names):
+        candidate = mz_problem_selector(batch + [mz_name])
+        if batch and len(quote(candidate, safe='')) > max_length:
+            selectors.append(mz_problem_selector(batch))
+            batch = [mz_name]
+        else:
+            batch.append(mz_name)
+    if batch:
+        selectors.append(mz_problem_selector(batch))
+    return selectors
+
+
+class TimeWindow:
+    """
+    Fenêtre temporelle relative ("dernières 24h", "dernières 30 min") alignée sur un pas de temps
+    La fin de la fenêtre est arrondie au pas inférieur: tous les appels d'un même pas produisent
+    les mêmes bornes, donc les mêmes clés de cache et les mêmes résultats Dynatrace.
+    """
+    
+    # Nombre cible de pas par fenêtre pour déduire le pas par défaut (5 min pour 24h)
+    BUCKETS_PER_WINDOW = 288
+    MIN_BUCKET_SECONDS = 60
+    
+    def __init__(self, duration, bucket=None, now=None):
+        """
+        Args:
+            duration (timedelta): Durée de la fenêtre
+            bucket (timedelta): Pas d'alignement (défaut: durée / 288, au moins 1 minute)
+            now (float): Instant de référence en secondes (défaut: maintenant)
+        """
+        self.duration_seconds = int(duration.total_seconds())
+        if bucket is None:
+            self.bucket_seconds = max(self.MIN_BUCKET_SECONDS, self.duration_seconds // self.BUCKETS_PER_WINDOW)
+        else:
+            self.bucket_seconds = max(1, int(bucket.total_seconds()))
+        
+        now = time.time() if now is None else now
+        end = int(now // self.bucket_seconds) * self.bucket_seconds
+        self.to_time = end * 1000
+        self.from_time = (end - self.duration_seconds) * 1000
+    
+    @classmethod
+    def last(cls, hours=0, minutes=0, bucket=None):
+        """Construit la fenêtre des dernières heures/minutes alignée sur son pas"""
+        return cls(timedelta(hours=hours, minutes=minutes), bucket=bucket)
+    
+    @property
+    def expires_in(self):
+        """Secondes restantes avant que la fenêtre ne passe au pas suivant"""
+        return max(0, self.to_time / 1000 + self.bucket_seconds - time.time())
+    
+    @property
+    def key(self):
+        """Fragment de clé de cache identifiant la fenêtre"""
+        return f"{self.from_time}:{self.to_time}"
+    
+    def __repr__(self):
+        return f"TimeWindow({self.duration_seconds}s, pas={self.bucket_seconds}s, {self.key})"
+
+
 class OptimizedAPIClient:
     """Client API optimisé pour Dynatrace avec support de requêtes parallèles et cache intelligent"""
     
-    def __init__(self, env_url, api_token, verify_ssl=False, max_workers=20, max_connections=50, cache_duration=300):
+    # Champs demandés par type d'entité pour alimenter le stock de métadonnées
+    ENTITY_FIELDS = {
+        "HOST": "+properties.osType,+properties.osVersion,+properties.kernelVersion,+properties.monitoringState,+tags",
+        "SERVICE": "+properties.softwareTechnologies,+properties.monitoringState,+tags",
+        "PROCESS_GROUP": "+properties.softwareTechnologies,+tags"
+    }
+    DEFAULT_ENTITY_FIELDS = "+properties,+tags"
+    # Découpage des longues périodes de problèmes: une tranche par 24h, 8 tranches parallèles au plus
+    PROBLEM_SHARD_SPAN = 24 * 3600
+    PROBLEM_MAX_SHARDS = 8
+    
+    def __init__(self, env_url, api_token, verify_ssl=False, max_workers=20, max_connections=50, cache_duration=300,
+                 rate_limit_per_minute=None, max_rate_limit_retries=3,
+                 entity_cache_duration=3600, cache_max_bytes=512 * 1024 * 1024, shared_cache=None,
+                 snapshot=None):
         """
         Initialise un client API optimisé
         
@@ -36,6 +494,12 @@ class OptimizedAPIClient:
             max_workers (int): Nombre maximum de workers parallèles
             max_connections (int): Nombre maximum de connexions HTTP simultanées
             cache_duration (int): Durée de vie du cache en secondes
+            rate_limit_per_minute (int): Débit initial autorisé par Dynatrace (None: appris des en-têtes)
+            max_rate_limit_retries (int): Nombre de nouvelles tentatives après une réponse 429
+            entity_cache_duration (int): Durée de vie des métadonnées d'entités en secondes
+            cache_max_bytes (int): Budget mémoire du cache en octets (éviction LRU au-delà)
+            shared_cache: Second niveau de cache partagé entre workers (ex: SQLiteSharedCache), optionnel
+            snapshot: Instantané sur disque des entrées à longue durée de vie (ex: CacheSnapshot), optionnel
         """
         self.env_url = env_url
         self.api_token = api_token
@@ -43,14 +507,23 @@ class OptimizedAPIClient:
         self.max_workers = max_workers
         self.max_connections = max_connections
         self.cache_duration = cache_duration
-        self.cache = {}
-        self.cache_lock = threading.Lock()
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.entity_cache_duration = entity_cache_duration
+        # Cache borné en octets avec éviction LRU et purge des entrées expirées en arrière-plan
+        self.cache = CacheStore(max_bytes=cache_max_bytes, default_duration=cache_duration)
+        self.shared_cache = shared_cache
+        self._invalidation_check = 0
+        # Sauvegarde périodique des entrées longues sur disque, reprises à la demande après un redémarrage
+        self.snapshot = snapshot
+        if self.snapshot is not None:
+            self.snapshot.start(self.cache)
         
         # Configuration avancée des retries
+        # Les 429 sont exclus: ils sont gérés par le seau à jetons (Retry-After / X-RateLimit-*)
         retry_strategy = requests.adapters.Retry(
             total=5,  # Nombre max de retries
             backoff_factor=0.5,  # Facteur pour le délai exponentiel
-            status_forcelist=[408, 429, 500, 502, 503, 504],  # Statuts HTTP qui déclenchent un retry
+            status_forcelist=[408, 500, 502, 503, 504],  # Statuts HTTP qui déclenchent un retry
             allowed_methods=["GET"]  # Méthodes HTTP qui déclenchent un retry
         )
         
@@ -75,50 +548,185 @@ class OptimizedAPIClient:
         # Définir un timeout par défaut plus long
         self.default_timeout = (30, 120)  # (connect timeout, read timeout)
         
-        # Utiliser des sémaphores pour contrôler l'accès aux ressources
-        self.semaphore = threading.BoundedSemaphore(value=self.max_connections)
+        # Seau à jetons partagé par toutes les requêtes sortantes (y compris les appels directs de app.py)
+        self.rate_limit = RateLimitBucket(rate_limit_per_minute)
+        
+        # Exécuteur partagé et durable pour les requêtes en parallèle (au lieu d'un pool par lot)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="dynatrace-api"
+        )
+        
+        # Limiteur de concurrence adaptatif partagé par toutes les requêtes sortantes
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=max(2, self.max_connections // 2),
+            min_limit=2,
+            max_limit=self.max_connections
+        )
         
         # Ajouter un compteur de requêtes pour le monitoring
         self.request_count = 0
         self.request_count_lock = threading.Lock()
         
+        # Requêtes en vol indexées par clé de cache (single-flight): les appels concurrents
+        # identiques attendent le résultat de la première requête au lieu de la dupliquer
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        
+        atexit.register(self.close)
+        
         logger.info(f"Client API initialisé avec {max_workers} workers et {max_connections} connexions maximales")
     
     def get_cached(self, cache_key):
-        """Récupère une valeur du cache si elle existe et n'est pas expirée"""
-        with self.cache_lock:
-            if cache_key in self.cache:
-                item = self.cache[cache_key]
-                
-                # Déterminer la durée de cache à utiliser (personnalisée ou standard)
-                cache_duration = item.get('duration', self.cache_duration)
-                
-                # Vérifier si le cache est encore valide
-                current_time = time.time()
-                cache_age = current_time - item['timestamp']
-                
-                if cache_age < cache_duration:
-                    # Si c'est un cache persistant, ajouter un log informatif
-                    if 'duration' in item and cache_key.startswith('persistent_'):
-                        logger.info(f"Hit du cache persistant pour {cache_key} (âge: {cache_age/60:.1f}min, expiration: {(cache_duration-cache_age)/60:.1f}min)")
-                    else:
-                        logger.debug(f"Cache hit for {cache_key}")
-                    return item['data']
-                else:
-                    logger.debug(f"Cache expiré pour {cache_key} (âge: {cache_age/60:.1f}min > durée: {cache_duration/60:.1f}min)")
+        """
+        Récupère une valeur du cache si elle existe et n'est pas expirée
+        Le cache mémoire du worker est consulté en premier, puis le cache partagé entre workers.
+        Une entrée servie en stale-while-revalidate est considérée expirée dès son TTL souple.
+        """
+        entry = self.get_cached_entry(cache_key)
+        if entry is None or entry['stale']:
+            logger.debug(f"Cache miss for {cache_key}")
+            return None
+        return entry['data']
+
+    def get_cached_entry(self, cache_key):
+        """
+        Récupère une entrée du cache avec ses métadonnées de fraîcheur
         
-        logger.debug(f"Cache miss for {cache_key}")
-        return None
+        Args:
+            cache_key (str): Clé de cache
+            
+        Returns:
+            dict: {'data', 'timestamp', 'age', 'stale'} ou None si absente ou au-delà du TTL dur
+        """
+        self._sync_invalidations()
+        item = self.cache.get(cache_key)
+        current_time = time.time()
+        level = 'memory'
+        if item is not None:
+            # Déterminer la durée de cache à utiliser (personnalisée ou standard)
+            cache_duration = item.get('duration', self.cache_duration)
+            
+            # Vérifier si le cache est encore valide
+            cache_age = current_time - item['timestamp']
+            
+            if cache_age >= cache_duration:
+                logger.debug(f"Cache expiré pour {cache_key} (âge: {cache_age/60:.1f}min > durée: {cache_duration/60:.1f}min)")
+                item = None
+            elif 'duration' in item and cache_key.startswith('persistent_'):
+                # Si c'est un cache persistant, ajouter un log informatif
+                logger.info(f"Hit du cache persistant pour {cache_key} (âge: {cache_age/60:.1f}min, expiration: {(cache_duration-cache_age)/60:.1f}min)")
+            else:
+                logger.debug(f"Cache hit for {cache_key}")
+        
+        # Second niveau: une valeur calculée par un autre worker du nœud. Une entrée locale périmée
+        # est aussi comparée au second niveau, où le worker leader publie ses rafraîchissements planifiés
+        local_stale = (item is not None and item.get('soft_duration') is not None
+                       and current_time - item['timestamp'] >= item['soft_duration'])
+        if (item is None or local_stale) and self.shared_cache is not None:
+            shared_item = self.shared_cache.get(cache_key)
+            if shared_item is not None and (item is None or shared_item['timestamp'] > item['timestamp']):
+                logger.debug(f"Cache partagé hit for {cache_key}")
+                item = shared_item
+                level = 'shared'
+                self.cache.set(cache_key, item['data'], duration=item.get('duration'),
+                               timestamp=item['timestamp'], soft_duration=item.get('soft_duration'),
+                               tags=item.get('tags'))
+        
+        # Dernier recours: l'instantané sur disque écrit avant le redémarrage du worker
+        if item is None and self.snapshot is not None:
+            item = self.snapshot.take(cache_key)
+            if item is not None:
+                logger.info(f"Entrée {cache_key} reprise de l'instantané de cache")
+                level = 'snapshot'
+                self.cache.set(cache_key, item['data'], duration=item['duration'],
+                               timestamp=item['timestamp'], soft_duration=item.get('soft_duration'),
+                               tags=item.get('tags'))
+        
+        if item is None:
+            metrics.inc('cache_requests_total', prefix=key_prefix(cache_key), result='miss', level='none')
+            return None
+        
+        age = current_time - item['timestamp']
+        soft_duration = item.get('soft_duration')
+        stale = soft_duration is not None and age >= soft_duration
+        metrics.inc('cache_requests_total', prefix=key_prefix(cache_key), result='stale' if stale else 'hit', level=level)
+        return {
+            'data': item['data'],
+            'timestamp': item['timestamp'],
+            'age': age,
+            'stale': stale
+        }
 
-    def set_cache(self, cache_key, data):
-        """Met à jour le cache avec de nouvelles données avec la durée standard"""
-        with self.cache_lock:
-            self.cache[cache_key] = {
-                'data': data,
-                'timestamp': time.time()
-            }
+    def set_cache(self, cache_key, data, stale_ttl=None, tags=None, shared=False):
+        """
+        Met à jour le cache avec de nouvelles données avec la durée standard
+        
+        Args:
+            cache_key (str): Clé de cache
+            data: Données à mettre en cache
+            stale_ttl (int): Durée supplémentaire pendant laquelle l'entrée reste servable en
+                             stale-while-revalidate après la durée standard (None: pas de période stale)
+            tags (list): Étiquettes supplémentaires (ex: mz_tag de la MZ courante), en plus de
+                         celles déduites de la clé (type de ressource, MZ et entités des sélecteurs)
+            shared (bool): Publier aussi l'entrée dans le cache partagé entre workers
+        """
+        if stale_ttl:
+            self._store_cache(cache_key, data, duration=self.cache_duration + stale_ttl,
+                              soft_duration=self.cache_duration, tags=tags, shared=shared)
+        else:
+            self._store_cache(cache_key, data, tags=tags, shared=shared)
     
-    def set_persistent_cache(self, cache_key, data, duration=14400):
+    def _store_cache(self, cache_key, data, duration=None, soft_duration=None, tags=None, shared=False):
+        """
+        Écrit une entrée étiquetée dans le cache mémoire, et dans le cache partagé si demandé
+        Chaque écriture partagée prend le verrou d'écriture SQLite commun à tous les workers: seules
+        les réponses de routes et les agrégats coûteux y sont publiés, les résultats de requêtes, pages
+        et entités restent propres au worker.
+        """
+        timestamp = time.time()
+        tags = cache_tags(cache_key, tags)
+        self.cache.set(cache_key, data, duration=duration, timestamp=timestamp, soft_duration=soft_duration, tags=tags)
+        if shared and self.shared_cache is not None:
+            self.shared_cache.set(cache_key, data, timestamp, duration, soft_duration, tags)
+
+    def delete_cached(self, cache_key):
+        """Supprime une entrée du cache de tous les workers, ainsi que les entrées canoniques dont elle est l'alias"""
+        self.cache.pop(cache_key, None)
+        self.cache.delete_tagged([alias_tag(cache_key)])
+        if self.snapshot is not None:
+            self.snapshot.delete_matching(lambda key: key == cache_key)
+            self.snapshot.delete_tagged([alias_tag(cache_key)])
+        if self.shared_cache is not None:
+            self.shared_cache.invalidate(cache_key, exact=True)
+            self.shared_cache.invalidate_tags([alias_tag(cache_key)])
+
+    def _sync_invalidations(self, min_interval=1.0):
+        """Applique au cache mémoire les invalidations publiées par les autres workers (au plus une fois par seconde)"""
+        if self.shared_cache is None:
+            return
+        now = time.time()
+        if now - self._invalidation_check < min_interval:
+            return
+        self._invalidation_check = now
+        for pattern, exact, tag in self.shared_cache.poll_invalidations():
+            if tag:
+                self.cache.delete_tagged([pattern])
+            elif pattern is None:
+                self.cache.clear()
+            elif exact:
+                self.cache.pop(pattern, None)
+            else:
+                self.cache.delete_matching(lambda key: pattern in key)
+            if self.snapshot is not None:
+                if tag:
+                    self.snapshot.delete_tagged([pattern])
+                elif pattern is None:
+                    self.snapshot.clear()
+                else:
+                    self.snapshot.delete_matching(lambda key: key == pattern if exact else pattern in key)
+    
+    def set_persistent_cache(self, cache_key, data, duration=14400, tags=None, shared=False):
         """
         Met à jour le cache avec une durée personnalisée plus longue
         Utile pour les données qui changent rarement (services, process groups)
@@ -127,20 +735,17 @@ class OptimizedAPIClient:
             cache_key (str): Clé de cache
             data: Données à mettre en cache
             duration (int): Durée de vie du cache en secondes (défaut: 4 heures)
+            tags (list): Étiquettes supplémentaires (ex: mz_tag de la MZ)
+            shared (bool): Publier aussi l'entrée dans le cache partagé entre workers
         """
-        with self.cache_lock:
-            self.cache[cache_key] = {
-                'data': data,
-                'timestamp': time.time(),
-                'duration': duration  # Durée personnalisée
-            }
-            logger.info(f"Données mises en cache persistant ({duration/3600}h) pour la clé {cache_key}")
-            
-            # Log de debug pour la taille des données
-            if isinstance(data, list):
-                logger.info(f"Taille des données en cache: {len(data)} éléments pour {cache_key}")
-            elif isinstance(data, dict):
-                logger.info(f"Données en cache: dictionnaire avec {len(data)} clés pour {cache_key}")
+        self._store_cache(cache_key, data, duration=duration, tags=tags, shared=shared)  # Durée personnalisée
+        logger.info(f"Données mises en cache persistant ({duration/3600}h) pour la clé {cache_key}")
+        
+        # Log de debug pour la taille des données
+        if isinstance(data, list):
+            logger.info(f"Taille des données en cache: {len(data)} éléments pour {cache_key}")
+        elif isinstance(data, dict):
+            logger.info(f"Données en cache: dictionnaire avec {len(data)} clés pour {cache_key}")
 
     def clear_cache(self, pattern=None):
         """
@@ -149,64 +754,153 @@ class OptimizedAPIClient:
         Args:
             pattern (str): Motif pour effacer sélectivement le cache (None pour tout effacer)
         """
-        with self.cache_lock:
+        if pattern:
+            self.cache.delete_matching(lambda key: pattern in key)
+        else:
+            self.cache.clear()
+        # Ne pas laisser un redémarrage ressusciter des entrées effacées
+        if self.snapshot is not None:
             if pattern:
-                keys_to_delete = [key for key in self.cache if pattern in key]
-                for key in keys_to_delete:
-                    del self.cache[key]
+                self.snapshot.delete_matching(lambda key: pattern in key)
             else:
-                self.cache.clear()
+                self.snapshot.clear()
+        # Propager l'invalidation aux autres workers via le cache partagé
+        if self.shared_cache is not None:
+            self.shared_cache.invalidate(pattern or None)
         logger.info(f"Cache cleared. Pattern: {pattern}")
     
-    # Ajouter une méthode pour gérer les requêtes avec sémaphore
+    def invalidate_tags(self, *tags):
+        """
+        Invalide les entrées portant une des étiquettes, dans ce worker et dans tous les autres
+        Passe par l'index des étiquettes: le coût est proportionnel au nombre d'entrées concernées,
+        contrairement à clear_cache(pattern) qui parcourt toutes les clés.
+        
+        Args:
+            *tags (str): Étiquettes à invalider (mz_tag, resource_tag, entity_tag)
+            
+        Returns:
+            int: Nombre d'entrées supprimées du cache mémoire de ce worker
+        """
+        removed = self.cache.delete_tagged(tags)
+        if self.snapshot is not None:
+            self.snapshot.delete_tagged(tags)
+        if self.shared_cache is not None:
+            self.shared_cache.invalidate_tags(tags)
+        logger.info(f"Cache invalidé pour les étiquettes {list(tags)}: {removed} entrées")
+        return removed
+    
+    def _call_started(self, url):
+        """Compte un appel sortant vers Dynatrace comme en cours"""
+        metrics.gauge_add('dynatrace_requests_in_flight', 1, endpoint=endpoint_type(url))
+    
+    def _call_finished(self, url, start_time, status):
+        """Enregistre la latence et le statut d'un appel sortant (statut 'error' pour une erreur réseau)"""
+        endpoint = endpoint_type(url)
+        metrics.gauge_add('dynatrace_requests_in_flight', -1, endpoint=endpoint)
+        metrics.inc('dynatrace_requests_total', endpoint=endpoint, status=status if status is not None else 'error')
+        metrics.observe('dynatrace_request_duration_seconds', time.time() - start_time, endpoint=endpoint)
+    
+    # Exécute une requête en respectant le seau à jetons et la limite de concurrence adaptative
     def _request_with_semaphore(self, method, url, **kwargs):
-        with self.semaphore:
-            with self.request_count_lock:
-                self.request_count += 1
+        # Utiliser le timeout par défaut si aucun n'est spécifié
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.default_timeout
+        
+        attempt = 0
+        while True:
+            # Attendre le budget de débit avant d'occuper une place de concurrence
+            self.rate_limit.wait()
             
-            # Utiliser le timeout par défaut si aucun n'est spécifié
-            if 'timeout' not in kwargs:
-                kwargs['timeout'] = self.default_timeout
+            self.limiter.acquire()
+            start_time = time.time()
+            status = None
+            network_error = False
+            self._call_started(url)
+            try:
+                with self.request_count_lock:
+                    self.request_count += 1
+                
+                # Ajouter un log pour le debugging
+                logger.info(f"Requête {method} vers {url} avec timeout={kwargs.get('timeout')}")
+                
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                    status = response.status_code
+                    self.rate_limit.update_from_headers(response.headers, status)
+                    if status == 429 and attempt < self.max_rate_limit_retries:
+                        logger.warning(f"Statut 429 pour {url}, nouvelle tentative {attempt + 1}/{self.max_rate_limit_retries} selon le budget de débit")
+                        response.close()
+                    else:
+                        response.raise_for_status()
+                        return response
+                except requests.exceptions.Timeout as e:
+                    network_error = True
+                    logger.error(f"Timeout pour la requête {url}: {e}")
+                    # Les timeouts sont gérés par la stratégie de retry configurée dans le session
+                    raise
+                except requests.exceptions.ConnectionError as e:
+                    network_error = True
+                    logger.error(f"Erreur de connexion pour {url}: {e}")
+                    raise
+                except requests.exceptions.RequestException as e:
+                    logger.error(f"Erreur de requête HTTP pour {url}: {e}")
+                    raise
+            finally:
+                self.limiter.record(time.time() - start_time, status=status, error=network_error)
+                self.limiter.release()
+                self._call_finished(url, start_time, status)
             
-            # Ajouter un log pour le debugging
-            logger.info(f"Requête {method} vers {url} avec timeout={kwargs.get('timeout')}")
+            attempt += 1
+
+    def rate_limited_get(self, url, **kwargs):
+        """
+        Équivalent de requests.get soumis au seau à jetons du client
+        Destiné aux appels directs (hors session partagée) de app.py: attend le budget de débit,
+        met à jour le seau avec les en-têtes reçus et rejoue les réponses 429 selon Retry-After.
+        
+        Args:
+            url (str): URL complète
+            **kwargs: Arguments transmis à requests.get
             
+        Returns:
+            requests.Response: Réponse HTTP (non vérifiée, à l'appelant d'appeler raise_for_status)
+        """
+        attempt = 0
+        while True:
+            self.rate_limit.wait()
+            with self.request_count_lock:
+                self.request_count += 1
+            start_time = time.time()
+            status = None
+            self._call_started(url)
             try:
-                response = self.session.request(method, url, **kwargs)
-                response.raise_for_status()
-                return response
-            except requests.exceptions.Timeout as e:
-                logger.error(f"Timeout pour la requête {url}: {e}")
-                # Les timeouts sont gérés par la stratégie de retry configurée dans le session
-                raise
-            except requests.exceptions.ConnectionError as e:
-                logger.error(f"Erreur de connexion pour {url}: {e}")
-                raise
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Erreur de requête HTTP pour {url}: {e}")
-                raise
+                response = requests.get(url, **kwargs)
+                status = response.status_code
             finally:
-                # Libérer la connexion explicitement
-                if 'response' in locals():
-                    response.close()
+                self._call_finished(url, start_time, status)
+            self.rate_limit.update_from_headers(response.headers, response.status_code)
+            if response.status_code != 429 or attempt >= self.max_rate_limit_retries:
+                return response
+            logger.warning(f"Statut 429 pour {url}, nouvelle tentative {attempt + 1}/{self.max_rate_limit_retries} selon le budget de débit")
+            response.close()
+            attempt += 1
 
     def query_api(self, endpoint, params=None, use_cache=True, cache_key=None):
         """
         Exécute une requête API avec gestion du cache et sémaphore
+        Le résultat est mis en cache sous la clé canonique de la requête: les appels identiques,
+        quel que soit l'appelant, partagent une seule entrée et une seule requête HTTP en vol.
         
         Args:
             endpoint (str): Point de terminaison de l'API
             params (dict): Paramètres de requête
             use_cache (bool): Utiliser le cache
-            cache_key (str): Clé de cache personnalisée (si None, générée automatiquement)
+            cache_key (str): Nom donné par l'appelant, conservé comme alias de l'entrée canonique
             
         Returns:
             dict: Réponse JSON de l'API
         """
-        # Générer une clé de cache si elle n'est pas fournie
-        if cache_key is None:
-            param_str = str(params) if params else ""
-            cache_key = f"{endpoint}:{param_str}"
+        cache_key, tags = self._query_cache_key(endpoint, params, cache_key)
         
         # Vérifier le cache si activé
         if use_cache:
@@ -214,136 +908,494 @@ class OptimizedAPIClient:
             if cached_data is not None:
                 return cached_data
         
-        # Exécuter la requête avec sémaphore
-        url = f"{self.env_url}/api/v2/{endpoint}"
+        # Si une requête identique est déjà en vol, attendre son résultat
+        future, is_leader = self._join_inflight(cache_key)
+        if not is_leader:
+            logger.debug(f"Requête en vol partagée pour {cache_key}")
+            return future.result()
+        
         try:
-            # Si c'est une requête pour des entities, vérifier si pageSize est spécifié
-            # pour les process groups, utiliser une taille de page plus grande par défaut si non spécifié
-            if endpoint == "entities" and params and "entitySelector" in params:
-                if "type(PROCESS_GROUP)" in params["entitySelector"] and "pageSize" not in params:
-                    # Copier les paramètres pour ne pas modifier l'original
-                    params = params.copy()
-                    params["pageSize"] = 1000  # Récupérer jusqu'à 1000 process groups par défaut
-                    logger.info(f"Auto-configured pageSize=1000 for process groups query")
-            
-            response = self._request_with_semaphore("GET", url, params=params, timeout=(10, 60))  # Timeout augmenté pour les grandes requêtes
-            result = response.json()
-            
-            # Mettre en cache le résultat
-            if use_cache:
-                self.set_cache(cache_key, result)
-                
-            return result
-        except requests.RequestException as e:
-            logger.error(f"API request error for {endpoint}: {str(e)}")
-            # Réessayer une fois en cas d'erreur de connexion
-            if "Connection" in str(e):
-                logger.info(f"Tentative de reconnexion pour {endpoint}")
-                time.sleep(1)  # Attendre 1 seconde avant de réessayer
+            # Un autre appel a pu remplir le cache entre la vérification et la prise en charge
+            cached_data = self.get_cached(cache_key) if use_cache else None
+            if cached_data is not None:
+                result = cached_data
+            else:
+                # Exécuter la requête avec sémaphore
+                url = f"{self.env_url}/api/v2/{endpoint}"
                 try:
-                    response = self._request_with_semaphore("GET", url, params=params, timeout=(5, 30))
+                    params = self._prepare_params(endpoint, params)
+                    
+                    response = self._request_with_semaphore("GET", url, params=params, timeout=(10, 60))  # Timeout augmenté pour les grandes requêtes
                     result = response.json()
-                    if use_cache:
-                        self.set_cache(cache_key, result)
-                    return result
-                except Exception as retry_e:
-                    logger.error(f"Échec de la seconde tentative: {retry_e}")
+                except requests.RequestException as e:
+                    # Les erreurs de connexion sont déjà rejouées par la session et les 429 par le seau à jetons
+                    logger.error(f"API request error for {endpoint}: {str(e)}")
+                    raise
+                
+                # Mettre en cache le résultat
+                if use_cache:
+                    self.set_cache(cache_key, result, tags=tags)
+        except BaseException as e:
+            self._finish_inflight(cache_key, future, error=e)
             raise
+        
+        self._finish_inflight(cache_key, future, result=result)
+        return result
+
+    def _join_inflight(self, cache_key):
+        """
+        Rejoint la requête en vol associée à une clé, ou en devient responsable
+        
+        Returns:
+            tuple: (Future partagée, True si l'appelant doit exécuter la requête)
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self._inflight[cache_key] = future
+            return future, True
+
+    def _finish_inflight(self, cache_key, future, result=None, error=None):
+        """Publie le résultat (ou l'erreur) d'une requête en vol aux appels qui l'attendent"""
+        with self._inflight_lock:
+            if self._inflight.get(cache_key) is future:
+                del self._inflight[cache_key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _query_cache_key(endpoint, params, alias=None):
+        """
+        Clé canonique d'une requête et étiquette d'alias du nom donné par l'appelant
+        
+        Returns:
+            tuple: (clé canonique, liste d'étiquettes ou None)
+        """
+        cache_key = canonical_query_key(endpoint, params)
+        tags = [alias_tag(alias)] if alias and alias != cache_key else None
+        return cache_key, tags
+
+    def _prepare_params(self, endpoint, params):
+        """
+        Ajuste les paramètres d'une requête avant envoi
+        Pour les process groups, utilise une taille de page plus grande par défaut si non spécifiée
+        """
+        if endpoint == "entities" and params and "entitySelector" in params:
+            if "type(PROCESS_GROUP)" in params["entitySelector"] and "pageSize" not in params:
+                # Copier les paramètres pour ne pas modifier l'original
+                params = params.copy()
+                params["pageSize"] = 1000  # Récupérer jusqu'à 1000 process groups par défaut
+                logger.info(f"Auto-configured pageSize=1000 for process groups query")
+        return params
+
+    @staticmethod
+    def _parse_query(query):
+        """
+        Normalise une requête de lot en tuple (endpoint, params, use_cache, cache_key)
+        
+        Formats acceptés: "endpoint", (endpoint, params), (endpoint, params, use_cache)
+        ou (endpoint, params, use_cache, cache_key)
+        """
+        if isinstance(query, tuple):
+            if len(query) == 2:
+                endpoint, params = query
+                return endpoint, params, True, None
+            if len(query) == 3:
+                endpoint, params, use_cache = query
+                return endpoint, params, use_cache, None
+            endpoint, params, use_cache, cache_key = query[:4]
+            return endpoint, params, use_cache, cache_key
+        return query, None, True, None
 
     async def query_api_async(self, endpoint, params=None, use_cache=True, cache_key=None):
-        """Version asynchrone de query_api utilisant asyncio avec ThreadPoolExecutor"""
-        loop = asyncio.get_event_loop()
+        """Version asynchrone de query_api s'appuyant sur l'exécuteur partagé"""
+        loop = asyncio.get_running_loop()
         return await loop.run_in_executor(
-            None, 
+            self.executor,
             lambda: self.query_api(endpoint, params, use_cache, cache_key)
         )
 
-    def batch_query(self, queries):
+    def paginate(self, endpoint, params=None, use_cache=True, cache_key=None, prefetch=True,
+                 max_retries=3, backoff_factor=0.5):
+        """
+        Parcourt toutes les pages d'un point de terminaison paginé par nextPageKey
+        Les pages passent par la session partagée (limiteur, seau à jetons, requêtes partagées) et
+        sont mises en cache une par une. Dès qu'une page doit être redemandée à l'API, les suivantes
+        le sont aussi pour ne pas mélanger deux parcours différents.
+        Les pages servies depuis le cache ne sont transmises qu'une fois la suite du parcours confirmée:
+        si la page suivante est refusée (4xx, page évincée du cache dont le nextPageKey a expiré côté
+        serveur), le parcours reprend une seule fois depuis une première page non cachée.
+        
+        Args:
+            endpoint (str): Point de terminaison de l'API (ex: "entities", "problems")
+            params (dict): Paramètres de la première page
+            use_cache (bool): Utiliser le cache par page
+            cache_key (str): Nom donné par l'appelant, conservé comme alias des pages (la première page
+                             est stockée sous la clé canonique de la requête, les suivantes sous
+                             "<clé canonique>:page:<n>")
+            prefetch (bool): Demander la page suivante pendant le traitement de la page courante
+            max_retries (int): Nombre de nouvelles tentatives par page avant d'abandonner
+            backoff_factor (float): Facteur d'attente exponentielle entre les tentatives
+            
+        Yields:
+            dict: Réponse JSON de chaque page, dans l'ordre
+            
+        Raises:
+            requests.RequestException: Si une page reste en échec après toutes les tentatives
+        """
+        cache_key, tags = self._query_cache_key(endpoint, params, cache_key)
+        
+        page_num = 1
+        page_args = (endpoint, params, cache_key, use_cache, use_cache, max_retries, backoff_factor, tags)
+        next_page = None
+        # Pages lues dans le cache, retenues tant que la suite du parcours n'est pas confirmée
+        cached_pages = []
+        restarted = False
+        
+        try:
+            while page_args is not None:
+                try:
+                    if next_page is not None:
+                        future, next_page = next_page, None
+                        data, from_cache = future.result()
+                    else:
+                        data, from_cache = self._fetch_page(*page_args)
+                except requests.RequestException as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if not cached_pages or restarted or status is None or not 400 <= status < 500:
+                        raise
+                    logger.warning(f"Page {page_num} de {endpoint} refusée après {len(cached_pages)} page(s) en cache "
+                                   f"({status}), reprise du parcours sans cache")
+                    cached_pages = []
+                    restarted = True
+                    page_num = 1
+                    page_args = (endpoint, params, cache_key, False, use_cache, max_retries, backoff_factor, tags)
+                    continue
+                
+                if from_cache:
+                    cached_pages.append(data)
+                elif cached_pages:
+                    # Le parcours en cache est confirmé par une page récupérée à partir de son nextPageKey
+                    yield from cached_pages
+                    cached_pages = []
+                
+                next_page_key = data.get('nextPageKey') if data else None
+                if next_page_key:
+                    # Pour les pages suivantes, seul nextPageKey est accepté par l'API
+                    page_num += 1
+                    page_args = (endpoint, {'nextPageKey': next_page_key}, f"{cache_key}:page:{page_num}",
+                                 use_cache and from_cache, use_cache, max_retries, backoff_factor, tags)
+                    if prefetch:
+                        next_page = self.executor.submit(self._fetch_page, *page_args)
+                else:
+                    page_args = None
+                
+                if not from_cache:
+                    yield data
+            yield from cached_pages
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    def paginate_items(self, endpoint, params, items_key, **kwargs):
+        """
+        Parcourt toutes les pages d'un point de terminaison et produit leurs éléments un par un
+        
+        Args:
+            endpoint (str): Point de terminaison de l'API
+            params (dict): Paramètres de la première page
+            items_key (str): Clé de la liste d'éléments dans chaque page (ex: "entities", "problems")
+            **kwargs: Options transmises à paginate
+            
+        Yields:
+            dict: Éléments de toutes les pages, dans l'ordre
+        """
+        total = 0
+        for page_num, page in enumerate(self.paginate(endpoint, params, **kwargs), start=1):
+            items = page.get(items_key, []) if page else []
+            total += len(items)
+            logger.info(f"Page {page_num} de {endpoint}: {len(items)} éléments récupérés. Total jusqu'à présent: {total}.")
+            
+            # Si la page est vide, sortir malgré nextPageKey (sécurité)
+            if not items:
+                if page and page.get('nextPageKey'):
+                    logger.warning(f"Page {page_num} de {endpoint} vide malgré nextPageKey. Arrêt de la pagination.")
+                return
+            
+            yield from items
+
+    def _fetch_page(self, endpoint, params, cache_key, read_cache, write_cache, max_retries, backoff_factor, tags=None):
+        """
+        Récupère une page avec nouvelles tentatives
+        
+        Returns:
+            tuple: (Réponse JSON de la page, True si elle provient du cache)
+        """
+        if read_cache:
+            cached_data = self.get_cached(cache_key)
+            if cached_data is not None:
+                return cached_data, True
+        
+        for attempt in range(max_retries + 1):
+            try:
+                data = self.query_api(endpoint, params, use_cache=False)
+                break
+            except requests.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                # Les erreurs client (hors 429, déjà gérées par le transport) ne sont pas rejouées
+                if attempt >= max_retries or (status is not None and 400 <= status < 500):
+                    logger.error(f"Échec de la récupération d'une page de {endpoint} après {attempt + 1} tentatives: {e}")
+                    raise
+                delay = backoff_factor * (2 ** attempt)
+                logger.warning(f"Erreur sur une page de {endpoint}, nouvelle tentative dans {delay:.1f}s ({attempt + 1}/{max_retries}): {e}")
+                time.sleep(delay)
+        
+        if write_cache:
+            self.set_cache(cache_key, data, tags=tags)
+        return data, False
+
+    def batch_query(self, queries, callback=None):
+        """
+        Exécute plusieurs requêtes API en parallèle avec contrôle de charge
+        Le nombre de requêtes simultanées est régulé par le limiteur adaptatif (pas de découpage
+        en lots ni de pause fixe).
+        
+        Args:
+            queries (list): Liste de tuples (endpoint, params, use_cache, cache_key)
+            callback (callable): Fonction optionnelle appelée avec (index, résultat) dès qu'une requête se termine
+            
+        Returns:
+            list: Liste des résultats correspondants
+        """
+        results = [None] * len(queries)
+        for index, result in self.batch_query_iter(queries):
+            results[index] = result
+            if callback is not None:
+                callback(index, result)
+        return results
+
+    def batch_query_iter(self, queries, window=None):
+        """
+        Exécute des requêtes sur l'exécuteur partagé et produit les résultats au fil de l'eau
+        Une fenêtre glissante garde jusqu'à `window` requêtes en vol: chaque requête terminée
+        libère immédiatement sa place pour la suivante, sans attendre les plus lentes.
+        Ne pas appeler depuis une tâche de l'exécuteur partagé (risque d'interblocage).
+        
+        Args:
+            queries (list): Liste de tuples (endpoint, params, use_cache, cache_key)
+            window (int): Nombre maximum de requêtes en vol (défaut: limite de concurrence adaptative)
+            
+        Yields:
+            tuple: (index de la requête, résultat ou None en cas d'erreur), dans l'ordre d'achèvement
+        """
+        queries = list(queries)
+        pending = {}
+        next_index = 0
+        
+        try:
+            while next_index < len(queries) or pending:
+                # La fenêtre est réévaluée à chaque tour pour suivre la limite adaptative
+                window_size = window or self.limiter.limit
+                while next_index < len(queries) and len(pending) < window_size:
+                    endpoint, params, use_cache, cache_key = self._parse_query(queries[next_index])
+                    future = self.executor.submit(self.query_api, endpoint, params, use_cache, cache_key)
+                    pending[future] = next_index
+                    next_index += 1
+                
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Error in batch query for index {index}: {str(e)}")
+                        result = None
+                    yield index, result
+        finally:
+            # Si le consommateur s'arrête en route, ne pas lancer les requêtes encore en file
+            for future in pending:
+                future.cancel()
+
+    def batch_query_groups(self, *query_groups):
+        """
+        Exécute plusieurs groupes de requêtes indépendants dans un seul flux à fenêtre glissante
+        Aucun groupe n'attend la fin du précédent pour démarrer.
+        
+        Args:
+            *query_groups (list): Listes de requêtes au format de batch_query
+            
+        Returns:
+            tuple: Une liste de résultats par groupe, dans l'ordre des requêtes de chaque groupe
+        """
+        flat_queries = []
+        slots = []
+        results = []
+        for group_index, group in enumerate(query_groups):
+            results.append([None] * len(group))
+            for position, query in enumerate(group):
+                flat_queries.append(query)
+                slots.append((group_index, position))
+        
+        for index, result in self.batch_query_iter(flat_queries):
+            group_index, position = slots[index]
+            results[group_index][position] = result
+        
+        return tuple(results)
+
+    async def batch_query_async(self, queries):
+        """
+        Version asynchrone de batch_query utilisant asyncio
+        
+        Returns:
+            list: Résultats dans l'ordre des requêtes (les exceptions sont retournées à leur place)
+        """
+        tasks = [self.query_api_async(*self._parse_query(query)) for query in queries]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """Arrête l'exécuteur partagé et la purge du cache"""
+        self.executor.shutdown(wait=False)
+        self.cache.stop()
+        # Dernier instantané pour que le prochain démarrage reparte à chaud
+        if self.snapshot is not None:
+            self.snapshot.stop(self.cache)
+
+    def load_entities(self, entity_type, mz_name=None, entity_ids=None, use_cache=True):
+        """
+        Charge les métadonnées d'entités par appels entitySelector paginés et alimente le stock
+        Remplace les appels entities/{id} un par un: OS, technologies, état de supervision et tags
+        sont demandés via le paramètre fields pour toutes les entités d'un coup.
+        
+        Args:
+            entity_type (str): Type d'entité (HOST, SERVICE, PROCESS_GROUP)
+            mz_name (str): Management Zone à charger
+            entity_ids (list): IDs à charger (ignoré si mz_name est fourni)
+            use_cache (bool): Utiliser le cache des pages
+            
+        Returns:
+            list: Entités chargées
+        """
+        fields = self.ENTITY_FIELDS.get(entity_type, self.DEFAULT_ENTITY_FIELDS)
+        entities = []
+        
+        for entity_selector in self._entity_selectors(entity_type, entity_ids or [], mz_name):
+            params = {
+                "entitySelector": entity_selector,
+                "fields": fields,
+                "pageSize": 500
+            }
+            try:
+                selector_entities = list(self.paginate_items(
+                    "entities", params, "entities", use_cache=use_cache,
+                    cache_key=f"entity_pages:{entity_selector}:{fields}"
+                ))
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 400 or fields == self.DEFAULT_ENTITY_FIELDS:
+                    raise
+                # Certains environnements refusent un champ précis: se rabattre sur toutes les propriétés
+                logger.warning(f"Champs {fields} refusés pour {entity_type}, repli sur {self.DEFAULT_ENTITY_FIELDS}: {e}")
+                params["fields"] = self.DEFAULT_ENTITY_FIELDS
+                selector_entities = list(self.paginate_items(
+                    "entities", params, "entities", use_cache=use_cache,
+                    cache_key=f"entity_pages:{entity_selector}:{self.DEFAULT_ENTITY_FIELDS}"
+                ))
+            entities.extend(selector_entities)
+        
+        self._store_entities(entities)
+        logger.info(f"Stock de métadonnées: {len(entities)} entités {entity_type} chargées")
+        return entities
+
+    def get_entities(self, entity_ids, entity_type):
+        """
+        Retourne les métadonnées d'entités depuis le stock, en chargeant les absentes en masse
+        
+        Args:
+            entity_ids (list): IDs des entités
+            entity_type (str): Type d'entité (HOST, SERVICE, PROCESS_GROUP)
+            
+        Returns:
+            dict: {ID d'entité: entité} (les entités introuvables sont absentes)
+        """
+        entities = {}
+        missing_ids = []
+        for entity_id in entity_ids:
+            entity = self.get_cached(f"entity:{entity_id}")
+            if entity is not None:
+                entities[entity_id] = entity
+            else:
+                missing_ids.append(entity_id)
+        
+        if missing_ids:
+            try:
+                for entity in self.load_entities(entity_type, entity_ids=missing_ids):
+                    entities[entity.get('entityId')] = entity
+            except Exception as e:
+                logger.error(f"Erreur lors du chargement de {len(missing_ids)} entités {entity_type}: {e}")
+        
+        return entities
+
+    def _store_entities(self, entities):
+        """Enregistre des entités dans le stock de métadonnées (cache mémoire à durée propre, non partagé)"""
+        now = time.time()
+        for entity in entities:
+            entity_id = entity.get('entityId')
+            if entity_id:
+                key = f"entity:{entity_id}"
+                self.cache.set(key, entity, duration=self.entity_cache_duration, timestamp=now, tags=cache_tags(key))
+
+    @staticmethod
+    def entity_os_version(host_details):
         """
-        Exécute plusieurs requêtes API en parallèle avec contrôle de charge
+        Détermine la version de l'OS d'un hôte à partir de ses propriétés ou de ses tags
         
         Args:
-            queries (list): Liste de tuples (endpoint, params, use_cache, cache_key)
+            host_details (dict): Entité hôte du stock de métadonnées
             
         Returns:
-            list: Liste des résultats correspondants
+            str: Version de l'OS ("Non spécifié" si inconnue)
         """
-        # Si trop de requêtes, diviser en lots plus petits
-        if len(queries) > self.max_connections:
-            logger.info(f"Divisant {len(queries)} requêtes en lots de {self.max_connections}")
-            results = []
-            # Diviser les requêtes en groupes de max_connections
-            for i in range(0, len(queries), self.max_connections):
-                chunk = queries[i:i + self.max_connections]
-                chunk_results = self._execute_batch(chunk)
-                results.extend(chunk_results)
-                # Pause courte entre les lots pour éviter la surcharge
-                if i + self.max_connections < len(queries):
-                    time.sleep(0.5)
-            return results
-        else:
-            return self._execute_batch(queries)
-
-    def _execute_batch(self, queries):
-        """
-        Exécute un lot de requêtes avec ThreadPoolExecutor
-        """
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {}  # Utiliser un dictionnaire pour conserver le mapping entre futures et queries
-            
-            for i, query in enumerate(queries):
-                # Gérer les différents formats de requêtes
-                if isinstance(query, tuple):
-                    if len(query) == 2:
-                        endpoint, params = query
-                        use_cache, cache_key = True, None
-                    elif len(query) == 3:
-                        endpoint, params, use_cache = query
-                        cache_key = None
-                    elif len(query) >= 4:
-                        endpoint, params, use_cache, cache_key = query[:4]
-                else:
-                    endpoint, params = query, None
-                    use_cache, cache_key = True, None
+        os_version = "Non spécifié"
+        if host_details and 'properties' in host_details:
+            properties = host_details.get('properties', {})
+            
+            # Vérifier différentes propriétés possibles pour l'OS
+            if 'osType' in properties:
+                os_type = properties.get('osType', "")
+                os_version = os_type
                 
-                # Utiliser l'index comme identifiant unique pour chaque future
-                future = executor.submit(self.query_api, endpoint, params, use_cache, cache_key)
-                futures[i] = future
-            
-            # Collecter les résultats dans l'ordre original des requêtes
-            results = [None] * len(queries)
-            for i, future in futures.items():
-                try:
-                    results[i] = future.result()
-                except Exception as e:
-                    logger.error(f"Error in batch query for index {i}: {str(e)}")
-                    results[i] = None
-            
-            return results
+                # Ajouter la version si disponible
+                if 'osVersion' in properties:
+                    os_version = f"{os_type} {properties.get('osVersion', '')}"
+            elif 'kernelVersion' in properties:
+                os_version = f"Kernel {properties.get('kernelVersion', '')}"
+                
+                # Si osVersion est également disponible
+                if 'osVersion' in properties:
+                    os_version = f"{properties.get('osVersion', '')} (Kernel {properties.get('kernelVersion', '')})"
+            
+            # Si aucune propriété spécifique n'est trouvée, chercher dans les tags
+            if os_version == "Non spécifié" and 'tags' in host_details:
+                for tag in host_details.get('tags', []):
+                    # Chercher les tags liés à l'OS
+                    if tag.get('key') in ['OS', 'os', 'Operating System', 'system']:
+                        os_version = tag.get('value', "Non spécifié")
+                        break
+        return os_version
 
-    async def batch_query_async(self, queries):
-        """Version asynchrone de batch_query utilisant asyncio"""
-        tasks = []
-        for query in queries:
-            # Gérer les différents formats de requêtes
-            if isinstance(query, tuple):
-                if len(query) == 2:
-                    endpoint, params = query
-                    use_cache, cache_key = True, None
-                elif len(query) == 3:
-                    endpoint, params, use_cache = query
-                    cache_key = None
-                elif len(query) >= 4:
-                    endpoint, params, use_cache, cache_key = query[:4]
-            else:
-                endpoint, params = query, None
-                use_cache, cache_key = True, None
-            
-            tasks.append(self.query_api_async(endpoint, params, use_cache, cache_key))
-        
-        return await asyncio.gather(*tasks, return_exceptions=True)
+    @staticmethod
+    def entity_monitoring_active(entity_details):
+        """Indique si l'état de supervision d'une entité est actif (True si inconnu)"""
+        properties = (entity_details or {}).get('properties', {})
+        monitoring_state = properties.get('monitoringState')
+        if monitoring_state is None and 'monitoring' in properties:
+            monitoring_state = properties['monitoring'].get('monitoringState')
+        return monitoring_state is None or monitoring_state == "ACTIVE"
 
-    def extract_technology(self, entity_id, use_cache=True):
+    def extract_technology(self, entity_id, use_cache=True, entity_details=None):
         """
         Extrait les informations de technologie d'une entité
         Optimisé à partir de la fonction dans code.py
@@ -351,6 +1403,7 @@ class OptimizedAPIClient:
         Args:
             entity_id (str): ID de l'entité
             use_cache (bool): Utiliser le cache
+            entity_details (dict): Entité déjà connue (sinon lue depuis le stock de métadonnées)
             
         Returns:
             dict: Informations sur la technologie
@@ -362,7 +1415,9 @@ class OptimizedAPIClient:
                 return cached_data
 
         try:
-            entity_details = self.query_api(f"entities/{entity_id}")
+            if entity_details is None:
+                entity_type = entity_id.split('-')[0]
+                entity_details = self.get_entities([entity_id], entity_type).get(entity_id, {})
             
             # Récupération des technologies selon le type d'entité
             tech_info = []
@@ -511,231 +1566,156 @@ class OptimizedAPIClient:
             logger.error(f"Erreur lors de la récupération de l'historique pour {metric_selector}: {e}")
             return []
 
-    def get_service_metrics_parallel(self, service_ids, from_time, to_time):
+    def query_split_metrics(self, metric_selectors, entity_selector, dimension, from_time, to_time,
+                            resolution=None, cache_key=None):
         """
-        Récupère les métriques pour plusieurs services en parallèle
-        Optimisé pour gérer de grands nombres de services
+        Exécute une seule requête multi-métriques ventilée par entité (splitBy) et la démultiplexe
+        Remplace une requête par entité et par métrique; les pages de résultats sont suivies si besoin.
         
         Args:
-            service_ids (list): Liste des IDs de services
+            metric_selectors (list): Sélecteurs de métriques sans splitBy (ex: "builtin:host.cpu.usage")
+            entity_selector (str): Sélecteur d'entités (ex: type(SERVICE),mzName("..."))
+            dimension (str): Dimension de ventilation (ex: "dt.entity.service")
             from_time (int): Timestamp de début
             to_time (int): Timestamp de fin
+            resolution (str): Résolution des séries (ex: "Inf", "1m", "1h")
+            cache_key (str): Préfixe des clés de cache des pages
             
         Returns:
-            list: Métriques pour tous les services
+            list: Pour chaque sélecteur (même ordre), un dictionnaire {ID d'entité: série}
         """
-        # Si trop de services, traiter par lots
-        chunk_size = int(os.environ.get('REQUEST_CHUNK_SIZE', 15))
-        if len(service_ids) > chunk_size:
-            logger.info(f"Traitement par lots de {len(service_ids)} services")
-            all_service_metrics = []
-            
-            # Diviser les IDs en lots plus petits
-            for i in range(0, len(service_ids), chunk_size):
-                chunk_ids = service_ids[i:i + chunk_size]
-                logger.info(f"Traitement du lot {i//chunk_size + 1}/{(len(service_ids) + chunk_size - 1)//chunk_size} ({len(chunk_ids)} services)")
-                
-                # Traiter ce lot
-                chunk_metrics = self._process_service_chunk(chunk_ids, from_time, to_time)
-                all_service_metrics.extend(chunk_metrics)
-                
-                # Petite pause entre les lots pour éviter de surcharger l'API
-                if i + chunk_size < len(service_ids):
-                    time.sleep(1)
-            
-            return all_service_metrics
-        else:
-            # Si peu de services, utiliser la méthode normale
-            return self._process_service_chunk(service_ids, from_time, to_time)
+        params = {
+            "metricSelector": ",".join(f'{metric}:splitBy("{dimension}")' for metric in metric_selectors),
+            "entitySelector": entity_selector,
+            "from": from_time,
+            "to": to_time
+        }
+        if resolution:
+            params["resolution"] = resolution
+        
+        series_by_metric = [{} for _ in metric_selectors]
+        # Pas de préchargement: cette méthode peut elle-même tourner sur l'exécuteur partagé
+        for page in self.paginate("metrics/query", params, cache_key=cache_key, prefetch=False):
+            # Les résultats suivent l'ordre des métriques du sélecteur
+            for index, metric_result in enumerate((page or {}).get('result', [])[:len(metric_selectors)]):
+                for series in metric_result.get('data', []):
+                    entity_id = series.get('dimensionMap', {}).get(dimension)
+                    if entity_id is None and series.get('dimensions'):
+                        entity_id = series['dimensions'][0]
+                    if entity_id:
+                        series_by_metric[index][entity_id] = series
+        
+        return series_by_metric
 
-    def _process_service_chunk(self, service_ids, from_time, to_time):
-        """
-        Traite un lot de services
+    @staticmethod
+    def _entity_selectors(entity_type, entity_ids, mz_name=None, chunk_size=100):
         """
-        # Préparer les requêtes pour la récupération des détails des services avec ID explicite
-        service_details_queries = []
-        for service_id in service_ids:
-            service_details_queries.append((
-                f"entities/{service_id}", 
-                None, 
-                True,
-                f"service_details:{service_id}"  # Clé de cache explicite avec ID
-            ))
-        
-        # Récupérer les détails des services en parallèle
-        service_details_results = self.batch_query(service_details_queries)
-        
-        # Créer un dictionnaire pour associer les résultats aux services
-        service_details_dict = {}
-        for i, service_id in enumerate(service_ids):
-            service_details_dict[service_id] = service_details_results[i]
+        Construit les sélecteurs d'entités couvrant une liste d'IDs
+        Avec une Management Zone, un seul sélecteur mzName suffit; sinon les IDs sont découpés
+        en tranches pour rester sous la longueur maximale d'URL.
         
-        # Préparer les requêtes de métriques pour tous les services avec clés explicites
-        metric_queries = []
-        
-        for service_id in service_ids:
-            # Requête pour le temps de réponse moyen avec ID explicite
-            metric_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.response.time",
-                    "from": from_time,
-                    "to": to_time,
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"response_time:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
+        Returns:
+            list: Sélecteurs d'entités
+        """
+        if mz_name:
+            escaped_mz_name = mz_name.replace('"', '\\"')
+            return [f'type({entity_type}),mzName("{escaped_mz_name}")']
+        selectors = []
+        for i in range(0, len(entity_ids), chunk_size):
+            ids = ",".join(f'"{entity_id}"' for entity_id in entity_ids[i:i + chunk_size])
+            selectors.append(f"type({entity_type}),entityId({ids})")
+        return selectors
 
-            # Requête pour le temps de réponse médian (50e percentile) avec ID explicite
-            metric_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.response.time:percentile(50)",
-                    "from": from_time,
-                    "to": to_time,
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"median_response_time:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
-            
-            # Requête pour le taux d'erreur avec ID explicite
-            metric_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.errors.total.rate",
-                    "from": from_time,
-                    "to": to_time,
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"error_rate:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
+    def get_service_metrics_parallel(self, service_ids, from_time, to_time, mz_name=None):
+        """
+        Récupère les métriques pour plusieurs services en parallèle
+        Optimisé pour gérer de grands nombres de services: les métriques de tous les services
+        sont obtenues par quelques requêtes multi-métriques splitBy("dt.entity.service") à
+        l'échelle de la Management Zone, puis réparties par service.
+        
+        Args:
+            service_ids (list): Liste des IDs de services
+            from_time (int): Timestamp de début
+            to_time (int): Timestamp de fin
+            mz_name (str): Management Zone des services (si None, sélection par lots d'IDs)
             
-            # Requête pour le nombre de requêtes avec ID explicite
-            metric_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.requestCount.total",
-                    "from": from_time,
-                    "to": to_time,
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"requests:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
+        Returns:
+            list: Métriques pour tous les services
+        """
+        if not service_ids:
+            return []
         
-        # Exécuter toutes les requêtes de métriques en parallèle
-        all_metric_results = self.batch_query(metric_queries)
+        current_metrics = [
+            "builtin:service.response.time",
+            "builtin:service.response.time:percentile(50)",
+            "builtin:service.errors.total.rate",
+            "builtin:service.requestCount.total"
+        ]
+        history_metrics = [
+            "builtin:service.response.time",
+            "builtin:service.errors.total.rate",
+            "builtin:service.requestCount.total"
+        ]
+        
+        entity_selectors = self._entity_selectors("SERVICE", service_ids, mz_name)
+        logger.info(f"Récupération des métriques pour {len(service_ids)} services en {len(entity_selectors) * 2} requêtes splitBy")
+        
+        # Lancer les requêtes de métriques (valeur agrégée et historique 1 min) sur l'exécuteur partagé
+        metric_futures = []
+        for entity_selector in entity_selectors:
+            metric_futures.append((
+                self.executor.submit(
+                    self.query_split_metrics, current_metrics, entity_selector, "dt.entity.service",
+                    from_time, to_time, "Inf", f"service_metrics:{entity_selector}:{from_time}:{to_time}"
+                ),
+                self.executor.submit(
+                    self.query_split_metrics, history_metrics, entity_selector, "dt.entity.service",
+                    from_time, to_time, "1m", f"service_history:{entity_selector}:{from_time}:{to_time}"
+                )
+            ))
         
-        # Créer des dictionnaires pour associer les résultats de métriques aux services
-        response_time_metrics = {}
-        median_response_time_metrics = {}
-        error_rate_metrics = {}
-        request_metrics = {}
+        # Pendant ce temps, lire les détails des services depuis le stock de métadonnées
+        service_details_dict = self.get_entities(service_ids, "SERVICE")
         
-        # Distribuer les résultats dans des dictionnaires par ID de service
-        result_index = 0
-        for service_id in service_ids:
-            response_time_metrics[service_id] = all_metric_results[result_index]
-            result_index += 1
-            median_response_time_metrics[service_id] = all_metric_results[result_index]
-            result_index += 1
-            error_rate_metrics[service_id] = all_metric_results[result_index]
-            result_index += 1
-            request_metrics[service_id] = all_metric_results[result_index]
-            result_index += 1
-        
-        # Récupérer les technologies en parallèle avec caching
+        # Fusionner les séries par métrique, toutes tranches confondues
+        response_time_metrics, median_response_time_metrics, error_rate_metrics, request_metrics = {}, {}, {}, {}
+        rt_history_dict, er_history_dict, req_history_dict = {}, {}, {}
+        for current_future, history_future in metric_futures:
+            try:
+                rt, median_rt, er, req = current_future.result()
+                response_time_metrics.update(rt)
+                median_response_time_metrics.update(median_rt)
+                error_rate_metrics.update(er)
+                request_metrics.update(req)
+            except Exception as e:
+                logger.error(f"Erreur lors de la récupération des métriques de services: {e}")
+            try:
+                rt_history, er_history, req_history = history_future.result()
+                rt_history_dict.update(rt_history)
+                er_history_dict.update(er_history)
+                req_history_dict.update(req_history)
+            except Exception as e:
+                logger.error(f"Erreur lors de la récupération de l'historique des services: {e}")
+        
+        # Déduire les technologies des métadonnées déjà chargées
         tech_dict = {}
         for service_id in service_ids:
-            tech_info = self.extract_technology(service_id)
+            tech_info = self.extract_technology(service_id, entity_details=service_details_dict.get(service_id, {}))
             tech_dict[service_id] = tech_info
         
-        # Pour l'historique, ne le faire que pour un sous-ensemble si trop nombreux
-        history_sample_size = min(len(service_ids), 5)  # Limiter l'historique aux 5 premiers services
-        history_service_ids = service_ids[:history_sample_size]
-        
-        # Préparer les requêtes d'historique avec clés explicites
-        history_queries = []
-        for service_id in history_service_ids:
-            # Historique du temps de réponse avec résolution très fine (1min pour 30min de données)
-            history_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.response.time",
-                    "from": from_time,
-                    "to": to_time,
-                    "resolution": "1m",  # Résolution plus fine : 1 minute pour 30 minutes de données
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"rt_history:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
-            
-            # Historique du taux d'erreur avec résolution très fine
-            history_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.errors.total.rate",
-                    "from": from_time,
-                    "to": to_time,
-                    "resolution": "1m",  # Résolution plus fine : 1 minute pour 30 minutes de données
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"er_history:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
-            
-            # Historique du nombre de requêtes avec résolution très fine
-            history_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:service.requestCount.total",
-                    "from": from_time,
-                    "to": to_time,
-                    "resolution": "1m",  # Résolution plus fine : 1 minute pour 30 minutes de données
-                    "entitySelector": f"entityId({service_id})"
-                },
-                True,
-                f"req_history:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
-        
-        # Exécuter les requêtes d'historique en parallèle
-        history_results = self.batch_query(history_queries)
-        
-        # Créer des dictionnaires pour associer les résultats d'historique aux services
-        rt_history_dict = {}
-        er_history_dict = {}
-        req_history_dict = {}
-        
-        # Distribuer les résultats d'historique dans des dictionnaires par ID de service
-        result_index = 0
-        for service_id in history_service_ids:
-            rt_history_dict[service_id] = history_results[result_index]
-            result_index += 1
-            er_history_dict[service_id] = history_results[result_index]
-            result_index += 1
-            req_history_dict[service_id] = history_results[result_index]
-            result_index += 1
-        
         # Maintenant, assembler les métriques pour chaque service
         service_metrics = []
         for service_id in service_ids:
-            service_details = service_details_dict[service_id]
+            service_details = service_details_dict.get(service_id)
             
             # Vérification du type de service et activité
-            service_status = "Actif"
-            if service_details and 'properties' in service_details and 'monitoring' in service_details['properties']:
-                if service_details['properties']['monitoring'].get('monitoringState') != "ACTIVE":
-                    service_status = "Inactif"
+            service_status = "Actif" if self.entity_monitoring_active(service_details) else "Inactif"
             
             # Extraire les métriques pour ce service
-            response_time_data = response_time_metrics[service_id]
-            median_response_time_data = median_response_time_metrics[service_id]
-            error_rate_data = error_rate_metrics[service_id]
-            requests_data = request_metrics[service_id]
+            response_time_data = response_time_metrics.get(service_id)
+            median_response_time_data = median_response_time_metrics.get(service_id)
+            error_rate_data = error_rate_metrics.get(service_id)
+            requests_data = request_metrics.get(service_id)
 
             # Traiter les résultats des métriques
             response_time = None
@@ -744,52 +1724,44 @@ class OptimizedAPIClient:
             requests_count = None
             
             # Extraire le temps de réponse moyen (conversion en ms)
-            if response_time_data and 'result' in response_time_data and response_time_data['result']:
-                result = response_time_data['result'][0]
-                if 'data' in result and result['data']:
-                    values = result['data'][0].get('values', [])
-                    if values and values[0] is not None:
-                        # Conversion en secondes comme demandé
-                        raw_value = values[0]
-                        if raw_value < 10:  # Déjà en secondes
-                            response_time = round(raw_value, 2)
-                            logger.info(f"Service {service_id}: Temps de réponse moyen en secondes: {response_time}s")
-                        else:
-                            # Convertir de millisecondes à secondes
-                            response_time = round(raw_value / 1000, 2)
-                            logger.info(f"Service {service_id}: Temps de réponse moyen converti de {raw_value}ms à {response_time}s")
+            if response_time_data:
+                values = response_time_data.get('values', [])
+                if values and values[0] is not None:
+                    # Conversion en secondes comme demandé
+                    raw_value = values[0]
+                    if raw_value < 10:  # Déjà en secondes
+                        response_time = round(raw_value, 2)
+                        logger.info(f"Service {service_id}: Temps de réponse moyen en secondes: {response_time}s")
+                    else:
+                        # Convertir de millisecondes à secondes
+                        response_time = round(raw_value / 1000, 2)
+                        logger.info(f"Service {service_id}: Temps de réponse moyen converti de {raw_value}ms à {response_time}s")
 
             # Extraire le temps de réponse médian (conversion en ms)
-            if median_response_time_data and 'result' in median_response_time_data and median_response_time_data['result']:
-                result = median_response_time_data['result'][0]
-                if 'data' in result and result['data']:
-                    values = result['data'][0].get('values', [])
-                    if values and values[0] is not None:
-                        # Conversion en secondes comme demandé
-                        raw_value = values[0]
-                        if raw_value < 10:  # Déjà en secondes
-                            median_response_time = round(raw_value, 2)
-                            logger.info(f"Service {service_id}: Temps de réponse médian en secondes: {median_response_time}s")
-                        else:
-                            # Convertir de millisecondes à secondes
-                            median_response_time = round(raw_value / 1000, 2)
-                            logger.info(f"Service {service_id}: Temps de réponse médian converti de {raw_value}ms à {median_response_time}s")
+            if median_response_time_data:
+                values = median_response_time_data.get('values', [])
+                if values and values[0] is not None:
+                    # Conversion en secondes comme demandé
+                    raw_value = values[0]
+                    if raw_value < 10:  # Déjà en secondes
+                        median_response_time = round(raw_value, 2)
+                        logger.info(f"Service {service_id}: Temps de réponse médian en secondes: {median_response_time}s")
+                    else:
+                        # Convertir de millisecondes à secondes
+                        median_response_time = round(raw_value / 1000, 2)
+                        logger.info(f"Service {service_id}: Temps de réponse médian converti de {raw_value}ms à {median_response_time}s")
             
             # Extraire le taux d'erreur
-            if error_rate_data and 'result' in error_rate_data and error_rate_data['result']:
-                result = error_rate_data['result'][0]
-                if 'data' in result and result['data']:
-                    values = result['data'][0].get('values', [])
-                    if values and values[0] is not None:
-                        error_rate = round(values[0], 1)
+            if error_rate_data:
+                values = error_rate_data.get('values', [])
+                if values and values[0] is not None:
+                    error_rate = round(values[0], 1)
             
             # Extraire le nombre de requêtes
-            if requests_data and 'result' in requests_data and requests_data['result']:
-                result = requests_data['result'][0]
-                if 'data' in result and result['data']:
-                    values = result['data'][0].get('values', [])
-                    if values and values[0] is not None:
-                        requests_count = int(values[0])
+            if requests_data:
+                values = requests_data.get('values', [])
+                if values and values[0] is not None:
+                    requests_count = int(values[0])
             
             # Extraire la technologie du dictionnaire
             tech_info = tech_dict[service_id]
@@ -802,26 +1774,24 @@ class OptimizedAPIClient:
             # Historique du temps de réponse moyen (uniquement si disponible)
             if service_id in rt_history_dict:
                 rt_history_data = rt_history_dict[service_id]
-                if rt_history_data and 'result' in rt_history_data and rt_history_data['result']:
-                    result = rt_history_data['result'][0]
-                    if 'data' in result and result['data']:
-                        values = result['data'][0].get('values', [])
-                        timestamps = result['data'][0].get('timestamps', [])
-                        if values and timestamps:
-                            for i in range(len(values)):
-                                if values[i] is not None:
-                                    # Conversion en secondes pour les valeurs historiques
-                                    raw_value = values[i]
-                                    if raw_value < 10:  # Déjà en secondes
-                                        adjusted_value = round(raw_value, 2)
-                                    else:
-                                        # Convertir de millisecondes à secondes
-                                        adjusted_value = round(raw_value / 1000, 2)
-
-                                    response_time_history.append({
-                                        'timestamp': timestamps[i],
-                                        'value': adjusted_value
-                                    })
+                if rt_history_data:
+                    values = rt_history_data.get('values', [])
+                    timestamps = rt_history_data.get('timestamps', [])
+                    if values and timestamps:
+                        for i in range(len(values)):
+                            if values[i] is not None:
+                                # Conversion en secondes pour les valeurs historiques
+                                raw_value = values[i]
+                                if raw_value < 10:  # Déjà en secondes
+                                    adjusted_value = round(raw_value, 2)
+                                else:
+                                    # Convertir de millisecondes à secondes
+                                    adjusted_value = round(raw_value / 1000, 2)
+
+                                response_time_history.append({
+                                    'timestamp': timestamps[i],
+                                    'value': adjusted_value
+                                })
 
             # Pour l'historique du temps de réponse médian, nous utilisons les mêmes données
             # car nous n'avons pas de requête spécifique pour l'historique médian
@@ -831,34 +1801,30 @@ class OptimizedAPIClient:
             # Historique du taux d'erreur (uniquement si disponible)
             if service_id in er_history_dict:
                 er_history_data = er_history_dict[service_id]
-                if er_history_data and 'result' in er_history_data and er_history_data['result']:
-                    result = er_history_data['result'][0]
-                    if 'data' in result and result['data']:
-                        values = result['data'][0].get('values', [])
-                        timestamps = result['data'][0].get('timestamps', [])
-                        if values and timestamps:
-                            for i in range(len(values)):
-                                if values[i] is not None:
-                                    error_rate_history.append({
-                                        'timestamp': timestamps[i],
-                                        'value': values[i]
-                                    })
+                if er_history_data:
+                    values = er_history_data.get('values', [])
+                    timestamps = er_history_data.get('timestamps', [])
+                    if values and timestamps:
+                        for i in range(len(values)):
+                            if values[i] is not None:
+                                error_rate_history.append({
+                                    'timestamp': timestamps[i],
+                                    'value': values[i]
+                                })
             
             # Historique du nombre de requêtes (uniquement si disponible)
             if service_id in req_history_dict:
                 req_history_data = req_history_dict[service_id]
-                if req_history_data and 'result' in req_history_data and req_history_data['result']:
-                    result = req_history_data['result'][0]
-                    if 'data' in result and result['data']:
-                        values = result['data'][0].get('values', [])
-                        timestamps = result['data'][0].get('timestamps', [])
-                        if values and timestamps:
-                            for i in range(len(values)):
-                                if values[i] is not None:
-                                    request_count_history.append({
-                                        'timestamp': timestamps[i],
-                                        'value': values[i]
-                                    })
+                if req_history_data:
+                    values = req_history_data.get('values', [])
+                    timestamps = req_history_data.get('timestamps', [])
+                    if values and timestamps:
+                        for i in range(len(values)):
+                            if values[i] is not None:
+                                request_count_history.append({
+                                    'timestamp': timestamps[i],
+                                    'value': values[i]
+                                })
             
             # Créer l'objet de métriques pour ce service
             service_metrics.append({
@@ -880,312 +1846,330 @@ class OptimizedAPIClient:
         
         return service_metrics
 
-    def get_hosts_metrics_parallel(self, host_ids, from_time, to_time):
+    def get_host_metrics_bulk(self, host_ids, from_time, to_time, mz_name=None):
         """
-        Récupère les métriques pour plusieurs hôtes en parallèle
-        Optimisé pour gérer de très grands nombres d'hôtes (au-delà de 400)
-        Utilise un traitement par lots avec taille de lot dynamique
+        Récupère CPU et RAM (valeur sur la période et séries à résolution 1h) de tous les hôtes
+        Une requête multi-métriques splitBy("dt.entity.host") par sélecteur d'entités remplace les
+        requêtes par hôte; le même jeu de résultats sert à /api/hosts et au résumé.
         
         Args:
             host_ids (list): Liste des IDs d'hôtes
             from_time (int): Timestamp de début
             to_time (int): Timestamp de fin
+            mz_name (str): Management Zone des hôtes (si None, sélection par lots d'IDs)
             
         Returns:
-            list: Métriques pour tous les hôtes
+            dict: {ID d'hôte: {'cpu', 'ram', 'cpu_history', 'ram_history'}}
         """
-        # Augmentation de la taille par défaut des lots pour accommoder plus d'hôtes
-        # Taille de lot adaptée selon le nombre total d'hôtes
-        if len(host_ids) > 1000:
-            chunk_size = 50  # Lots plus grands pour >1000 hôtes
-        elif len(host_ids) > 500:
-            chunk_size = 30  # Lots moyens pour >500 hôtes
-        else:
-            # Utiliser la taille de lot configurée ou 20 par défaut
-            chunk_size = int(os.environ.get('REQUEST_CHUNK_SIZE', 20))
-            
-        logger.info(f"Récupération des métriques pour {len(host_ids)} hôtes avec une taille de lot de {chunk_size}")
-        
-        # Si trop d'hôtes, traiter par lots
-        if len(host_ids) > chunk_size:
-            # Estimation du temps de traitement pour la progression
-            total_chunks = (len(host_ids) + chunk_size - 1) // chunk_size
-            estimated_chunk_time = 10  # secondes estimées par lot
-            estimated_total_time = total_chunks * estimated_chunk_time
-            logger.info(f"Traitement par lots de {len(host_ids)} hôtes en {total_chunks} lots. Temps estimé: ~{estimated_total_time/60:.1f} minutes")
-            
-            all_host_metrics = []
-            start_time = time.time()
-            
-            # Diviser les IDs en lots plus petits
-            for i in range(0, len(host_ids), chunk_size):
-                chunk_ids = host_ids[i:i + chunk_size]
-                chunk_num = i//chunk_size + 1
-                elapsed_time = time.time() - start_time
-                
-                # Calculer le temps restant estimé
-                if chunk_num > 1:
-                    time_per_chunk = elapsed_time / (chunk_num - 1)
-                    remaining_chunks = total_chunks - chunk_num + 1
-                    remaining_time = time_per_chunk * remaining_chunks
-                    logger.info(f"Traitement du lot {chunk_num}/{total_chunks} ({len(chunk_ids)} hôtes) - Temps restant estimé: ~{remaining_time/60:.1f} minutes")
-                else:
-                    logger.info(f"Traitement du lot {chunk_num}/{total_chunks} ({len(chunk_ids)} hôtes)")
-                
-                # Traiter ce lot
-                chunk_metrics = self._process_host_chunk(chunk_ids, from_time, to_time)
-                all_host_metrics.extend(chunk_metrics)
-                
-                # Log de progression après chaque lot
-                current_progress = (chunk_num / total_chunks) * 100
-                logger.info(f"Progression: {current_progress:.1f}% ({chunk_num}/{total_chunks} lots)")
-                
-                # Petite pause entre les lots pour éviter de surcharger l'API
-                # Pause plus courte pour les grands jeux de données
-                if i + chunk_size < len(host_ids):
-                    pause_time = 0.5 if len(host_ids) > 500 else 1
-                    time.sleep(pause_time)
-            
-            # Calcul du temps total
-            total_time = time.time() - start_time
-            logger.info(f"Traitement terminé pour {len(host_ids)} hôtes en {total_time/60:.1f} minutes")
-            
-            return all_host_metrics
-        else:
-            # Si peu d'hôtes, utiliser la méthode normale
-            return self._process_host_chunk(host_ids, from_time, to_time)
+        return self._collect_host_metrics(host_ids, self._submit_host_metrics(host_ids, from_time, to_time, mz_name))
 
-    def _process_host_chunk(self, host_ids, from_time, to_time):
+    def _submit_host_metrics(self, host_ids, from_time, to_time, mz_name=None):
         """
-        Traite un lot d'hôtes avec optimisations pour les grands lots
-        Réduit le nombre total de requêtes API et gère efficacement l'historique des métriques
+        Lance sur l'exécuteur partagé les requêtes splitBy de métriques d'hôtes
+        
+        Returns:
+            list: Tuples (résolution, Future)
         """
-        # Préparer les requêtes pour la récupération des détails des hôtes avec ID explicite
-        host_details_queries = []
-        for host_id in host_ids:
-            host_details_queries.append((
-                f"entities/{host_id}", 
-                None, 
-                True,
-                f"host_details:{host_id}"  # Clé de cache explicite avec ID
-            ))
+        if not host_ids:
+            return []
         
-        # Récupérer les détails des hôtes en parallèle
-        host_details_results = self.batch_query(host_details_queries)
+        host_metrics = ["builtin:host.cpu.usage", "builtin:host.mem.usage"]
+        entity_selectors = self._entity_selectors("HOST", host_ids, mz_name)
+        logger.info(f"Récupération des métriques CPU/RAM pour {len(host_ids)} hôtes en {len(entity_selectors) * 2} requêtes splitBy")
+        
+        metric_futures = []
+        for entity_selector in entity_selectors:
+            for resolution in ("Inf", "1h"):
+                metric_futures.append((resolution, self.executor.submit(
+                    self.query_split_metrics, host_metrics, entity_selector, "dt.entity.host",
+                    from_time, to_time, resolution, f"host_metrics:{resolution}:{entity_selector}:{from_time}:{to_time}"
+                )))
+        return metric_futures
+
+    def _collect_host_metrics(self, host_ids, metric_futures):
+        """
+        Attend les requêtes lancées par _submit_host_metrics et répartit les séries par hôte
         
-        # Créer un dictionnaire pour associer les résultats aux hôtes
-        host_details_dict = {}
-        for i, host_id in enumerate(host_ids):
-            host_details_dict[host_id] = host_details_results[i]
+        Returns:
+            dict: {ID d'hôte: {'cpu', 'ram', 'cpu_history', 'ram_history'}}
+        """
+        cpu_metrics, ram_metrics, cpu_history_dict, ram_history_dict = {}, {}, {}, {}
+        for resolution, future in metric_futures:
+            try:
+                cpu_series, ram_series = future.result()
+            except Exception as e:
+                logger.error(f"Erreur lors de la récupération des métriques d'hôtes (résolution {resolution}): {e}")
+                continue
+            if resolution == "Inf":
+                cpu_metrics.update(cpu_series)
+                ram_metrics.update(ram_series)
+            else:
+                cpu_history_dict.update(cpu_series)
+                ram_history_dict.update(ram_series)
         
-        # Préparer les requêtes de métriques avec clés explicites
-        metric_queries = []
+        metrics_by_host = {}
         for host_id in host_ids:
-            # Requête pour l'utilisation CPU avec ID explicite
-            metric_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:host.cpu.usage",
-                    "from": from_time,
-                    "to": to_time,
-                    "entitySelector": f"entityId({host_id})"
-                },
-                True,
-                f"cpu_usage:{host_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
-            
-            # Requête pour l'utilisation RAM avec ID explicite
-            metric_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:host.mem.usage",
-                    "from": from_time,
-                    "to": to_time,
-                    "entitySelector": f"entityId({host_id})"
-                },
-                True,
-                f"ram_usage:{host_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
-        
-        # Exécuter toutes les requêtes de métriques en parallèle
-        all_metric_results = self.batch_query(metric_queries)
-        
-        # Créer des dictionnaires pour associer les résultats de métriques aux hôtes
-        cpu_metrics = {}
-        ram_metrics = {}
+            metrics_by_host[host_id] = {
+                'cpu': self._series_value(cpu_metrics.get(host_id)),
+                'ram': self._series_value(ram_metrics.get(host_id)),
+                'cpu_history': self._series_history(cpu_history_dict.get(host_id)),
+                'ram_history': self._series_history(ram_history_dict.get(host_id))
+            }
+        return metrics_by_host
+
+    @staticmethod
+    def _series_value(series):
+        """Retourne la première valeur d'une série arrondie à 0,1 (None si absente)"""
+        if series:
+            values = series.get('values', [])
+            if values and values[0] is not None:
+                return round(values[0], 1)
+        return None
+
+    @staticmethod
+    def _series_history(series):
+        """Convertit une série en liste de points {timestamp, value} en ignorant les valeurs nulles"""
+        history = []
+        if series:
+            values = series.get('values', [])
+            timestamps = series.get('timestamps', [])
+            for timestamp, value in zip(timestamps, values):
+                if value is not None:
+                    history.append({
+                        'timestamp': timestamp,
+                        'value': value
+                    })
+        return history
+
+    def get_hosts_metrics_parallel(self, host_ids, from_time, to_time, mz_name=None):
+        """
+        Récupère les métriques pour plusieurs hôtes en parallèle
+        Optimisé pour gérer de très grands nombres d'hôtes (au-delà de 400): les métriques
+        proviennent de get_host_metrics_bulk pendant que les détails sont récupérés en parallèle.
         
-        # Distribuer les résultats dans des dictionnaires par ID d'hôte
-        result_index = 0
-        for host_id in host_ids:
-            cpu_metrics[host_id] = all_metric_results[result_index]
-            result_index += 1
-            ram_metrics[host_id] = all_metric_results[result_index]
-            result_index += 1
-        
-        # Pour l'historique, optimiser l'échantillonnage pour les grands nombres d'hôtes
-        if len(host_ids) > 100:
-            # Pour les très grands jeux de données, échantillonner de manière distribuée
-            # Par exemple, prendre un hôte tous les N hôtes pour avoir une représentation
-            sample_rate = max(1, len(host_ids) // 10)  # Prendre environ 10 hôtes
-            history_host_ids = host_ids[::sample_rate][:5]  # Limiter à 5 au maximum
-            logger.info(f"Pour les historiques avec {len(host_ids)} hôtes: échantillonnage 1/{sample_rate} (total: {len(history_host_ids)} hôtes)")
-        else:
-            # Pour les petits ensembles, prendre les 5 premiers comme avant
-            history_sample_size = min(len(host_ids), 5)
-            history_host_ids = host_ids[:history_sample_size]
-        
-        # Préparer les requêtes d'historique avec clés explicites
-        history_queries = []
-        for host_id in history_host_ids:
-            # Historique CPU avec ID explicite
-            history_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:host.cpu.usage",
-                    "from": from_time,
-                    "to": to_time,
-                    "resolution": "1h",
-                    "entitySelector": f"entityId({host_id})"
-                },
-                True,
-                f"cpu_history:{host_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
+        Args:
+            host_ids (list): Liste des IDs d'hôtes
+            from_time (int): Timestamp de début
+            to_time (int): Timestamp de fin
+            mz_name (str): Management Zone des hôtes (si None, sélection par lots d'IDs)
             
-            # Historique RAM avec ID explicite
-            history_queries.append((
-                "metrics/query",
-                {
-                    "metricSelector": "builtin:host.mem.usage",
-                    "from": from_time,
-                    "to": to_time,
-                    "resolution": "1h",
-                    "entitySelector": f"entityId({host_id})"
-                },
-                True,
-                f"ram_history:{host_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-            ))
+        Returns:
+            list: Métriques pour tous les hôtes
+        """
+        start_time = time.time()
         
-        # Exécuter les requêtes d'historique en parallèle
-        history_results = self.batch_query(history_queries)
+        # Lancer les requêtes de métriques en masse sur l'exécuteur partagé
+        metric_futures = self._submit_host_metrics(host_ids, from_time, to_time, mz_name)
         
-        # Créer des dictionnaires pour associer les résultats d'historique aux hôtes
-        cpu_history_dict = {}
-        ram_history_dict = {}
+        # Pendant ce temps, lire les détails des hôtes depuis le stock de métadonnées
+        host_details_dict = self.get_entities(host_ids, "HOST")
         
-        # Distribuer les résultats d'historique dans des dictionnaires par ID d'hôte
-        result_index = 0
-        for host_id in history_host_ids:
-            cpu_history_dict[host_id] = history_results[result_index]
-            result_index += 1
-            ram_history_dict[host_id] = history_results[result_index]
-            result_index += 1
+        metrics_by_host = self._collect_host_metrics(host_ids, metric_futures)
         
         # Maintenant, assembler les métriques pour chaque hôte
         host_metrics = []
         for host_id in host_ids:
-            host_details = host_details_dict[host_id]
-            cpu_data = cpu_metrics[host_id]
-            ram_data = ram_metrics[host_id]
-            
-            # Extraire les valeurs de métriques
-            cpu_usage = None
-            ram_usage = None
-            
-            # Traitement des données CPU
-            if cpu_data and 'result' in cpu_data and cpu_data['result']:
-                result = cpu_data['result'][0]
-                if 'data' in result and result['data']:
-                    values = result['data'][0].get('values', [])
-                    if values and values[0] is not None:
-                        cpu_usage = round(values[0], 1)
-            
-            # Traitement des données RAM
-            if ram_data and 'result' in ram_data and ram_data['result']:
-                result = ram_data['result'][0]
-                if 'data' in result and result['data']:
-                    values = result['data'][0].get('values', [])
-                    if values and values[0] is not None:
-                        ram_usage = round(values[0], 1)
-            
-            # Traiter les historiques (uniquement si disponible dans le dictionnaire)
-            cpu_history = []
-            ram_history = []
-            
-            # Historique CPU (uniquement si disponible)
-            if host_id in cpu_history_dict:
-                cpu_history_data = cpu_history_dict[host_id]
-                if cpu_history_data and 'result' in cpu_history_data and cpu_history_data['result']:
-                    result = cpu_history_data['result'][0]
-                    if 'data' in result and result['data']:
-                        values = result['data'][0].get('values', [])
-                        timestamps = result['data'][0].get('timestamps', [])
-                        if values and timestamps:
-                            for i in range(len(values)):
-                                if values[i] is not None:
-                                    cpu_history.append({
-                                        'timestamp': timestamps[i],
-                                        'value': values[i]
-                                    })
-            
-            # Historique RAM (uniquement si disponible)
-            if host_id in ram_history_dict:
-                ram_history_data = ram_history_dict[host_id]
-                if ram_history_data and 'result' in ram_history_data and ram_history_data['result']:
-                    result = ram_history_data['result'][0]
-                    if 'data' in result and result['data']:
-                        values = result['data'][0].get('values', [])
-                        timestamps = result['data'][0].get('timestamps', [])
-                        if values and timestamps:
-                            for i in range(len(values)):
-                                if values[i] is not None:
-                                    ram_history.append({
-                                        'timestamp': timestamps[i],
-                                        'value': values[i]
-                                    })
+            host_details = host_details_dict.get(host_id)
+            metrics = metrics_by_host.get(host_id, {})
             
             # Extraire la version de l'OS des propriétés de l'hôte
-            os_version = "Non spécifié"
-            if host_details and 'properties' in host_details:
-                properties = host_details.get('properties', {})
-                
-                # Vérifier différentes propriétés possibles pour l'OS
-                if 'osType' in properties:
-                    os_type = properties.get('osType', "")
-                    os_version = os_type
-                    
-                    # Ajouter la version si disponible
-                    if 'osVersion' in properties:
-                        os_version = f"{os_type} {properties.get('osVersion', '')}"
-                elif 'kernelVersion' in properties:
-                    os_version = f"Kernel {properties.get('kernelVersion', '')}"
-                    
-                    # Si osVersion est également disponible
-                    if 'osVersion' in properties:
-                        os_version = f"{properties.get('osVersion', '')} (Kernel {properties.get('kernelVersion', '')})"
-                
-                # Si aucune propriété spécifique n'est trouvée, chercher dans les tags
-                if os_version == "Non spécifié" and 'tags' in host_details:
-                    for tag in host_details.get('tags', []):
-                        # Chercher les tags liés à l'OS
-                        if tag.get('key') in ['OS', 'os', 'Operating System', 'system']:
-                            os_version = tag.get('value', "Non spécifié")
-                            break
+            os_version = self.entity_os_version(host_details)
             
             # Créer l'objet de métriques d'hôte
             host_metrics.append({
                 'id': host_id,
                 'name': host_details.get('displayName', 'Unknown') if host_details else 'Unknown',
-                'cpu': cpu_usage,
-                'ram': ram_usage,
+                'cpu': metrics.get('cpu'),
+                'ram': metrics.get('ram'),
                 'os_version': os_version,  # Ajout de la version de l'OS
                 'dt_url': f"{self.env_url}/ui/entity/{host_id}",
-                'cpu_history': cpu_history,
-                'ram_history': ram_history
+                'cpu_history': metrics.get('cpu_history', []),
+                'ram_history': metrics.get('ram_history', [])
             })
         
+        total_time = time.time() - start_time
+        logger.info(f"Traitement terminé pour {len(host_ids)} hôtes en {total_time:.1f} secondes")
         return host_metrics
 
 
+    def fetch_problems(self, time_from, mz_names=None, time_to=None, status=None):
+        """
+        Récupère tous les problèmes actifs sur une période, toutes pages comprises
+        Les MZ sont regroupées en aussi peu de requêtes managementZones("a","b",...) que la longueur
+        d'URL le permet (une ou deux pour un dashboard de 20 MZ) au lieu d'une requête par MZ.
+        Une longue période est découpée en tranches disjointes paginées en parallèle sur l'exécuteur
+        partagé: la pagination par nextPageKey reste séquentielle au sein d'une tranche seulement.
+        Seuls les problèmes fermés sont découpés: un problème ouvert recoupe toutes les tranches et
+        serait retourné par chacune, les ouverts sont donc demandés en une seule requête.
+        Ne pas appeler depuis une tâche de l'exécuteur partagé (risque d'interblocage).
+        
+        Args:
+            time_from: Début de la période (ms ou période relative, ex: "now-72h")
+            mz_names (list, optional): MZ à interroger (toutes si None)
+            time_to (optional): Fin de la période (ms, maintenant par défaut)
+            status (str, optional): Statut ("OPEN", "CLOSED", "OPEN,CLOSED"), tous par défaut
+            
+        Returns:
+            list: Problèmes bruts, dédupliqués par problemId
+            
+        Raises:
+            requests.RequestException: Si une page reste en échec (pas de résultat tronqué)
+        """
+        params = {'pageSize': 500}
+        
+        selectors = plan_mz_selectors(mz_names) if mz_names else [None]
+        queries = self._problem_queries(time_from, time_to, status)
+        if mz_names:
+            logger.info(f"Problèmes de {len(mz_names)} MZ récupérés en {len(selectors)} requête(s) groupée(s)")
+        if len(queries) > 1:
+            logger.info(f"Période de problèmes découpée en {len(queries)} requêtes parallèles")
+        tasks = [(selector,) + query for selector in selectors for query in queries]
+        
+        problems = {}
+        if len(tasks) == 1:
+            self._merge_problems(problems, self._fetch_problem_shard(params, *tasks[0]))
+        else:
+            futures = [self.executor.submit(self._fetch_problem_shard, params, *task) for task in tasks]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    self._merge_problems(problems, future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return list(problems.values())
+    
+    def _problem_queries(self, time_from, time_to=None, status=None):
+        """
+        Requêtes (statut, from, to) couvrant une période: les problèmes fermés par tranche de
+        _problem_windows, les problèmes ouverts en une seule requête sur toute la période
+        
+        Returns:
+            list: Triplets (statut ou None, from, to)
+        """
+        windows = self._problem_windows(time_from, time_to)
+        if len(windows) == 1:
+            return [(status,) + windows[0]]
+        statuses = [value.strip().upper() for value in status.split(',')] if status else ['OPEN', 'CLOSED']
+        queries = []
+        if 'OPEN' in statuses:
+            queries.append(('OPEN', windows[0][0], time_to))
+        if 'CLOSED' in statuses:
+            queries.extend(('CLOSED', window_from, window_to) for window_from, window_to in windows)
+        return queries or [(status, windows[0][0], time_to)]
+    
+    def _problem_windows(self, time_from, time_to=None):
+        """
+        Découpe une période en tranches disjointes [début, fin] d'au moins PROBLEM_SHARD_SPAN
+        
+        Returns:
+            list: Couples (from, to) à transmettre à l'API (to None: jusqu'à maintenant)
+        """
+        from_ms = relative_time_ms(time_from)
+        to_ms = relative_time_ms(time_to) if time_to is not None else int(time.time() * 1000)
+        if from_ms is None or to_ms is None:
+            return [(time_from, time_to)]
+        
+        span = to_ms - from_ms
+        shards = min(self.PROBLEM_MAX_SHARDS, -(-span // (self.PROBLEM_SHARD_SPAN * 1000)))
+        if shards <= 1:
+            return [(from_ms, time_to)]
+        bounds = [from_ms + span * index // shards for index in range(shards)]
+        windows = [(start, end - 1) for start, end in zip(bounds, bounds[1:])]
+        windows.append((bounds[-1], time_to))
+        return windows
+    
+    def _fetch_problem_shard(self, params, selector, status, window_from, window_to):
+        """Pagine une tranche de problèmes (sans préchargement: la tâche s'exécute déjà sur l'exécuteur)"""
+        query = dict(params, **{'from': window_from})
+        if status:
+            query['status'] = status
+        if window_to is not None:
+            query['to'] = window_to
+        if selector:
+            query['problemSelector'] = selector
+        return list(self.paginate_items("problems", query, "problems", use_cache=False, prefetch=False))
+    
+    @staticmethod
+    def _merge_problems(problems, shard):
+        """
+        Fusionne une tranche dans le résultat par problemId
+        Un problème actif sur plusieurs tranches y apparaît plusieurs fois; la version la plus
+        avancée (fermée, ou de fin la plus tardive) l'emporte si son état a changé entre deux tranches.
+        """
+        for problem in shard:
+            problem_id = problem.get('problemId')
+            if not problem_id:
+                continue
+            current = problems.get(problem_id)
+            if current is None or (problem.get('endTime') or 0) > (current.get('endTime') or 0):
+                problems[problem_id] = problem
+    
+    def get_problem_details(self, problem_ids):
+        """
+        Récupère en parallèle le détail de plusieurs problèmes
+        Ne pas appeler depuis une tâche de l'exécuteur partagé (risque d'interblocage).
+        
+        Args:
+            problem_ids (iterable): Identifiants des problèmes
+            
+        Returns:
+            dict: problemId -> problème, ou None si le problème n'existe plus (404);
+                  les problèmes en erreur sont absents du résultat
+        """
+        futures = {self.executor.submit(self.query_api, f"problems/{problem_id}", None, False): problem_id
+                   for problem_id in problem_ids}
+        details = {}
+        for future in concurrent.futures.as_completed(futures):
+            problem_id = futures[future]
+            try:
+                details[problem_id] = future.result()
+            except requests.RequestException as e:
+                if e.response is not None and e.response.status_code == 404:
+                    details[problem_id] = None
+                else:
+                    logger.error(f"Erreur lors de la récupération du problème {problem_id}: {e}")
+        return details
+    
+    def enrich_problems(self, problems):
+        """
+        Complète les problèmes dont la liste n'a pas fourni les entités impactées
+        Les détails manquants sont récupérés en un seul lot parallèle et mis en cache par problemId
+        et état (statut, heure de fin): seuls les problèmes nouveaux ou modifiés sont interrogés.
+        Ne pas appeler depuis une tâche de l'exécuteur partagé (risque d'interblocage).
+        
+        Args:
+            problems (list): Problèmes bruts de l'API, complétés sur place
+            
+        Returns:
+            int: Nombre de problèmes interrogés auprès de l'API
+        """
+        missing = {}
+        for problem in problems:
+            problem_id = problem.get('problemId')
+            if not problem_id or 'impactedEntities' in problem:
+                continue
+            cache_key = f"problem_details:{problem_id}:{problem.get('status')}:{problem.get('endTime')}"
+            cached = self.get_cached(cache_key)
+            if cached is not None:
+                problem['impactedEntities'] = cached
+            else:
+                missing.setdefault(problem_id, []).append((problem, cache_key))
+        
+        if not missing:
+            return 0
+        
+        logger.info(f"Enrichissement groupé de {len(missing)} problème(s) sans entités impactées")
+        details = self.get_problem_details(missing.keys())
+        for problem_id, entries in missing.items():
+            detail = details.get(problem_id)
+            if not detail or 'impactedEntities' not in detail:
+                continue
+            for problem, cache_key in entries:
+                problem['impactedEntities'] = detail['impactedEntities']
+                self.set_cache(cache_key, detail['impactedEntities'])
+        return len(missing)
+    
     def get_problems_filtered(self, mz_name=None, time_from="-24h", status="OPEN"):
         """
         Récupère et filtre les problèmes pour une management zone spécifique
@@ -1216,35 +2200,16 @@ class OptimizedAPIClient:
                 return cached_data
         
         try:
-            # Préparer les paramètres de requête
-            params = {"from": time_from}
-            
             # Pour ALL, on veut tous les problèmes, y compris OPEN et CLOSED
             # Pour ce faire, nous ne spécifierons pas de statut à l'API Dynatrace,
             # ce qui retournera tous les problèmes, puis nous filtrerons selon les besoins
-            if status is not None and status != "ALL":
-                params["status"] = status
-            
-            # AMÉLIORATION: Utiliser problemSelector pour filtrer directement par MZ
-            # Cette approche est plus efficace et cohérente avec test_get_problems
-            if mz_name:
-                # Échapper les guillemets doubles dans le nom de la MZ pour le sélecteur
-                escaped_mz_name = mz_name.replace('"', '\\"')
-                params["problemSelector"] = f'managementZones("{escaped_mz_name}")'
-                logger.info(f"Utilisation de problemSelector pour filtrer par MZ: {params['problemSelector']}")
-                
-            # Déboguer les paramètres
-            logger.info(f"Requête problèmes avec paramètres: {params}, mz_name: {mz_name}")
-            
-            # Pour les problèmes avec ALL sur une longue période, augmenter la taille max de page
-            if status == "ALL" and (time_from.startswith("-7") or time_from.startswith("-3")):
-                params["pageSize"] = 500  # Augmenter la taille maximale des résultats
+            api_status = status if status is not None and status != "ALL" else None
             
-            problems_data = self.query_api(
-                endpoint="problems",
-                params=params,
-                use_cache=False  # Forcer la requête sans utiliser le cache interne de query_api
-            )
+            # Filtrage par MZ directement via problemSelector, toutes pages comprises
+            # La liste de l'API v2 inclut déjà les impactedEntities de chaque problème
+            problems_data = {'problems': self.fetch_problems(
+                time_from, mz_names=[mz_name] if mz_name else None, status=api_status)}
+            self.enrich_problems(problems_data['problems'])
             
             # Déboguer les résultats
             total_problems = len(problems_data.get('problems', [])) if 'problems' in problems_data else 0
@@ -1383,49 +2348,16 @@ class OptimizedAPIClient:
                 if mz_name:
                     logger.info(f"Problèmes filtrés appartenant à {mz_name}: {mz_problems}/{total_problems}")
                 
-                # Enrichir chaque problème avec les données des entités impactées
-                enriched_problems = []
-                for formatted_problem in active_problems:
-                    problem_id = formatted_problem.get('id')
-                    if problem_id:
-                        try:
-                            # Récupérer les détails du problème pour obtenir les entités impactées
-                            problem_details = self.query_api(
-                                endpoint=f"problems/{problem_id}",
-                                params={"fields": "+impactedEntities"},
-                                use_cache=True
-                            )
-                            
-                            # Si nous avons les impactedEntities, les ajouter au problème formaté
-                            if problem_details and 'impactedEntities' in problem_details:
-                                formatted_problem['impactedEntities'] = problem_details.get('impactedEntities', [])
-                                
-                                # Vérifier s'il y a une entité hôte pour enrichir le champ 'host'
-                                for entity in problem_details.get('impactedEntities', []):
-                                    if entity.get('entityId', {}).get('type') == 'HOST':
-                                        host_name = entity.get('name')
-                                        if host_name:
-                                            formatted_problem['host'] = host_name
-                                            formatted_problem['impacted'] = host_name
-                                            break
-                        except Exception as e:
-                            logger.error(f"Erreur lors de l'enrichissement du problème {problem_id}: {e}")
-                    
-                    enriched_problems.append(formatted_problem)
-                
-                # Remplacer la liste des problèmes formatés par la liste enrichie
-                active_problems = enriched_problems
-            
             # Pour les problèmes actifs (OPEN), utiliser une durée de cache réduite
             # pour les autres types, utiliser la durée standard
             if status == "OPEN" or status is None:
                 # La durée de mise en cache pour les problèmes actifs est gérée par PROBLEMS_CACHE_DURATION dans app.py
                 # Elle est plus courte pour garantir des données plus à jour
                 # Utiliser la méthode standard mais noter qu'en app.py, le cache sera court-circuité pour les OPEN
-                self.set_cache(cache_key, active_problems)
+                self.set_cache(cache_key, active_problems, tags=[mz_tag(mz_name)] if mz_name else None, shared=True)
                 logger.info(f"Mise en cache des problèmes actifs pour {cache_key} - durée limitée")
             else:
-                self.set_cache(cache_key, active_problems)
+                self.set_cache(cache_key, active_problems, tags=[mz_tag(mz_name)] if mz_name else None, shared=True)
                 logger.info(f"Mise en cache standard des problèmes pour {cache_key}")
             
             return active_problems
@@ -1815,7 +2747,7 @@ class OptimizedAPIClient:
                     'data_quality': 'partial'  # Indiquer que les données sont partielles
                 }
                 
-                self.set_cache(cache_key, summary)
+                self.set_cache(cache_key, summary, tags=[mz_tag(mz_name)], shared=True)
                 return summary
             
             # Calculer les métriques résumées
@@ -1823,59 +2755,13 @@ class OptimizedAPIClient:
             hosts_count = len(hosts_data.get('entities', []))
             problems_count = len(problems_data.get('problems', []))
             
-            # Limiter le nombre d'hôtes et de services pour éviter la surcharge
+            # Limiter le nombre de services pour éviter la surcharge
             max_metrics_entities = int(os.environ.get('MAX_METRICS_ENTITIES', 20))
             
-            # Pour les hôtes, ne prendre que les MAX_METRICS_ENTITIES premiers
-            host_entities = hosts_data.get('entities', [])[:max_metrics_entities]
-            
-            # Préparer les requêtes de métriques en lot pour les hôtes limités
-            host_metric_queries = []
-            
-            for host in host_entities:
-                host_id = host.get('entityId')
-                host_metric_queries.append((
-                    "metrics/query",
-                    {
-                        "metricSelector": "builtin:host.cpu.usage",
-                        "from": from_time,
-                        "to": to_time,
-                        "entitySelector": f"entityId({host_id})"
-                    },
-                    True,
-                    f"summary_host_cpu:{host_id}:{from_time}:{to_time}"  # Clé explicite avec ID
-                ))
-            
-            # Exécuter les requêtes CPU en parallèle
-            host_cpu_results = self.batch_query(host_metric_queries)
-            
-            # Créer un mapping hôte ID -> résultats CPU
-            host_cpu_dict = {}
-            for i, host in enumerate(host_entities):
-                host_id = host.get('entityId')
-                host_cpu_dict[host_id] = host_cpu_results[i]
-            
-            # Calculer l'utilisation moyenne du CPU et le nombre d'hôtes critiques
-            total_cpu = 0
-            critical_hosts = 0
-            valid_cpu_count = 0
-            
-            for host in host_entities:
-                host_id = host.get('entityId')
-                cpu_data = host_cpu_dict[host_id]
-                
-                if cpu_data and 'result' in cpu_data and cpu_data['result']:
-                    result = cpu_data['result'][0]
-                    if 'data' in result and result['data']:
-                        values = result['data'][0].get('values', [])
-                        if values and values[0] is not None:
-                            cpu_usage = int(values[0])
-                            if cpu_usage > 80:
-                                critical_hosts += 1
-                            total_cpu += cpu_usage
-                            valid_cpu_count += 1
-            
-            avg_cpu = round(total_cpu / valid_cpu_count, 1) if valid_cpu_count > 0 else 0
+            # Pour les hôtes, utiliser le moteur de métriques en masse (le même que /api/hosts):
+            # quelques requêtes splitBy couvrent tous les hôtes, sans limite MAX_METRICS_ENTITIES
+            host_ids = [host.get('entityId') for host in hosts_data.get('entities', [])]
+            host_metric_futures = self._submit_host_metrics(host_ids, from_time, to_time, mz_name)
             
             # Pour les services, ne prendre que les MAX_METRICS_ENTITIES premiers
             service_entities = services_data.get('entities', [])[:max_metrics_entities]
@@ -1911,8 +2797,25 @@ class OptimizedAPIClient:
                     f"summary_service_errors:{service_id}:{from_time}:{to_time}"  # Clé explicite avec ID
                 ))
             
-            # Exécuter les requêtes de services en parallèle
+            # Exécuter les requêtes des services pendant que celles des hôtes sont en vol
             service_metric_results = self.batch_query(service_metric_queries)
+            metrics_by_host = self._collect_host_metrics(host_ids, host_metric_futures)
+            
+            # Calculer l'utilisation moyenne du CPU et le nombre d'hôtes critiques
+            total_cpu = 0
+            critical_hosts = 0
+            valid_cpu_count = 0
+            
+            for host_id in host_ids:
+                cpu_value = metrics_by_host.get(host_id, {}).get('cpu')
+                if cpu_value is not None:
+                    cpu_usage = int(cpu_value)
+                    if cpu_usage > 80:
+                        critical_hosts += 1
+                    total_cpu += cpu_usage
+                    valid_cpu_count += 1
+            
+            avg_cpu = round(total_cpu / valid_cpu_count, 1) if valid_cpu_count > 0 else 0
             
             # Créer des dictionnaires pour associer les résultats aux services
             service_requests_dict = {}
@@ -1985,7 +2888,7 @@ class OptimizedAPIClient:
             }
             
             # Mettre en cache le résumé
-            self.set_cache(cache_key, summary)
+            self.set_cache(cache_key, summary, tags=[mz_tag(mz_name)], shared=True)
             
             return summary
         except Exception as e:
@@ -2002,9 +2905,10 @@ def time_execution(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        logger.info(f"Fonction {func.__name__} exécutée en {elapsed_time:.2f} secondes")
-        return result
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed_time = time.time() - start_time
+            metrics.observe('function_duration_seconds', elapsed_time, function=func.__name__)
+            logger.info(f"Fonction {func.__name__} exécutée en {elapsed_time:.2f} secondes")
     return wrapper
@@ -0,0 +1,707 @@
+"""
+Magasin local des problèmes Dynatrace et moteur de synchronisation incrémentale
+La fenêtre de synchronisation (60 jours par défaut) est chargée une seule fois pour les MZ suivies,
+puis seuls les problèmes actifs depuis le dernier curseur sont redemandés: ouvertures, mises à jour
+et résolutions sont reportées dans le magasin en quelques secondes. Les routes de problèmes lisent
+le magasin au lieu d'interroger Dynatrace à chaque requête.
+Avec plusieurs workers, l'état complet du magasin est publié dans le cache partagé à chaque
+rechargement complet, puis seules les modifications de chaque passage (deltas); les autres workers
+appliquent ces deltas au lieu de synchroniser eux-mêmes.
+Tant que le leader détient son bail, les autres workers ne synchronisent jamais pendant une requête.
+"""
+
+import re
+import time
+import bisect
+import threading
+import logging
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Périodes relatives acceptées par l'API Dynatrace (ex: "-72h", "now-30d", "now-2w")
+RELATIVE_TIME_PATTERN = re.compile(r'^(?:now)?-(\d+)([smhdw])$')
+TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def relative_time_ms(time_from, now_ms=None):
+    """
+    Convertit une période Dynatrace en horodatage absolu (millisecondes)
+
+    Args:
+        time_from (str): Période relative ("-72h", "now-30d") ou horodatage en millisecondes
+        now_ms (int, optional): Instant de référence (défaut: maintenant)
+
+    Returns:
+        int: Horodatage en millisecondes, ou None si le format n'est pas reconnu
+    """
+    if time_from is None:
+        return None
+    time_from = str(time_from).strip()
+    if time_from.isdigit():
+        return int(time_from)
+    match = RELATIVE_TIME_PATTERN.match(time_from)
+    if not match:
+        return None
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    return now_ms - int(match.group(1)) * TIME_UNITS[match.group(2)] * 1000
+
+
+def is_open(problem):
+    """Un problème est ouvert tant qu'il a le statut OPEN et aucune heure de fin"""
+    return problem.get('status') == 'OPEN' and (problem.get('endTime') or 0) <= 0
+
+
+def problem_mzs(problem):
+    """
+    Management Zones d'un problème: celles du problème et celles de ses entités affectées ou impactées
+
+    Returns:
+        set: Noms des MZ
+    """
+    names = {mz.get('name') for mz in problem.get('managementZones', [])}
+    for key in ('affectedEntities', 'impactedEntities'):
+        for entity in problem.get(key, []):
+            names.update(mz.get('name') for mz in entity.get('managementZones', []))
+    names.discard(None)
+    return names
+
+
+def problem_hosts(problem):
+    """
+    Hôtes impactés ou affectés par un problème, par nom et par identifiant (en minuscules)
+
+    Returns:
+        set: Noms et identifiants des entités HOST
+    """
+    hosts = set()
+    for key in ('impactedEntities', 'affectedEntities'):
+        for entity in problem.get(key, []):
+            entity_id = entity.get('entityId', {})
+            if entity_id.get('type') == 'HOST' or entity.get('type') == 'HOST':
+                for value in (entity.get('name'), entity_id.get('id')):
+                    if value:
+                        hosts.add(value.lower())
+    root_cause = problem.get('rootCauseEntity') or {}
+    if root_cause.get('entityId', {}).get('type') == 'HOST' and root_cause.get('name'):
+        hosts.add(root_cause['name'].lower())
+    return hosts
+
+
+class ProblemStore:
+    """
+    Problèmes Dynatrace bruts indexés par problemId, avec des listes de correspondance (postings)
+    par MZ, état (ouvert/fermé), niveau d'impact, hôte impacté et tranche horaire de début et de fin
+    Une requête est une intersection d'ensembles d'identifiants, en partant du plus petit.
+    Chaque modification effective incrémente 'version', ce qui permet aux lecteurs
+    et aux autres workers de savoir si le contenu a changé.
+    """
+
+    def __init__(self, bucket_seconds=3600):
+        """
+        Args:
+            bucket_seconds (int): Largeur des tranches horaires des index de début et de fin
+        """
+        self.bucket_ms = bucket_seconds * 1000
+        self.lock = threading.RLock()
+        self._problems = {}
+        self._by_mz = {}
+        self._by_state = {'open': set(), 'closed': set()}
+        self._by_impact = {}
+        self._by_host = {}
+        self._by_start = {}
+        self._by_end = {}
+        # Tranches triées, pour parcourir les tranches postérieures à un instant
+        self._start_buckets = []
+        self._end_buckets = []
+        self.version = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self._problems)
+
+    def get(self, problem_id):
+        with self.lock:
+            return self._problems.get(problem_id)
+
+    def _bucket(self, timestamp_ms):
+        return timestamp_ms // self.bucket_ms
+
+    @staticmethod
+    def _add_posting(index, key, problem_id, sorted_keys=None):
+        postings = index.get(key)
+        if postings is None:
+            postings = index[key] = set()
+            if sorted_keys is not None:
+                bisect.insort(sorted_keys, key)
+        postings.add(problem_id)
+
+    @staticmethod
+    def _remove_posting(index, key, problem_id, sorted_keys=None):
+        postings = index.get(key)
+        if postings is None:
+            return
+        postings.discard(problem_id)
+        if not postings:
+            del index[key]
+            if sorted_keys is not None:
+                del sorted_keys[bisect.bisect_left(sorted_keys, key)]
+
+    def _index_keys(self, problem):
+        """Clés d'index d'un problème: (index, clé, tranches triées) pour chaque posting"""
+        keys = [(self._by_mz, mz_name, None) for mz_name in problem_mzs(problem)]
+        keys.append((self._by_impact, problem.get('impactLevel') or 'UNKNOWN', None))
+        keys.extend((self._by_host, host, None) for host in problem_hosts(problem))
+        keys.append((self._by_start, self._bucket(problem.get('startTime') or 0), self._start_buckets))
+        if not is_open(problem):
+            keys.append((self._by_end, self._bucket(problem.get('endTime') or 0), self._end_buckets))
+        return keys
+
+    def _index(self, problem_id, problem):
+        """Ajoute un problème aux index (verrou tenu)"""
+        self._by_state['open' if is_open(problem) else 'closed'].add(problem_id)
+        for index, key, sorted_keys in self._index_keys(problem):
+            self._add_posting(index, key, problem_id, sorted_keys)
+
+    def _unindex(self, problem_id, problem):
+        """Retire un problème des index (verrou tenu)"""
+        self._by_state['open'].discard(problem_id)
+        self._by_state['closed'].discard(problem_id)
+        for index, key, sorted_keys in self._index_keys(problem):
+            self._remove_posting(index, key, problem_id, sorted_keys)
+
+    def upsert(self, problems, changes=None):
+        """
+        Insère ou remplace des problèmes (un problème identique à celui stocké est ignoré)
+
+        Args:
+            problems (iterable): Problèmes bruts de l'API
+            changes (dict, optional): Reçoit problemId -> problème pour chaque modification effective
+
+        Returns:
+            tuple: (nombre de problèmes ajoutés, nombre de problèmes modifiés)
+        """
+        added = updated = 0
+        with self.lock:
+            for problem in problems:
+                problem_id = problem.get('problemId')
+                if not problem_id:
+                    continue
+                current = self._problems.get(problem_id)
+                if current == problem:
+                    continue
+                if current is None:
+                    added += 1
+                else:
+                    updated += 1
+                    self._unindex(problem_id, current)
+                self._problems[problem_id] = problem
+                self._index(problem_id, problem)
+                if changes is not None:
+                    changes[problem_id] = problem
+            if added or updated:
+                self.version += 1
+        return added, updated
+
+    def remove(self, problem_ids, changes=None):
+        """
+        Supprime des problèmes par identifiant et retourne le nombre supprimé
+
+        Args:
+            problem_ids (iterable): Identifiants des problèmes
+            changes (dict, optional): Reçoit problemId -> None pour chaque problème supprimé
+        """
+        removed = 0
+        with self.lock:
+            for problem_id in problem_ids:
+                problem = self._problems.pop(problem_id, None)
+                if problem is not None:
+                    self._unindex(problem_id, problem)
+                    removed += 1
+                    if changes is not None:
+                        changes[problem_id] = None
+            if removed:
+                self.version += 1
+        return removed
+
+    def _since(self, index, sorted_keys, from_ms, time_key):
+        """Identifiants des tranches postérieures à un instant, tranche de bord vérifiée précisément (verrou tenu)"""
+        first = self._bucket(from_ms)
+        position = bisect.bisect_left(sorted_keys, first)
+        result = set()
+        for key in sorted_keys[position:]:
+            if key == first:
+                result.update(problem_id for problem_id in index[key]
+                              if (self._problems[problem_id].get(time_key) or 0) >= from_ms)
+            else:
+                result.update(index[key])
+        return result
+
+    def prune(self, before_ms, changes=None):
+        """
+        Supprime les problèmes fermés avant un instant (sortis de la fenêtre de synchronisation)
+
+        Args:
+            before_ms (int): Instant limite (ms)
+            changes (dict, optional): Reçoit problemId -> None pour chaque problème supprimé
+
+        Returns:
+            int: Nombre de problèmes supprimés
+        """
+        with self.lock:
+            position = bisect.bisect_right(self._end_buckets, self._bucket(before_ms))
+            expired = [problem_id for key in self._end_buckets[:position] for problem_id in self._by_end[key]
+                       if 0 < (self._problems[problem_id].get('endTime') or 0) < before_ms]
+        return self.remove(expired, changes)
+
+    def query(self, mz_names=None, status=None, start_from=None, active_from=None, impact=None, host=None):
+        """
+        Sélectionne des problèmes du magasin par intersection des index
+
+        Args:
+            mz_names (iterable, optional): MZ dont au moins une doit concerner le problème
+            status (str, optional): "OPEN" (ouverts) ou "CLOSED" (fermés), tous sinon
+            start_from (int, optional): Problèmes ouverts à partir de cet instant (ms)
+            active_from (int, optional): Problèmes encore actifs à partir de cet instant (ms)
+            impact (str, optional): Niveau d'impact (ex: "INFRASTRUCTURE", "SERVICES")
+            host (str, optional): Nom ou identifiant d'un hôte impacté (insensible à la casse)
+
+        Returns:
+            list: Problèmes bruts, du plus récent au plus ancien
+        """
+        with self.lock:
+            candidates = []
+            if mz_names is not None:
+                candidates.append(set().union(*(self._by_mz.get(mz_name, ()) for mz_name in mz_names)))
+            if status == 'OPEN':
+                candidates.append(self._by_state['open'])
+            elif status == 'CLOSED':
+                candidates.append(self._by_state['closed'])
+            if impact:
+                candidates.append(self._by_impact.get(impact, set()))
+            if host:
+                candidates.append(self._by_host.get(host.lower(), set()))
+            if start_from is not None:
+                candidates.append(self._since(self._by_start, self._start_buckets, start_from, 'startTime'))
+            if active_from is not None:
+                candidates.append(self._by_state['open'] | self._since(self._by_end, self._end_buckets, active_from, 'endTime'))
+
+            if candidates:
+                candidates.sort(key=len)
+                problem_ids = set(candidates[0]).intersection(*candidates[1:])
+            else:
+                problem_ids = self._problems.keys()
+            result = [self._problems[problem_id] for problem_id in problem_ids]
+        result.sort(key=lambda problem: problem.get('startTime') or 0, reverse=True)
+        return result
+
+    def problems_for(self, mz_names):
+        """Identifiants des problèmes concernant au moins une des MZ"""
+        with self.lock:
+            return set().union(*(self._by_mz.get(mz_name, ()) for mz_name in mz_names))
+
+    def export(self):
+        """Liste des problèmes stockés (pour publication dans le cache partagé)"""
+        with self.lock:
+            return list(self._problems.values())
+
+    def load(self, problems):
+        """Remplace le contenu du magasin et reconstruit les index"""
+        with self.lock:
+            self._problems = {}
+            self._by_mz = {}
+            self._by_state = {'open': set(), 'closed': set()}
+            self._by_impact = {}
+            self._by_host = {}
+            self._by_start = {}
+            self._by_end = {}
+            self._start_buckets = []
+            self._end_buckets = []
+            for problem in problems:
+                problem_id = problem.get('problemId')
+                if problem_id:
+                    self._problems[problem_id] = problem
+                    self._index(problem_id, problem)
+            self.version += 1
+
+    def stats(self):
+        """Taille des index"""
+        with self.lock:
+            return {
+                'mzs': len(self._by_mz),
+                'open': len(self._by_state['open']),
+                'closed': len(self._by_state['closed']),
+                'impacts': len(self._by_impact),
+                'hosts': len(self._by_host),
+                'start_buckets': len(self._start_buckets)
+            }
+
+
+class ProblemSyncEngine:
+    """
+    Synchronise le magasin de problèmes avec Dynatrace
+    Une MZ nouvellement suivie est chargée sur toute la fenêtre; ensuite, chaque passage ne
+    demande que les problèmes actifs depuis le dernier curseur (l'API retourne les problèmes dont
+    la période d'activité recoupe l'intervalle demandé, donc les ouverts et ceux résolus depuis).
+    Un problème ouvert en magasin absent d'un passage est revérifié individuellement.
+    """
+
+    # Nombre maximal de deltas publiés entre deux états complets
+    MAX_DELTAS = 500
+
+    def __init__(self, api_client, scope, window='-60d', poll_interval=15, overlap=60,
+                 full_sync_interval=3600, shared_key='problem_store:state', leader_active=None, leader_grace=None):
+        """
+        Initialise le moteur
+
+        Args:
+            api_client (OptimizedAPIClient): Client API Dynatrace
+            scope (callable): Retourne la liste des MZ à synchroniser
+            window (str): Fenêtre de synchronisation (période relative Dynatrace)
+            poll_interval (int): Âge maximal (secondes) du magasin avant un nouveau passage
+            overlap (int): Recouvrement (secondes) entre deux passages, pour les horloges décalées
+            full_sync_interval (int): Intervalle (secondes) entre deux rechargements complets de la fenêtre
+            shared_key (str): Clé de l'état publié dans le cache partagé
+            leader_active (callable, optional): Retourne True quand un autre worker (le leader) détient
+                                                le bail et synchronise le magasin à la place de celui-ci
+            leader_grace (int, optional): Délai (secondes) sans publication du leader au-delà duquel ce
+                                          worker synchronise lui-même, 3 intervalles par défaut
+        """
+        self.api_client = api_client
+        self.scope = scope
+        self.window = window
+        self.poll_interval = poll_interval
+        self.overlap = overlap
+        self.full_sync_interval = full_sync_interval
+        self.shared_key = shared_key
+        self.leader_active = leader_active
+        self.leader_grace = leader_grace or poll_interval * 3
+        self.store = ProblemStore()
+        self.sync_lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        # MZ chargées sur toute la fenêtre, et MZ ajoutées à la demande (hors listes configurées)
+        self.loaded_mzs = set()
+        self.extra_mzs = set()
+        self.cursor = None
+        self.last_sync = 0
+        self.last_full_sync = 0
+        self.last_error = None
+        self.syncs = 0
+        # Horodatage de l'état partagé correspondant au contenu du magasin, et deltas appliqués depuis
+        self.state_timestamp = None
+        self.deltas = []
+        # Dernière publication du leader observée, et début de l'attente de sa première publication
+        self.leader_seen = None
+        self.waiting_since = None
+
+    def window_start(self, now_ms=None):
+        return relative_time_ms(self.window, now_ms)
+
+    def covers(self, time_from):
+        """Indique si une période demandée tient dans la fenêtre synchronisée"""
+        # Même instant de référence pour les deux bornes: "-60d" doit couvrir une fenêtre de 60 jours
+        now_ms = int(time.time() * 1000)
+        from_ms = relative_time_ms(time_from, now_ms)
+        return from_ms is not None and from_ms >= self.window_start(now_ms)
+
+    def tracked_mzs(self):
+        requested = self._shared_requests()
+        if requested:
+            self.track(requested)
+        with self.state_lock:
+            extra = list(self.extra_mzs)
+        mzs = []
+        for mz_name in list(self.scope()) + extra:
+            if mz_name and mz_name not in mzs:
+                mzs.append(mz_name)
+        return mzs
+
+    def track(self, mz_names):
+        """Ajoute des MZ à synchroniser en plus du périmètre configuré"""
+        with self.state_lock:
+            self.extra_mzs.update(mz_name for mz_name in mz_names if mz_name)
+
+    def _shared_requests(self):
+        """MZ demandées par les autres workers hors périmètre configuré (voir _request_tracking)"""
+        shared_cache = self.api_client.shared_cache
+        if shared_cache is None:
+            return []
+        entry = shared_cache.get(f"{self.shared_key}:requests")
+        return entry['data'] if entry else []
+
+    def _request_tracking(self, mz_names):
+        """Demande au leader de suivre des MZ hors périmètre configuré"""
+        shared_cache = self.api_client.shared_cache
+        if shared_cache is None:
+            return
+        requested = self._shared_requests()
+        if all(mz_name in requested for mz_name in mz_names):
+            return
+        requested = sorted(set(requested) | set(mz_names))
+        shared_cache.set(f"{self.shared_key}:requests", requested, time.time(), duration=self.full_sync_interval)
+        logger.info(f"Suivi de {len(mz_names)} MZ demandé au leader de la synchronisation des problèmes")
+
+    def _fetch(self, mz_names, from_ms):
+        return self.api_client.fetch_problems(from_ms, mz_names=mz_names)
+
+    def sync(self, full=False):
+        """
+        Exécute un passage de synchronisation
+
+        Args:
+            full (bool): Recharger toute la fenêtre pour toutes les MZ suivies
+
+        Returns:
+            bool: True si le magasin a changé
+        """
+        with self.sync_lock:
+            start_time = time.time()
+            now_ms = int(start_time * 1000)
+            mzs = self.tracked_mzs()
+            if full or start_time - self.last_full_sync >= self.full_sync_interval:
+                full = True
+                new_mzs, known_mzs = mzs, []
+            else:
+                new_mzs = [mz_name for mz_name in mzs if mz_name not in self.loaded_mzs]
+                known_mzs = [mz_name for mz_name in mzs if mz_name in self.loaded_mzs]
+            version = self.store.version
+            loaded_mzs = set(self.loaded_mzs)
+            # Modifications du passage (problemId -> problème, ou None si supprimé), publiées en delta
+            changes = {}
+
+            try:
+                if new_mzs:
+                    problems = self._fetch(new_mzs, self.window_start(now_ms))
+                    self.store.upsert(problems, changes)
+                    # Rechargement complet: les problèmes de ces MZ absents de la réponse n'existent plus
+                    returned = {problem.get('problemId') for problem in problems}
+                    self.store.remove(self.store.problems_for(new_mzs) - returned, changes)
+                    logger.info(f"Problèmes chargés sur {self.window} pour {len(new_mzs)} MZ: {len(problems)} problèmes")
+
+                if known_mzs and self.cursor is not None:
+                    problems = self._fetch(known_mzs, self.cursor - self.overlap * 1000)
+                    added, updated = self.store.upsert(problems, changes)
+                    self._reconcile(known_mzs, problems, changes)
+                    if added or updated:
+                        logger.info(f"Synchronisation incrémentale des problèmes: {added} nouveaux, {updated} modifiés")
+
+                self.store.prune(self.window_start(now_ms), changes)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Erreur lors de la synchronisation des problèmes: {e}")
+                raise
+
+            self.loaded_mzs = set(mzs) if full else self.loaded_mzs | set(new_mzs)
+            self.cursor = now_ms
+            self.last_sync = start_time
+            if full:
+                self.last_full_sync = start_time
+            self.last_error = None
+            self.syncs += 1
+            changed = self.store.version != version
+            self._publish(changes, full=full, mzs_changed=self.loaded_mzs != loaded_mzs)
+            return changed
+
+    def _reconcile(self, mz_names, problems, changes=None):
+        """Revérifie les problèmes ouverts en magasin qui n'apparaissent plus dans un passage incrémental"""
+        returned = {problem.get('problemId') for problem in problems}
+        missing = [problem_id for problem_id in self.store.problems_for(mz_names)
+                   if problem_id not in returned and is_open(self.store.get(problem_id))]
+        if not missing:
+            return
+        details = self.api_client.get_problem_details(missing)
+        self.store.upsert((problem for problem in details.values() if problem), changes)
+        self.store.remove((problem_id for problem_id, problem in details.items() if problem is None), changes)
+        logger.info(f"{len(missing)} problèmes ouverts absents de la synchronisation revérifiés")
+
+    def _publish(self, changes, full=False, mzs_changed=False):
+        """
+        Publie l'état du magasin dans le cache partagé pour les autres workers
+        L'état complet n'est publié qu'au premier passage et à chaque rechargement complet; entre deux,
+        seules les modifications d'un passage sont publiées sous forme de delta identifié par son curseur.
+        Un petit curseur, listant les deltas publiés depuis l'état complet, est publié à chaque passage.
+
+        Args:
+            changes (dict): problemId -> problème, ou None si supprimé
+            full (bool): Le passage a rechargé toute la fenêtre
+            mzs_changed (bool): Des MZ ont été chargées ou retirées pendant le passage
+        """
+        shared_cache = self.api_client.shared_cache
+        if shared_cache is None:
+            return
+        duration = max(self.full_sync_interval, self.poll_interval * 4)
+        items = []
+        if full or self.state_timestamp is None or len(self.deltas) >= self.MAX_DELTAS:
+            state = {'cursor': self.cursor, 'loaded_mzs': sorted(self.loaded_mzs), 'problems': self.store.export()}
+            items.append((self.shared_key, state, self.last_sync, duration))
+            self.state_timestamp = self.last_sync
+            self.deltas = []
+        elif changes or mzs_changed:
+            delta = {
+                'upserts': [problem for problem in changes.values() if problem is not None],
+                'removals': [problem_id for problem_id, problem in changes.items() if problem is None],
+                'loaded_mzs': sorted(self.loaded_mzs)
+            }
+            items.append((f"{self.shared_key}:delta:{self.cursor}", delta, self.last_sync, duration))
+            self.deltas.append(self.cursor)
+        cursor = {'cursor': self.cursor, 'state_timestamp': self.state_timestamp, 'deltas': list(self.deltas)}
+        items.append((f"{self.shared_key}:cursor", cursor, self.last_sync, duration))
+        shared_cache.set_many(items)
+
+    def _load_shared(self, max_age=None):
+        """
+        Reprend l'état publié par un autre worker s'il est plus récent que le magasin local
+        L'état complet n'est rechargé que s'il a été republié; sinon seuls les deltas pas encore
+        appliqués sont lus et reportés dans le magasin.
+
+        Args:
+            max_age (int, optional): Âge maximal (secondes) de l'état publié, sans limite si None
+        """
+        shared_cache = self.api_client.shared_cache
+        if shared_cache is None:
+            return False
+        cursor = shared_cache.get(f"{self.shared_key}:cursor")
+        if cursor is None:
+            return False
+        self.leader_seen = max(self.leader_seen or 0, cursor['timestamp'])
+        if cursor['timestamp'] <= self.last_sync or (max_age is not None and time.time() - cursor['timestamp'] >= max_age):
+            return False
+
+        published = cursor['data']
+        with self.sync_lock:
+            if cursor['timestamp'] <= self.last_sync:
+                return False
+            if published['state_timestamp'] != self.state_timestamp:
+                entry = shared_cache.get(self.shared_key)
+                if entry is None or entry['timestamp'] != published['state_timestamp']:
+                    return False
+                self.store.load(entry['data']['problems'])
+                self.loaded_mzs = set(entry['data']['loaded_mzs'])
+                self.state_timestamp = published['state_timestamp']
+                self.deltas = []
+                self.last_full_sync = max(self.last_full_sync, self.state_timestamp)
+                logger.debug(f"Magasin de problèmes repris du cache partagé ({len(self.store)} problèmes)")
+
+            applied = set(self.deltas)
+            for delta_id in published.get('deltas', []):
+                if delta_id in applied:
+                    continue
+                entry = shared_cache.get(f"{self.shared_key}:delta:{delta_id}")
+                if entry is None:
+                    # Delta expiré ou illisible: l'état complet sera rechargé à sa prochaine publication
+                    logger.warning(f"Delta {delta_id} du magasin de problèmes introuvable dans le cache partagé")
+                    self.state_timestamp = None
+                    return False
+                delta = entry['data']
+                self.store.upsert(delta['upserts'])
+                self.store.remove(delta['removals'])
+                self.loaded_mzs = set(delta['loaded_mzs'])
+                self.deltas.append(delta_id)
+
+            self.cursor = published['cursor']
+            self.last_sync = cursor['timestamp']
+        return True
+
+    def _following(self):
+        """
+        Indique si la synchronisation est laissée au leader: il détient son bail et a publié son
+        état depuis moins de leader_grace secondes (ou attend sa première publication depuis moins longtemps)
+        """
+        if self.leader_active is None or not self.leader_active():
+            self.waiting_since = None
+            return False
+        now = time.time()
+        if self.leader_seen is None and self.waiting_since is None:
+            self.waiting_since = now
+        last_seen = self.leader_seen if self.leader_seen is not None else self.waiting_since
+        if now - last_seen < self.leader_grace:
+            return True
+        logger.warning(f"Aucune publication du leader depuis {int(now - last_seen)}s: synchronisation locale des problèmes")
+        return False
+
+    @property
+    def loading(self):
+        """True tant que le magasin n'a jamais été chargé (premier chargement en cours chez le leader)"""
+        return self.cursor is None
+
+    def ensure_fresh(self, mz_names=()):
+        """
+        S'assure que le magasin couvre les MZ demandées et date de moins de poll_interval
+        Un passage déjà en cours n'est pas attendu si le magasin couvre déjà les MZ demandées:
+        les lecteurs servent l'état courant pendant la synchronisation.
+        Si le leader synchronise, seul son état publié est repris et les MZ hors périmètre lui sont
+        demandées: pendant son premier chargement, problems() ne sert rien (voir loading).
+        """
+        self.track(mz_name for mz_name in mz_names if mz_name not in self.scope())
+        missing = [mz_name for mz_name in mz_names if mz_name not in self.loaded_mzs]
+        if not missing and time.time() - self.last_sync < self.poll_interval:
+            return
+        following = self.leader_active is not None and self.leader_active()
+        loaded = self._load_shared(max_age=None if following else self.poll_interval)
+        missing = [mz_name for mz_name in mz_names if mz_name not in self.loaded_mzs]
+        if self._following():
+            extra = [mz_name for mz_name in missing if mz_name not in self.scope()]
+            if extra:
+                self._request_tracking(extra)
+            return
+        if loaded and not missing:
+            return
+        if not missing and self.cursor is not None and self.sync_lock.locked():
+            return
+        self.sync()
+
+    def problems(self, mz_names, status=None, start_from=None, active_from=None, impact=None, host=None):
+        """
+        Problèmes du magasin pour des MZ, après synchronisation si nécessaire
+
+        Args:
+            mz_names (list): MZ concernées
+            status (str, optional): "OPEN", "CLOSED" ou None pour tous
+            start_from (int, optional): Problèmes ouverts à partir de cet instant (ms)
+            active_from (int, optional): Problèmes encore actifs à partir de cet instant (ms)
+            impact (str, optional): Niveau d'impact
+            host (str, optional): Nom ou identifiant d'un hôte impacté
+
+        Returns:
+            list: Problèmes bruts, du plus récent au plus ancien, ou None tant que le magasin ne couvre
+                  pas ces MZ (premier chargement du leader en cours, ou MZ demandées au leader):
+                  l'appelant passe alors par la récupération directe
+        """
+        self.ensure_fresh(mz_names)
+        if self.loading or any(mz_name not in self.loaded_mzs for mz_name in mz_names):
+            return None
+        return self.store.query(mz_names, status=status, start_from=start_from, active_from=active_from,
+                                impact=impact, host=host)
+
+    def reset(self):
+        """Oublie le curseur: le prochain passage rechargera toute la fenêtre"""
+        with self.sync_lock:
+            self.loaded_mzs = set()
+            self.cursor = None
+            self.last_sync = 0
+            self.last_full_sync = 0
+            self.state_timestamp = None
+            self.deltas = []
+            self.leader_seen = None
+            self.waiting_since = None
+
+    def status(self):
+        """
+        Retourne l'état de la synchronisation
+
+        Returns:
+            dict: Taille du magasin, MZ suivies, curseur et dernier passage
+        """
+        return {
+            'problems': len(self.store),
+            'version': self.store.version,
+            'index': self.store.stats(),
+            'window': self.window,
+            'tracked_mzs': len(self.loaded_mzs),
+            'cursor': self.cursor,
+            'last_sync_age': round(time.time() - self.last_sync, 2) if self.last_sync else None,
+            'syncs': self.syncs,
+            'loading': self.loading,
+            'following_leader': self.leader_active is not None and self.leader_active(),
+            'last_error': self.last_error
+        }
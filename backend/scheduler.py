@@ -0,0 +1,337 @@
+"""
+Planificateur de rafraîchissement des dashboards
+Recalcule périodiquement les données de chaque ressource (problèmes, hôtes, services, résumé,
+comptages) pour toutes les Management Zones configurées, afin que les requêtes des utilisateurs
+trouvent un cache déjà chaud. Chaque ressource a son propre intervalle et une gigue aléatoire
+pour que les rafraîchissements ne partent pas tous en même temps.
+Avec plusieurs workers gunicorn, un seul worker (le leader, élu par un bail sur un fichier
+verrouillé) exécute les rafraîchissements et publie les résultats dans le cache partagé.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import logging
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou de fichier, chaque processus est son propre leader
+    fcntl = None
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.schedulers.base import STATE_PAUSED
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    """
+    Exécute à intervalle régulier les fonctions de rafraîchissement enregistrées par ressource
+    Une exécution parcourt toutes les cibles (MZ ou type de dashboard) de la ressource l'une après
+    l'autre: une cible en erreur n'interrompt pas les suivantes. Une même ressource ne s'exécute
+    jamais deux fois en parallèle; les exécutions manquées sont regroupées en une seule.
+    """
+
+    def __init__(self, jitter=30):
+        """
+        Initialise le planificateur
+
+        Args:
+            jitter (int): Gigue maximale par défaut (en secondes) appliquée à chaque déclenchement
+        """
+        self.jitter = jitter
+        self.scheduler = BackgroundScheduler(daemon=True, job_defaults={
+            'coalesce': True,
+            'max_instances': 1,
+            'misfire_grace_time': 60
+        })
+        self.resources = {}
+        self.lock = threading.Lock()
+
+    def add_resource(self, name, refresh, targets, interval, jitter=None):
+        """
+        Enregistre une ressource à rafraîchir périodiquement
+
+        Args:
+            name (str): Nom de la ressource (ex: 'hosts')
+            refresh (callable): Fonction appelée pour chaque cible, refresh(target)
+            targets (callable): Fonction retournant la liste des cibles à chaque exécution
+            interval (int): Intervalle entre deux rafraîchissements (en secondes)
+            jitter (int, optional): Gigue maximale (en secondes), celle du planificateur par défaut
+        """
+        jitter = self.jitter if jitter is None else jitter
+        with self.lock:
+            self.resources[name] = {
+                'refresh': refresh,
+                'targets': targets,
+                'interval': interval,
+                'jitter': jitter,
+                'last_run': None,
+                'last_duration': None,
+                'last_targets': 0,
+                'last_errors': 0,
+                'runs': 0
+            }
+
+        # Premier passage peu après le démarrage, décalé aléatoirement pour étaler le préchargement
+        first_run = datetime.now() + timedelta(seconds=random.uniform(1, max(jitter, 1)))
+        self.scheduler.add_job(
+            self._run,
+            IntervalTrigger(seconds=interval, jitter=jitter or None),
+            args=[name],
+            id=f"refresh-{name}",
+            name=f"refresh-{name}",
+            replace_existing=True,
+            next_run_time=first_run
+        )
+        logger.info(f"Rafraîchissement planifié pour {name}: toutes les {interval}s (gigue {jitter}s)")
+
+    def _run(self, name):
+        """
+        Rafraîchit toutes les cibles d'une ressource
+
+        Args:
+            name (str): Nom de la ressource
+        """
+        resource = self.resources.get(name)
+        if resource is None:
+            return
+
+        start_time = time.time()
+        try:
+            targets = list(resource['targets']())
+        except Exception as e:
+            logger.error(f"Impossible de déterminer les cibles à rafraîchir pour {name}: {e}")
+            return
+
+        errors = 0
+        for target in targets:
+            try:
+                resource['refresh'](target)
+            except Exception as e:
+                errors += 1
+                logger.error(f"Erreur lors du rafraîchissement planifié de {name} pour {target}: {e}")
+
+        duration = time.time() - start_time
+        with self.lock:
+            resource['last_run'] = start_time
+            resource['last_duration'] = duration
+            resource['last_targets'] = len(targets)
+            resource['last_errors'] = errors
+            resource['runs'] += 1
+        logger.info(f"Rafraîchissement planifié de {name} terminé: {len(targets)} cibles, {errors} erreurs en {duration:.2f}s")
+
+    def start(self, paused=False):
+        """
+        Démarre le planificateur (sans effet s'il tourne déjà)
+
+        Args:
+            paused (bool): Démarrer sans exécuter de rafraîchissement jusqu'à l'appel de resume()
+        """
+        if not self.scheduler.running:
+            self.scheduler.start(paused=paused)
+            logger.info(f"Planificateur de rafraîchissement démarré ({len(self.resources)} ressources{', en pause' if paused else ''})")
+
+    def pause(self):
+        """Suspend les rafraîchissements (ce worker n'est plus leader)"""
+        if self.scheduler.running:
+            self.scheduler.pause()
+            logger.info("Planificateur de rafraîchissement suspendu")
+
+    def resume(self):
+        """Reprend les rafraîchissements, avec un premier passage rapide et étalé pour chaque ressource"""
+        if not self.scheduler.running:
+            return
+        with self.lock:
+            jitters = {name: resource['jitter'] for name, resource in self.resources.items()}
+        for name, jitter in jitters.items():
+            job = self.scheduler.get_job(f"refresh-{name}")
+            if job is not None:
+                job.modify(next_run_time=datetime.now() + timedelta(seconds=random.uniform(1, max(jitter, 1))))
+        self.scheduler.resume()
+        logger.info("Planificateur de rafraîchissement repris")
+
+    def shutdown(self):
+        """Arrête le planificateur sans attendre la fin des rafraîchissements en cours"""
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+            logger.info("Planificateur de rafraîchissement arrêté")
+
+    @property
+    def running(self):
+        return self.scheduler.running
+
+    def status(self):
+        """
+        Retourne l'état des ressources planifiées
+
+        Returns:
+            dict: Par ressource, intervalle, dernière exécution et prochaine échéance
+        """
+        status = {}
+        with self.lock:
+            for name, resource in self.resources.items():
+                job = self.scheduler.get_job(f"refresh-{name}")
+                next_run = job.next_run_time if job is not None else None
+                status[name] = {
+                    'paused': self.scheduler.state == STATE_PAUSED,
+                    'interval': resource['interval'],
+                    'jitter': resource['jitter'],
+                    'runs': resource['runs'],
+                    'last_run': datetime.fromtimestamp(resource['last_run']).strftime('%Y-%m-%d %H:%M:%S') if resource['last_run'] else None,
+                    'last_duration': round(resource['last_duration'], 2) if resource['last_duration'] is not None else None,
+                    'last_targets': resource['last_targets'],
+                    'last_errors': resource['last_errors'],
+                    'next_run': next_run.strftime('%Y-%m-%d %H:%M:%S') if next_run else None
+                }
+        return status
+
+
+class LeaderElection:
+    """
+    Élection d'un leader entre les processus d'un même nœud (workers gunicorn)
+    Le leader détient un bail écrit dans un fichier partagé et le renouvelle à chaque battement;
+    le verrou fcntl ne protège que la lecture/écriture du bail. Si le leader meurt ou cesse de
+    battre, un autre processus reprend le bail dès son expiration.
+    """
+
+    def __init__(self, path, heartbeat=10, lease_duration=None, on_elected=None, on_demoted=None):
+        """
+        Initialise l'élection
+
+        Args:
+            path (str): Chemin du fichier de bail, commun à tous les workers du nœud
+            heartbeat (int): Intervalle entre deux renouvellements ou tentatives (en secondes)
+            lease_duration (int, optional): Durée de validité du bail, 3 battements par défaut
+            on_elected (callable, optional): Appelée quand ce processus devient leader
+            on_demoted (callable, optional): Appelée quand ce processus perd le bail
+        """
+        self.path = path
+        self.heartbeat = heartbeat
+        self.lease_duration = lease_duration or heartbeat * 3
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        # Identifiant unique même en cas de réutilisation d'un PID
+        self.identity = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.leader = None
+        self.leader_expires = 0
+        self.leader_since = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _update_lease(self, release=False):
+        """
+        Lit le bail sous verrou exclusif, le renouvelle ou le reprend s'il est expiré
+
+        Args:
+            release (bool): Libérer le bail s'il appartient à ce processus
+
+        Returns:
+            bool: True si ce processus détient le bail
+        """
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    lease = json.loads(f.read() or '{}')
+                except ValueError:
+                    lease = {}
+
+                now = time.time()
+                owner = lease.get('owner')
+                expired = lease.get('expires', 0) <= now
+
+                if release:
+                    if owner == self.identity:
+                        lease = {}
+                    else:
+                        return False
+                elif owner == self.identity or owner is None or expired:
+                    if owner not in (None, self.identity):
+                        logger.warning(f"Bail du leader {owner} expiré, reprise par le processus {self.identity}")
+                    lease = {'owner': self.identity, 'pid': os.getpid(), 'expires': now + self.lease_duration, 'heartbeat': now}
+                else:
+                    self.leader = owner
+                    self.leader_expires = lease.get('expires', 0)
+                    return False
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(lease))
+                f.flush()
+                self.leader = lease.get('owner')
+                self.leader_expires = lease.get('expires', 0)
+                return not release
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _set_leader(self, is_leader):
+        """Applique une transition d'état et prévient le planificateur"""
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        self.leader_since = time.time() if is_leader else None
+        callback = self.on_elected if is_leader else self.on_demoted
+        role = "élu leader" if is_leader else "n'est plus leader"
+        logger.info(f"Processus {self.identity} {role} des rafraîchissements planifiés")
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Erreur lors du changement de leader: {e}")
+
+    def _run(self):
+        """Boucle de battement: renouvelle le bail ou tente de le reprendre"""
+        while not self.stop_event.is_set():
+            try:
+                self._set_leader(self._update_lease())
+            except Exception as e:
+                # Fichier de bail inaccessible: par prudence, ne plus se considérer leader
+                logger.error(f"Erreur lors de l'élection du leader ({self.path}): {e}")
+                self._set_leader(False)
+            self.stop_event.wait(self.heartbeat)
+
+    def start(self):
+        """Démarre l'élection dans un thread dédié (leader d'office si fcntl est indisponible)"""
+        if fcntl is None:
+            logger.warning("fcntl indisponible: ce processus exécute les rafraîchissements planifiés sans élection")
+            self._set_leader(True)
+            return
+        self.thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Arrête l'élection et libère le bail pour qu'un autre processus le reprenne immédiatement"""
+        self.stop_event.set()
+        if self.is_leader and fcntl is not None:
+            try:
+                self._update_lease(release=True)
+            except Exception as e:
+                logger.error(f"Erreur lors de la libération du bail: {e}")
+        self._set_leader(False)
+
+    def has_live_leader(self):
+        """Indique si un autre processus détient un bail valide (vu au dernier battement)"""
+        return not self.is_leader and self.leader is not None and self.leader_expires > time.time()
+
+    def status(self):
+        """
+        Retourne l'état de l'élection vu par ce processus
+
+        Returns:
+            dict: Identité, rôle et leader connu
+        """
+        return {
+            'identity': self.identity,
+            'is_leader': self.is_leader,
+            'leader': self.leader,
+            'leader_since': datetime.fromtimestamp(self.leader_since).strftime('%Y-%m-%d %H:%M:%S') if self.leader_since else None
+        }
@@ -39,6 +39,19 @@ MZ_NAME=PRODSEC - AP03566 - ACESID
 
 # Configuration du planificateur
 SCHEDULER_INTERVAL_MINUTES=5
+SCHEDULER_ENABLED=True
+SCHEDULER_JITTER_SECONDS=30
+SCHEDULER_PROBLEMS_INTERVAL=120
+SCHEDULER_COUNTS_INTERVAL=900
+SCHEDULER_LOCK_PATH=/tmp/dynatrace_dashboard_scheduler.lock
+SCHEDULER_HEARTBEAT_SECONDS=10
+
+# Synchronisation incrémentale des problèmes
+PROBLEM_SYNC_ENABLED=True
+PROBLEM_SYNC_WINDOW=-60d
+PROBLEM_SYNC_INTERVAL=15
+PROBLEM_SYNC_FULL_INTERVAL=3600
+PROBLEM_SYNC_LEADER_GRACE=120
 
 # Configuration SSL
 VERIFY_SSL=False
@@ -46,8 +59,21 @@ VERIFY_SSL=False
 # Durée de cache (en secondes)
 CACHE_DURATION=300
 
+# Budget mémoire du cache par worker (en Mo)
+CACHE_MAX_MB=512
+
+# Réponses déjà sérialisées (JSON, gzip, ETag) par worker (en Mo)
+RESPONSE_CACHE_MAX_MB=128
+RESPONSE_GZIP_MIN_BYTES=1024
+
+# Cache partagé entre les workers gunicorn (fichier SQLite, vide pour désactiver)
+SHARED_CACHE_PATH=/tmp/dynatrace_dashboard_cache.sqlite
+
+# Instantané du cache longue durée pour redémarrer à chaud (vide pour désactiver)
+CACHE_SNAPSHOT_PATH=/tmp/dynatrace_dashboard_cache.snapshot
+CACHE_SNAPSHOT_INTERVAL=300
+
 # Optimisation des requêtes
-REQUEST_CHUNK_SIZE=20
 MAX_WORKERS=30
 MAX_CONNECTIONS=60
 PROBLEMS_CACHE_DURATION=60" > .env
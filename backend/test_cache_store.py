@@ -0,0 +1,192 @@
+"""
+Tests unitaires des caches de cache_store.py (mémoire, partagé SQLite, instantané sur disque)
+"""
+
+import glob
+import os
+import time
+import types
+
+import pytest
+
+import cache_store
+from cache_store import CacheSnapshot, CacheStore, SQLiteSharedCache, cache_tags, entity_tag, mz_tag, resource_tag
+
+
+@pytest.fixture
+def shared_path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+def test_shared_cache_roundtrip_and_expiry(shared_path):
+    shared = SQLiteSharedCache(shared_path)
+    now = time.time()
+    shared.set("hosts:MZ A", [{'id': 'HOST-1'}], now, duration=60)
+    shared.set("old", 1, now - 120, duration=60)
+    # Un autre worker (autre connexion au même fichier) lit la même entrée
+    assert SQLiteSharedCache(shared_path).get("hosts:MZ A")['data'] == [{'id': 'HOST-1'}]
+    assert shared.get("old") is None
+    assert shared.get("missing") is None
+
+
+def test_shared_cache_invalidations_are_journaled_for_other_workers(shared_path):
+    first = SQLiteSharedCache(shared_path)
+    second = SQLiteSharedCache(shared_path)
+    now = time.time()
+    first.set_many([("hosts:MZ A", 1, now, None), ("hosts:MZ B", 2, now, None), ("services:MZ A", 3, now, None)])
+
+    first.invalidate("MZ B")
+    first.invalidate("services:MZ A", exact=True)
+    assert second.get("hosts:MZ B") is None and second.get("services:MZ A") is None
+    assert second.get("hosts:MZ A")['data'] == 1
+    # L'émetteur a déjà appliqué ses invalidations; les autres workers les relisent une fois, dans l'ordre
+    assert first.poll_invalidations() == []
+    assert [invalidation[:2] for invalidation in second.poll_invalidations()] == [("MZ B", False), ("services:MZ A", True)]
+    assert second.poll_invalidations() == []
+
+    first.invalidate()
+    assert second.get("hosts:MZ A") is None
+    assert [invalidation[0] for invalidation in second.poll_invalidations()] == [None]
+    # Un worker démarré après coup ne rejoue pas l'historique
+    assert SQLiteSharedCache(shared_path).poll_invalidations() == []
+
+
+def test_shared_cache_cleanup_drops_expired_rows_and_old_invalidations(shared_path):
+    shared = SQLiteSharedCache(shared_path)
+    now = time.time()
+    shared.set("expired", 1, now - 600, duration=60)
+    shared.set("live", 2, now, duration=600)
+    shared.invalidate("other")
+    connection = shared._connection()
+    connection.execute("UPDATE invalidations SET created = ?", (now - 2 * shared.INVALIDATION_RETENTION,))
+
+    shared.poll_invalidations()
+    assert [row[0] for row in connection.execute("SELECT key FROM entries")] == ["live"]
+    assert connection.execute("SELECT COUNT(*) FROM invalidations").fetchone()[0] == 0
+
+
+@pytest.fixture
+def cache():
+    return CacheStore(sweep_interval=0)
+
+
+def test_cache_tags_from_key():
+    tags = cache_tags('persistent_services:entitySelector=type("SERVICE"),mzName("MZ \\"A\\"")')
+    assert resource_tag('services') in tags
+    assert mz_tag('MZ \\"A\\"') in tags
+
+    tags = cache_tags('metrics/query:entitySelector=entityId("HOST-0123456789ABCDEF")', tags=[mz_tag('MZ B')])
+    assert set(tags) == {resource_tag('metrics/query'), entity_tag('HOST-0123456789ABCDEF'), mz_tag('MZ B')}
+
+
+def test_delete_tagged_removes_only_tagged_entries(cache):
+    cache.set('hosts:MZ A', 1, tags=cache_tags('hosts:MZ A', [mz_tag('MZ A')]))
+    cache.set('services:MZ A', 2, tags=cache_tags('services:MZ A', [mz_tag('MZ A')]))
+    cache.set('hosts:MZ B', 3, tags=cache_tags('hosts:MZ B', [mz_tag('MZ B')]))
+    cache.set('untagged', 4)
+
+    assert cache.delete_tagged([mz_tag('MZ A')]) == 2
+    assert sorted(cache.keys()) == ['hosts:MZ B', 'untagged']
+    assert cache.delete_tagged([mz_tag('MZ A')]) == 0
+    assert cache.delete_tagged([resource_tag('hosts')]) == 1
+    assert list(cache.keys()) == ['untagged']
+
+
+def test_replacing_an_entry_drops_its_old_tags(cache):
+    cache.set('hosts:x', 1, tags=[mz_tag('MZ A')])
+    cache.set('hosts:x', 2, tags=[mz_tag('MZ B')])
+    assert cache.delete_tagged([mz_tag('MZ A')]) == 0
+    assert cache.delete_tagged([mz_tag('MZ B')]) == 1
+    assert len(cache) == 0
+
+
+def test_shared_cache_invalidates_tags_through_index(shared_path):
+    first = SQLiteSharedCache(shared_path)
+    second = SQLiteSharedCache(shared_path)
+    now = time.time()
+    first.set_many([
+        ("hosts:MZ A", 1, now, None, None, [mz_tag("MZ A"), resource_tag("hosts")]),
+        ("services:MZ A", 2, now, None, None, [mz_tag("MZ A"), resource_tag("services")]),
+        ("hosts:MZ B", 3, now, None, None, [mz_tag("MZ B"), resource_tag("hosts")]),
+    ])
+    assert second.get("hosts:MZ B")['tags'] == (mz_tag("MZ B"), resource_tag("hosts"))
+
+    first.invalidate_tags([mz_tag("MZ A")])
+    assert second.get("hosts:MZ A") is None and second.get("services:MZ A") is None
+    assert second.get("hosts:MZ B")['data'] == 3
+    assert second.poll_invalidations() == [(mz_tag("MZ A"), False, True)]
+
+    # Une entrée réécrite sans l'étiquette n'est plus atteinte par son invalidation
+    first.set("hosts:MZ B", 4, now, tags=[resource_tag("hosts")])
+    first.invalidate_tags([mz_tag("MZ B")])
+    assert second.get("hosts:MZ B")['data'] == 4
+
+
+def test_snapshot_reloads_lazily_with_original_ttl(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    now = time.time()
+    store = CacheStore(sweep_interval=0)
+    store.set("persistent_services:MZ A", [1], duration=7200, timestamp=now - 3600, tags=[mz_tag("MZ A")])
+    store.set("persistent_old", [2], duration=3600, timestamp=now - 3500)
+    # Durée par défaut: trop courte pour l'instantané
+    store.set("hosts:MZ A", [3])
+    assert CacheSnapshot(path).save(store) == 2
+    assert os.path.exists(f"{path}.{os.getpid()}")
+    assert glob.glob(f"{path}*.tmp") == []
+
+    # Redémarrage 200 s plus tard: rien n'est lu avant la première clé absente du cache
+    monkeypatch.setattr(cache_store, 'time', types.SimpleNamespace(time=lambda: now + 200))
+    snapshot = CacheSnapshot(path)
+    assert snapshot._pending is None
+    item = snapshot.take("persistent_services:MZ A")
+    assert item['data'] == [1] and item['timestamp'] == pytest.approx(now - 3600)
+    assert item['tags'] == [mz_tag("MZ A")]
+    # Horodatage d'origine conservé: l'entrée expirée depuis la sauvegarde n'est pas reprise
+    assert snapshot.take("persistent_old") is None
+    assert snapshot.take("hosts:MZ A") is None
+    # Une entrée n'est reprise qu'une fois
+    assert snapshot.take("persistent_services:MZ A") is None
+
+
+def test_snapshot_invalidations_apply_to_loaded_entries(tmp_path):
+    path = str(tmp_path / "snapshot")
+    store = CacheStore(sweep_interval=0)
+    for mz_name in ("MZ A", "MZ B", "MZ C"):
+        store.set(f"persistent_services:{mz_name}", [mz_name], duration=7200, tags=[mz_tag(mz_name)])
+    CacheSnapshot(path).save(store)
+
+    snapshot = CacheSnapshot(path)
+    snapshot.delete_tagged([mz_tag("MZ A")])
+    snapshot.delete_matching(lambda key: key.endswith("MZ B"))
+    assert snapshot.take("persistent_services:MZ A") is None
+    assert snapshot.take("persistent_services:MZ B") is None
+    assert snapshot.take("persistent_services:MZ C")['data'] == ["MZ C"]
+
+    snapshot = CacheSnapshot(path)
+    snapshot.clear()
+    assert snapshot.take("persistent_services:MZ C") is None
+
+
+def test_snapshot_merges_then_removes_files_of_dead_workers(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    now = time.time()
+    dead_pid, live_pid = 999999991, 999999992
+    monkeypatch.setattr(CacheSnapshot, '_process_alive', staticmethod(lambda pid: pid != dead_pid))
+
+    # Fichiers laissés par un worker arrêté et par un worker encore actif
+    for pid, data in ((dead_pid, "dead"), (live_pid, "live")):
+        store = CacheStore(sweep_interval=0)
+        store.set("persistent_services:MZ A", [data], duration=7200, timestamp=now - (60 if pid == dead_pid else 30))
+        store.set(f"persistent_services:{data}", [data], duration=7200)
+        CacheSnapshot(path).save(store)
+        os.replace(f"{path}.{os.getpid()}", f"{path}.{pid}")
+
+    snapshot = CacheSnapshot(path)
+    assert snapshot.save(CacheStore(sweep_interval=0)) == 3
+    assert not os.path.exists(f"{path}.{dead_pid}")
+    assert os.path.exists(f"{path}.{live_pid}")
+
+    # Les entrées du worker arrêté survivent dans le fichier de ce worker; la plus récente l'emporte
+    restarted = CacheSnapshot(path)
+    assert restarted.take("persistent_services:dead")['data'] == ["dead"]
+    assert restarted.take("persistent_services:MZ A")['data'] == ["live"]
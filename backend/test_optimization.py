@@ -0,0 +1,310 @@
+"""
+Tests unitaires des utilitaires de optimization.py (sans appel à Dynatrace)
+"""
+
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import quote
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from cache_store import SQLiteSharedCache, mz_tag
+from optimization import AdaptiveConcurrencyLimiter, OptimizedAPIClient, RateLimitBucket, TimeWindow, canonical_query_key, mz_problem_selector, plan_mz_selectors
+
+
+def test_limiter_decreases_on_throttling_once_per_half_window():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=2, max_limit=20, window_size=20)
+    limiter.record(0.1, status=429)
+    assert limiter.limit == 7
+    # Même rafale: pas de nouvelle réduction avant une demi-fenêtre
+    limiter.record(0.1, status=503)
+    assert limiter.limit == 7
+    for _ in range(9):
+        limiter.record(0.1, status=200)
+    limiter.record(0.1, error=True)
+    assert limiter.limit == 4
+
+    for _ in range(5):
+        for _ in range(10):
+            limiter.record(0.1, status=200)
+        limiter.record(0.1, status=500)
+    assert limiter.limit == 2
+
+
+def test_limiter_increases_additively_up_to_max():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, min_limit=2, max_limit=6, window_size=20)
+    for _ in range(10):
+        limiter.record(0.1, status=200)
+    assert limiter.limit == 4
+    for _ in range(200):
+        limiter.record(0.1, status=200)
+    assert limiter.limit == 6
+
+
+def test_limiter_decreases_when_latency_degrades():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10, min_limit=2, max_limit=20, window_size=20)
+    for _ in range(10):
+        limiter.record(0.1, status=200)
+    assert limiter.stats()['baseline_p95'] == 0.1
+    limiter.record(1.0, status=200)
+    assert limiter.limit == 7
+
+
+def test_limiter_blocks_acquire_at_limit():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=2, max_limit=2)
+    limiter.acquire()
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def worker():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release()
+    assert acquired.wait(1)
+    assert limiter.in_flight == 2
+
+
+def test_rate_limit_bucket_spends_burst_then_spaces_requests():
+    bucket = RateLimitBucket(requests_per_minute=60)
+    assert all(bucket.reserve() == pytest.approx(0, abs=0.01) for _ in range(60))
+    # Seau vide: la dette de jetons se traduit en file d'attente à 1 requête/s
+    assert bucket.reserve() == pytest.approx(1, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_rate_limit_bucket_learns_limit_from_headers():
+    bucket = RateLimitBucket()
+    assert bucket.reserve() == 0
+    # En-têtes insensibles à la casse, comme ceux d'une réponse requests
+    bucket.update_from_headers(CaseInsensitiveDict({'x-ratelimit-limit': '120', 'x-ratelimit-remaining': '1'}), status=200)
+    assert bucket.stats()['requests_per_minute'] == 120
+    assert bucket.reserve() == pytest.approx(0, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.05)
+
+
+def test_rate_limit_bucket_pauses_after_throttling():
+    bucket = RateLimitBucket()
+    bucket.update_from_headers({'Retry-After': '2'}, status=429)
+    assert bucket.reserve() == pytest.approx(2, abs=0.05)
+
+    bucket = RateLimitBucket(requests_per_minute=60)
+    reset_ms = str(int((time.time() + 3) * 1000))
+    bucket.update_from_headers({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': reset_ms}, status=200)
+    assert bucket.reserve() == pytest.approx(4, abs=0.1)
+    assert RateLimitBucket._parse_reset('5') == 5
+
+
+def test_time_window_aligns_end_on_bucket():
+    now = 1_700_000_123.4
+    window = TimeWindow(timedelta(hours=24), now=now)
+    # 24h / 288 = pas de 5 minutes
+    assert window.bucket_seconds == 300
+    assert window.to_time == 1_700_000_100_000
+    assert window.to_time - window.from_time == 24 * 3600 * 1000
+
+    # Même pas: mêmes bornes, donc même clé de cache; pas suivant: nouvelle fenêtre
+    assert TimeWindow(timedelta(hours=24), now=now + 150).key == window.key
+    assert TimeWindow(timedelta(hours=24), now=now + 300).to_time == window.to_time + 300_000
+
+
+def test_time_window_bucket_bounds():
+    assert TimeWindow(timedelta(minutes=30), now=0).bucket_seconds == TimeWindow.MIN_BUCKET_SECONDS
+    window = TimeWindow(timedelta(hours=1), bucket=timedelta(minutes=15), now=1_700_000_123)
+    assert window.bucket_seconds == 900
+    assert window.to_time % (900 * 1000) == 0
+
+
+def test_canonical_query_key_ignores_parameter_order_and_prefix():
+    key = canonical_query_key("/api/v2/metrics/query", {'resolution': 'Inf', 'from': 'now-72h', 'to': None})
+    assert key == "metrics/query:from=-72h&resolution=Inf"
+    assert key == canonical_query_key("metrics/query", {'from': '-72h', 'resolution': ' Inf '})
+
+
+def test_canonical_query_key_normalizes_values():
+    assert canonical_query_key("entities", {'fields': '+tags, +properties'}) == \
+        canonical_query_key("entities", {'fields': ['+properties', '+tags']})
+    assert canonical_query_key("problems", {'totalCount': True}) == canonical_query_key("problems", {'totalCount': 'TRUE'})
+    assert canonical_query_key("problems", {'pageSize': 500}) == "problems:pageSize=500"
+
+
+def test_canonical_query_key_normalizes_selectors_outside_quotes():
+    compact = canonical_query_key("entities", {'entitySelector': 'type("HOST"),mzName("MZ A, B")'})
+    spaced = canonical_query_key("entities", {'entitySelector': 'type("HOST") , mzName("MZ A, B")'})
+    assert compact == spaced
+    # Les espaces dans une chaîne entre guillemets font partie du nom de la MZ
+    assert compact != canonical_query_key("entities", {'entitySelector': 'type("HOST"),mzName("MZ A,B")'})
+    # Les autres paramètres ne sont pas réécrits
+    assert canonical_query_key("entities", {'name': 'a , b'}) == "entities:name=a , b"
+
+
+def test_plan_mz_selectors_groups_and_deduplicates():
+    assert plan_mz_selectors(["MZ A", "MZ B", "MZ A"]) == ['managementZones("MZ A","MZ B")']
+    assert mz_problem_selector(['MZ "X"']) == 'managementZones("MZ \\"X\\"")'
+    assert plan_mz_selectors([]) == []
+
+
+def test_plan_mz_selectors_splits_on_encoded_length():
+    mz_names = [f"PRODSEC - AP{i:05d} - Application" for i in range(40)]
+    max_length = 300
+    selectors = plan_mz_selectors(mz_names, max_length=max_length)
+    assert len(selectors) > 1
+    assert all(len(quote(selector, safe='')) <= max_length for selector in selectors)
+    # Aucune MZ perdue ni dupliquée, ordre conservé
+    names = [name for selector in selectors for name in selector[len('managementZones("'):-len('")')].split('","')]
+    assert names == mz_names
+
+
+def test_plan_mz_selectors_keeps_oversized_names_alone():
+    long_name = "X" * 500
+    assert plan_mz_selectors(["MZ A", long_name, "MZ B"], max_length=100) == [
+        'managementZones("MZ A")', f'managementZones("{long_name}")', 'managementZones("MZ B")']
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Deux clients, comme deux workers gunicorn partageant le même fichier SQLite"""
+    path = str(tmp_path / "shared.db")
+    clients = [OptimizedAPIClient("https://dynatrace.invalid", "token", shared_cache=SQLiteSharedCache(path))
+               for _ in range(2)]
+    yield clients
+    for api_client in clients:
+        api_client.close()
+
+
+def poll_elapsed(api_client):
+    """Simule l'écoulement de l'intervalle (1 s) de relecture du journal d'invalidations"""
+    api_client._invalidation_check = 0
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def test_shared_entries_and_invalidations_reach_other_worker(workers):
+    first, second = workers
+    first.set_cache("hosts:MZ A", [1], tags=[mz_tag("MZ A")], shared=True)
+    first.set_cache("services:MZ B", [2], shared=True)
+    assert second.get_cached("hosts:MZ A") == [1]
+    assert second.get_cached("services:MZ B") == [2]
+
+    first.invalidate_tags(mz_tag("MZ A"))
+    # La copie mémoire de l'autre worker n'est purgée qu'à la relecture du journal
+    assert second.cache.get("hosts:MZ A") is not None
+    poll_elapsed(second)
+    assert second.get_cached("hosts:MZ A") is None
+    assert second.get_cached("services:MZ B") == [2]
+
+    first.clear_cache()
+    poll_elapsed(second)
+    assert second.get_cached("services:MZ B") is None
+
+
+def test_query_pages_and_entities_stay_out_of_shared_cache(workers):
+    first, second = workers
+    pages = {
+        None: {'entities': [{'entityId': 'HOST-1', 'displayName': 'a'}], 'nextPageKey': 'k2'},
+        'k2': {'entities': [{'entityId': 'HOST-2', 'displayName': 'b'}]}
+    }
+    first._request_with_semaphore = lambda method, url, params=None, **kwargs: FakeResponse(pages[params.get('nextPageKey')])
+
+    entities = first.load_entities("HOST", mz_name="MZ A")
+    assert [entity['entityId'] for entity in entities] == ['HOST-1', 'HOST-2']
+    keys = list(first.cache.keys())
+    assert any(':page:' in key for key in keys)
+    assert any('HOST-1' in key for key in keys)
+    # Pages de requêtes et entités restent propres au worker
+    assert all(second.shared_cache.get(key) is None for key in keys)
+
+
+@pytest.fixture
+def client():
+    api_client = OptimizedAPIClient("https://dynatrace.invalid", "token")
+    yield api_client
+    api_client.close()
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} Client Error", response=response)
+
+
+class PagedServer:
+    """Simule query_api: pages chaînées par nextPageKey, clés refusées (400) après un changement de génération"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.generation = 1
+        self.calls = []
+
+    def query_api(self, endpoint, params=None, use_cache=True, cache_key=None):
+        self.calls.append(params.get('nextPageKey'))
+        if 'nextPageKey' in params:
+            generation, index = map(int, params['nextPageKey'].split(':'))
+            if generation != self.generation:
+                raise http_error(400)
+        else:
+            index = 0
+        page = {'problems': self.pages[index]}
+        if index + 1 < len(self.pages):
+            page['nextPageKey'] = f"{self.generation}:{index + 1}"
+        return page
+
+
+def test_paginate_restarts_uncached_when_later_page_is_refused(client):
+    server = PagedServer([[1, 2], [3, 4]])
+    client.query_api = server.query_api
+    params = {'from': 'now-2h', 'pageSize': 2}
+    assert list(client.paginate_items("problems", params, "problems")) == [1, 2, 3, 4]
+
+    # La page 2 a été évincée du cache et son nextPageKey a expiré côté serveur
+    for key in [key for key, _ in client.cache.items() if ':page:' in key]:
+        client.cache.pop(key)
+    server.pages = [[1, 2], [5, 6]]
+    server.generation = 2
+    server.calls.clear()
+    items = list(client.paginate_items("problems", params, "problems", prefetch=False))
+
+    # Parcours repris depuis une première page non cachée, sans doublon des pages déjà lues
+    assert items == [1, 2, 5, 6]
+    assert server.calls == ['1:1', None, '2:1']
+
+
+def test_paginate_raises_client_errors_without_cached_pages(client):
+    def query_api(endpoint, params=None, use_cache=True, cache_key=None):
+        raise http_error(400)
+
+    client.query_api = query_api
+    with pytest.raises(requests.HTTPError):
+        list(client.paginate_items("problems", {'from': 'now-2h'}, "problems", use_cache=False))
+
+
+def test_problem_queries_shard_only_closed_problems(client):
+    now_ms = 1_700_000_000_000
+    time_from = now_ms - 3 * 86400 * 1000
+    windows = client._problem_windows(time_from, now_ms)
+    assert len(windows) == 3
+    assert windows[0][0] == time_from and windows[-1][1] == now_ms
+    assert all(end + 1 == start for (_, end), (start, _) in zip(windows, windows[1:]))
+
+    # Les ouverts recoupent toutes les tranches: une seule requête sur toute la période
+    queries = client._problem_queries(time_from, now_ms)
+    assert queries[0] == ('OPEN', time_from, now_ms)
+    assert queries[1:] == [('CLOSED', start, end) for start, end in windows]
+    assert client._problem_queries(time_from, now_ms, status="OPEN") == [('OPEN', time_from, now_ms)]
+    assert len(client._problem_queries(time_from, now_ms, status="CLOSED")) == 3
+
+    # Période courte: une seule requête, statut transmis tel quel
+    assert client._problem_queries(now_ms - 3600 * 1000, now_ms, status="OPEN,CLOSED") == [
+        ("OPEN,CLOSED", now_ms - 3600 * 1000, now_ms)]
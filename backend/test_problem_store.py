@@ -0,0 +1,290 @@
+"""
+Tests unitaires du magasin de problèmes et de sa synchronisation (problem_store.py)
+"""
+
+import copy
+import time
+import types
+
+import pytest
+
+import problem_store
+from cache_store import SQLiteSharedCache
+from problem_store import ProblemStore, ProblemSyncEngine, is_open, problem_mzs, relative_time_ms
+
+
+HOUR_MS = 3600 * 1000
+NOW_MS = 1_700_000_000_000
+
+
+def make_problem(problem_id, mz_name, start, end=-1, impact='INFRASTRUCTURE', host=None, entity_mz=None):
+    impacted = []
+    if host:
+        impacted.append({'entityId': {'id': f"HOST-{problem_id}", 'type': 'HOST'}, 'name': host})
+    if entity_mz:
+        impacted.append({'entityId': {'id': 'SERVICE-1', 'type': 'SERVICE'}, 'name': 'svc',
+                         'managementZones': [{'name': entity_mz}]})
+    return {
+        'problemId': problem_id,
+        'status': 'OPEN' if end <= 0 else 'CLOSED',
+        'startTime': start,
+        'endTime': end,
+        'impactLevel': impact,
+        'managementZones': [{'name': mz_name}],
+        'impactedEntities': impacted
+    }
+
+
+def ids(problems):
+    return [problem['problemId'] for problem in problems]
+
+
+class FakeDynatrace:
+    """Client API simulé: problèmes servis depuis un dictionnaire partagé par tous les workers"""
+
+    def __init__(self, problems, shared_cache):
+        self.problems = problems
+        self.shared_cache = shared_cache
+        self.calls = []
+
+    def fetch_problems(self, from_ms, mz_names=None, to_ms=None, status=None):
+        self.calls.append(('fetch', tuple(mz_names), from_ms))
+        return [copy.deepcopy(problem) for problem in self.problems.values()
+                if problem_mzs(problem) & set(mz_names) and (is_open(problem) or problem['endTime'] >= from_ms)]
+
+    def get_problem_details(self, problem_ids):
+        self.calls.append(('details', tuple(problem_ids)))
+        return {problem_id: copy.deepcopy(self.problems.get(problem_id)) for problem_id in problem_ids}
+
+
+@pytest.fixture
+def server():
+    now_ms = int(time.time() * 1000)
+    problems = [
+        make_problem('P1', 'MZ A', now_ms - HOUR_MS),
+        make_problem('P2', 'MZ A', now_ms - 3 * HOUR_MS, now_ms - 2 * HOUR_MS),
+        make_problem('P3', 'MZ B', now_ms - 2 * HOUR_MS),
+    ]
+    return {problem['problemId']: problem for problem in problems}
+
+
+@pytest.fixture
+def shared_path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+def make_engine(server, shared_path, **kwargs):
+    """Moteur d'un worker: son propre client et sa propre connexion au cache partagé"""
+    return ProblemSyncEngine(FakeDynatrace(server, SQLiteSharedCache(shared_path)), lambda: ['MZ A', 'MZ B'], **kwargs)
+
+
+def test_relative_time_ms():
+    assert relative_time_ms('-72h', NOW_MS) == NOW_MS - 72 * HOUR_MS
+    assert relative_time_ms('now-2w', NOW_MS) == NOW_MS - 14 * 24 * HOUR_MS
+    assert relative_time_ms(str(NOW_MS)) == NOW_MS
+    assert relative_time_ms('yesterday') is None
+    assert relative_time_ms(None) is None
+
+
+def test_leader_sync_reaches_follower(server, shared_path):
+    leader = make_engine(server, shared_path)
+    follower = make_engine(server, shared_path)
+    assert leader.sync()
+    assert [call[:2] for call in leader.api_client.calls] == [('fetch', ('MZ A', 'MZ B'))]
+
+    assert ids(follower.problems(['MZ A'])) == ['P1', 'P2']
+    assert ids(follower.problems(['MZ B'], status='OPEN')) == ['P3']
+    assert follower.api_client.calls == []
+
+
+def test_reconcile_drops_vanished_open_problem(server, shared_path):
+    engine = make_engine(server, shared_path)
+    engine.sync()
+    # P1 a disparu de Dynatrace (fusionné ou supprimé) sans jamais avoir été fermé
+    del server['P1']
+    engine.api_client.calls.clear()
+    engine.sync()
+    assert ('details', ('P1',)) in engine.api_client.calls
+    assert ids(engine.store.query(['MZ A'])) == ['P2']
+    assert ids(engine.store.query(['MZ B'])) == ['P3']
+
+
+@pytest.fixture
+def store():
+    store = ProblemStore()
+    store.upsert([
+        make_problem('P1', 'MZ A', NOW_MS - 1 * HOUR_MS, host='Web-01'),
+        make_problem('P2', 'MZ A', NOW_MS - 5 * HOUR_MS, NOW_MS - 4 * HOUR_MS, impact='SERVICES'),
+        make_problem('P3', 'MZ B', NOW_MS - 30 * HOUR_MS, NOW_MS - 29 * HOUR_MS, host='web-02'),
+        make_problem('P4', 'MZ C', NOW_MS - 2 * HOUR_MS, entity_mz='MZ B'),
+    ])
+    return store
+
+
+def test_query_intersects_indexes_newest_first(store):
+    assert ids(store.query()) == ['P1', 'P4', 'P2', 'P3']
+    assert ids(store.query(mz_names=['MZ A'])) == ['P1', 'P2']
+    # Une MZ portée par une entité impactée suffit
+    assert ids(store.query(mz_names=['MZ B'])) == ['P4', 'P3']
+    assert ids(store.query(mz_names=['MZ A', 'MZ B'], status='OPEN')) == ['P1', 'P4']
+    assert ids(store.query(mz_names=['MZ A'], status='CLOSED', impact='SERVICES')) == ['P2']
+    assert store.query(mz_names=[]) == []
+    assert store.query(mz_names=['MZ Z']) == []
+
+
+def test_query_host_is_case_insensitive(store):
+    assert ids(store.query(host='WEB-01')) == ['P1']
+    assert ids(store.query(host='host-p3')) == ['P3']
+    assert store.query(host='web-03') == []
+
+
+def test_query_time_bounds_are_exact_inside_a_bucket(store):
+    # start_from tombe au milieu de la tranche horaire de P2: seul l'horodatage exact compte
+    assert ids(store.query(start_from=NOW_MS - 5 * HOUR_MS)) == ['P1', 'P4', 'P2']
+    assert ids(store.query(start_from=NOW_MS - 5 * HOUR_MS + 1)) == ['P1', 'P4']
+    # active_from: ouverts, plus les fermés terminés après l'instant
+    assert ids(store.query(active_from=NOW_MS - 4 * HOUR_MS)) == ['P1', 'P4', 'P2']
+    assert ids(store.query(active_from=NOW_MS - 4 * HOUR_MS + 1)) == ['P1', 'P4']
+
+
+def test_upsert_reindexes_changed_problems(store):
+    version = store.version
+    changes = {}
+    assert store.upsert([make_problem('P1', 'MZ A', NOW_MS - 1 * HOUR_MS, host='Web-01')], changes) == (0, 0)
+    assert store.version == version and changes == {}
+
+    closed = make_problem('P1', 'MZ B', NOW_MS - 1 * HOUR_MS, NOW_MS)
+    assert store.upsert([closed], changes) == (0, 1)
+    assert changes == {'P1': closed}
+    assert store.version == version + 1
+    assert ids(store.query(mz_names=['MZ A'])) == ['P2']
+    assert ids(store.query(status='OPEN')) == ['P4']
+    assert store.query(host='web-01') == []
+
+
+def test_prune_removes_only_problems_closed_before(store):
+    changes = {}
+    assert store.prune(NOW_MS - 4 * HOUR_MS, changes) == 1
+    assert changes == {'P3': None}
+    assert ids(store.query()) == ['P1', 'P4', 'P2']
+    assert store.stats()['hosts'] == 2
+
+    assert store.prune(NOW_MS) == 1
+    assert ids(store.query()) == ['P1', 'P4']
+    assert store.remove(['P1', 'missing']) == 1
+    assert len(store) == 1
+
+
+def test_follower_leaves_sync_to_live_leader(server, shared_path):
+    leader = make_engine(server, shared_path)
+    follower = make_engine(server, shared_path, leader_active=lambda: True, leader_grace=60)
+    follower.problems(['MZ A'])
+    # Premier chargement du leader en cours: aucun appel à Dynatrace, magasin signalé en chargement
+    assert follower.api_client.calls == []
+    assert follower.loading
+
+    leader.sync()
+    assert ids(follower.problems(['MZ A'])) == ['P1', 'P2']
+    assert follower.api_client.calls == []
+    assert not follower.loading
+
+
+def test_follower_requests_untracked_mz_from_leader(server, shared_path):
+    server['P4'] = make_problem('P4', 'MZ X', int(time.time() * 1000) - HOUR_MS)
+    leader = make_engine(server, shared_path)
+    follower = make_engine(server, shared_path, leader_active=lambda: True, leader_grace=60)
+    leader.sync()
+    follower.problems(['MZ X'])
+    assert follower.api_client.calls == []
+
+    leader.sync()
+    assert 'MZ X' in leader.loaded_mzs
+    assert ids(follower.problems(['MZ X'])) == ['P4']
+    assert follower.api_client.calls == []
+
+
+def test_follower_syncs_itself_without_live_leader(server, shared_path):
+    follower = make_engine(server, shared_path, leader_active=lambda: True, leader_grace=60)
+    follower.problems(['MZ A'])
+    assert follower.api_client.calls == []
+    # Leader silencieux au-delà du délai de grâce
+    follower.waiting_since -= 61
+    assert ids(follower.problems(['MZ A'])) == ['P1', 'P2']
+    assert follower.api_client.calls
+
+    # Aucun bail détenu par un autre worker: synchronisation locale immédiate
+    alone = make_engine(server, shared_path + ".alone", leader_active=lambda: False)
+    assert ids(alone.problems(['MZ B'])) == ['P3']
+    assert alone.api_client.calls
+
+
+def test_follower_applies_deltas_without_reloading_state(server, shared_path, monkeypatch):
+    leader = make_engine(server, shared_path)
+    follower = make_engine(server, shared_path)
+    leader.sync()
+    assert follower._load_shared()
+    reloads = []
+    monkeypatch.setattr(follower.store, 'load', reloads.append)
+
+    server['P4'] = make_problem('P4', 'MZ B', int(time.time() * 1000))
+    del server['P1']
+    leader.sync()
+    assert len(leader.deltas) == 1
+    assert follower._load_shared()
+    # Ajout et suppression reportés par le delta, sans relire l'état complet
+    assert reloads == []
+    assert follower.deltas == leader.deltas
+    assert ids(follower.store.query()) == ids(leader.store.query()) == ['P4', 'P3', 'P2']
+    assert follower.api_client.calls == []
+
+
+def test_missing_delta_forces_full_reload(server, shared_path):
+    leader = make_engine(server, shared_path)
+    follower = make_engine(server, shared_path)
+    leader.sync()
+    assert follower._load_shared()
+    for problem_id in ('P4', 'P5'):
+        server[problem_id] = make_problem(problem_id, 'MZ B', int(time.time() * 1000))
+        leader.sync()
+
+    SQLiteSharedCache(shared_path).invalidate(f"{leader.shared_key}:delta:{leader.deltas[0]}", exact=True)
+    assert not follower._load_shared()
+    assert follower.state_timestamp is None
+    assert 'P4' not in ids(follower.store.query())
+
+    # L'état complet suivant est rechargé tel quel
+    leader.sync(full=True)
+    assert follower._load_shared()
+    assert follower.deltas == []
+    assert ids(follower.store.query()) == ids(leader.store.query())
+
+
+def test_follower_serves_nothing_during_leader_first_load(server, shared_path):
+    leader = make_engine(server, shared_path)
+    follower = make_engine(server, shared_path, leader_active=lambda: True, leader_grace=60)
+    # Rien de publié: pas de liste vide servie comme si aucun problème n'existait
+    assert follower.problems(['MZ A']) is None
+    assert follower.loading
+    assert follower.api_client.calls == []
+
+    leader.sync()
+    assert ids(follower.problems(['MZ A'], status='OPEN')) == ['P1']
+    # MZ hors périmètre demandée au leader: pas servie tant qu'il ne l'a pas chargée
+    assert follower.problems(['MZ X']) is None
+    assert follower.api_client.calls == []
+
+
+def test_covers_uses_a_single_clock_reading(server, shared_path, monkeypatch):
+    engine = make_engine(server, shared_path)
+    now = [1_700_000_000.0]
+
+    def clock():
+        # L'horloge avance d'une milliseconde à chaque lecture
+        now[0] += 0.001
+        return now[0]
+
+    monkeypatch.setattr(problem_store, 'time', types.SimpleNamespace(time=clock))
+    assert all(engine.covers('-60d') for _ in range(100))
+    assert engine.covers('now-30d')
+    assert not engine.covers('-61d')
+    assert not engine.covers('yesterday')
@@ -4,7 +4,6 @@ Script de test simple pour récupérer les problèmes depuis l'API Dynatrace
 avec affichage détaillé des requêtes et des réponses.
 """
 
-import requests
 import datetime
 from datetime import timedelta
 import json
@@ -12,10 +11,12 @@ import time
 import os
 from dotenv import load_dotenv
 
+from optimization import OptimizedAPIClient
+
 # Charger les variables d'environnement
 load_dotenv()
 
-def test_get_problems(management_zone_name=None, time_from="now-72h", status="OPEN,CLOSED"):
+def test_get_problems(management_zone_name=None, time_from="now-72h", status="OPEN,CLOSED", api_client=None):
     """
     Test de récupération des problèmes avec logging détaillé
     
@@ -23,6 +24,7 @@ def test_get_problems(management_zone_name=None, time_from="now-72h", status="OP
         management_zone_name (str, optional): Nom de la Management Zone pour filtrer les problèmes.
         time_from (str, optional): Point de départ temporel (ex: "now-72h"). 
         status (str, optional): Statut des problèmes à récupérer ("OPEN", "CLOSED", ou "OPEN,CLOSED").
+        api_client (OptimizedAPIClient, optional): Client à réutiliser (sinon créé depuis le .env).
     """
     # Récupérer les informations d'API depuis les variables d'environnement
     api_url = os.environ.get('DT_ENV_URL')
@@ -42,15 +44,9 @@ def test_get_problems(management_zone_name=None, time_from="now-72h", status="OP
         print("ERREUR: URL API ou Token manquant. Vérifiez votre fichier .env")
         return
     
-    # Construction des headers pour l'API Dynatrace
-    headers = {
-        'Authorization': f'Api-Token {api_token}',
-        'Accept': 'application/json; charset=utf-8'
-    }
-    
-    # S'assurer que l'URL de base n'a pas de / final
-    api_url = api_url.rstrip('/')
-    problems_url = f"{api_url}/api/v2/problems"
+    # Réutiliser le client de l'application si fourni: même session, cache et limites de débit
+    if api_client is None:
+        api_client = OptimizedAPIClient(env_url=api_url.rstrip('/'), api_token=api_token, verify_ssl=verify_ssl)
     
     all_problems = []
     
@@ -61,7 +57,7 @@ def test_get_problems(management_zone_name=None, time_from="now-72h", status="OP
         problem_selector = f'managementZones("{escaped_mz_name}")'
         print(f"Sélecteur de problèmes: '{problem_selector}'")
     
-    # Paramètres initiaux pour la première requête
+    # Paramètres de la première requête (les suivantes n'utilisent que nextPageKey)
     current_params = {
         'from': time_from,
         'status': status,
@@ -72,86 +68,26 @@ def test_get_problems(management_zone_name=None, time_from="now-72h", status="OP
     if problem_selector:
         current_params['problemSelector'] = problem_selector
     
-    page_num = 1
     print(f"Début de la récupération des problèmes pour timeframe: {time_from}, status: {status}" + 
           (f", MZ: '{management_zone_name}'" if management_zone_name else ""))
-    
-    while True:
-        try:
-            if 'nextPageKey' in current_params:
-                print(f"Récupération de la page {page_num} avec nextPageKey: {current_params['nextPageKey'][:20]}...")
-            else:
-                print(f"Récupération de la page {page_num} avec les paramètres: {current_params}")
-            
-            # Générer l'URL complète pour affichage de debug
-            req = requests.Request('GET', problems_url, params=current_params)
-            prepared_req = req.prepare()
-            print(f"URL complète: {prepared_req.url}")
-            print(f"Headers: {prepared_req.headers}")
-            
-            # Effectuer la requête avec un timeout plus long (60 secondes)
-            start_time = time.time()
-            response = requests.get(
-                problems_url, 
-                headers=headers, 
-                params=current_params, 
-                verify=verify_ssl,
-                timeout=60
-            )
-            request_time = time.time() - start_time
-            print(f"Temps de requête: {request_time:.2f} secondes")
-            print(f"Status code: {response.status_code}")
-            
-            # Vérifier pour les problèmes
-            if response.status_code != 200:
-                print(f"ERREUR HTTP: {response.status_code}")
-                print(f"Réponse: {response.text}")
-                break
-                
-            response.raise_for_status()
-            
-            data = response.json()
-            problems_on_page = data.get('problems', [])
-            all_problems.extend(problems_on_page)
-            
-            print(f"Page {page_num}: {len(problems_on_page)} problèmes récupérés. Total jusqu'à présent: {len(all_problems)}.")
-            
-            # Si la page est vide, sortir malgré nextPageKey (sécurité)
-            if len(problems_on_page) == 0:
-                print("Page vide reçue. Arrêt de la pagination.")
-                break
-                
-            next_page_key = data.get("nextPageKey")
-            if next_page_key:
-                # Pour les pages suivantes, seuls nextPageKey et pageSize sont nécessaires
-                current_params = {'nextPageKey': next_page_key, 'pageSize': 500}
-                page_num += 1
-                # Petite pause pour ne pas surcharger l'API
-                time.sleep(1)
-            else:
-                # Plus de pages à récupérer
-                break
-                
-        except requests.exceptions.HTTPError as http_err:
-            print(f"Erreur HTTP lors de la récupération des problèmes (page {page_num}): {http_err}")
-            print(f"Réponse du serveur: {response.text if response and hasattr(response, 'text') else 'Pas de réponse'}")
-            break
-        except requests.exceptions.Timeout as timeout_err:
-            print(f"Timeout lors de la requête (page {page_num}): {timeout_err}")
-            break
-        except requests.exceptions.RequestException as req_err:
-            print(f"Erreur de requête générique (page {page_num}): {req_err}")
-            break
-        except json.JSONDecodeError as json_err:
-            print(f"Erreur de décodage JSON (page {page_num}): {json_err}")
-            print(f"Réponse brute reçue: {response.text if response and hasattr(response, 'text') else 'Pas de réponse'}")
-            break
-        except Exception as e:
-            print(f"Erreur inattendue: {e}")
-            import traceback
-            print(traceback.format_exc())
+    print(f"Paramètres de la première page: {current_params}")
+    
+    # Le paginateur du client gère nextPageKey, les nouvelles tentatives et le préchargement
+    # de la page suivante; une page en échec lève une exception au lieu de tronquer le résultat
+    start_time = time.time()
+    for page_num, page in enumerate(api_client.paginate("problems", current_params), start=1):
+        problems_on_page = page.get('problems', [])
+        all_problems.extend(problems_on_page)
+        
+        print(f"Page {page_num}: {len(problems_on_page)} problèmes récupérés. Total jusqu'à présent: {len(all_problems)}.")
+        
+        # Si la page est vide, sortir malgré nextPageKey (sécurité)
+        if len(problems_on_page) == 0:
+            print("Page vide reçue. Arrêt de la pagination.")
             break
     
+    print(f"Temps de récupération: {time.time() - start_time:.2f} secondes")
+    
     print(f"\nRécupération terminée. Nombre total de problèmes: {len(all_problems)}")
     
     if all_problems: